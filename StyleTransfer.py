@@ -12,12 +12,25 @@ tf.disable_v2_behavior()
 import numpy as np
 import cv2
 import os
+import sys
 import time
 import argparse
+import logging
+import scipy.optimize
 
 import distance_transform
 import utility
 import model
+import target_cache
+import thread_tuning
+import checkpoint
+import result_cache
+import stage_timing
+import warm_start
+import snapshot_writer
+import progress
+from snapshot_writer import SnapshotWriter
+from early_stopping import EarlyStopping
 
 ###############################################################################
 # Constants for the image input and output.
@@ -48,235 +61,993 @@ result_invert = content_invert
 
 # path to weights of VGG-19 model
 VGG_MODEL = "imagenet-vgg-verydeep-19.mat"
-# The mean to subtract from the input to the VGG model. 
+# conv-only weights written by convert_vgg_weights.py, used instead of VGG_MODEL when present
+VGG_CONV_WEIGHTS = "imagenet-vgg-verydeep-19-conv"
+# The mean to subtract from the input to the VGG model.
 MEAN_VALUES = np.array([123.68, 116.779, 103.939]).reshape((1,1,1,3))
 
+COLOR_CHANNELS = 3
+
+# Cache of style gram matrices, keyed by the style image contents, size, layers and inversion.
+STYLE_CACHE_DIR = "cache/style_grams"
+STYLE_CACHE_MB = 512
+# Cache of content features, distance templates and shape targets, keyed the same way.
+CONTENT_CACHE_DIR = "cache/content_targets"
+CONTENT_CACHE_MB = 1024
+# Final images of jobs, keyed by the images and all the arguments that change the result.
+RESULT_CACHE_DIR = "cache/results"
+RESULT_CACHE_MB = 256
+
+# Types the VGG weights and layers can be computed in, see --precision.
+PRECISIONS = {'float32': tf.float32, 'bfloat16': tf.bfloat16, 'float16': tf.float16}
+
+# Losses fetched from the graph on every iteration.
+LOSS_NAMES = ('total_loss', 'content_loss', 'style_loss', 'shape_loss')
+
+# Style layers to use, in the order of the w1..w5 weights.
+STYLE_LAYERS = ['conv1_2', 'conv2_2', 'conv3_2', 'conv4_2', 'conv5_2']
+# Content layers to use.
+CONTENT_LAYERS = ['conv4_2']
+
+def layer_list(value):
+    """
+    Parses a comma separated list of VGG layer names, for the --style_layers
+    and --content_layers arguments.
+    """
+    layers = [layer_name.strip() for layer_name in value.split(',') if layer_name.strip()]
+    for layer_name in layers:
+        if layer_name not in model.VGG_LAYERS:
+            raise argparse.ArgumentTypeError("unknown VGG layer %r" % layer_name)
+    if not layers:
+        raise argparse.ArgumentTypeError("no layers given")
+    return layers
+
 parser = argparse.ArgumentParser(description='A Neural Algorithm of Artistic Style')
 parser.add_argument('--w1', '-w1',type=float, default='1',help='w1')
 parser.add_argument('--w2', '-w2',type=float, default='1',help='w2')
 parser.add_argument('--w3', '-w3',type=float, default='1',help='w3')
 parser.add_argument('--w4', '-w4',type=float, default='1',help='w4')
 parser.add_argument('--w5', '-w5',type=float, default='1',help='w5')
-parser.add_argument("--IMAGE_WIDTH", "-width",type=int, default = 300, help = "width & height of image")
-parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, default = content_image_path, help = "Path to content image")
-parser.add_argument("--STYLE_IMAGE", "-STYLE_IMAGE", type=str, default = style_image_path, help = "Path to style image")
+parser.add_argument("--IMAGE_WIDTH", "-width",type=int, default = 300, help = "width of image")
+parser.add_argument("--IMAGE_HEIGHT", "-height",type=int, default = 0, help = "height of image, 0 for the width, or see --keep_aspect")
+parser.add_argument("--keep_aspect", help="without --IMAGE_HEIGHT, use the height that keeps the aspect ratio of the content image", action="store_true")
+parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, default = content_image_path, help = "Path to content image, in input/ unless absolute")
+parser.add_argument("--STYLE_IMAGE", "-STYLE_IMAGE", type=str, default = style_image_path, help = "Path to style image, in input/ unless absolute")
 parser.add_argument("--GPU", "-GPU", help="Use GPU", action="store_true")
 
 parser.add_argument("--alpha",  "-alpha",type=float,  default="0.001",   help="alpha")
 parser.add_argument("--beta",   "-beta", type=float,  default="0.8",     help="beta")
 parser.add_argument("--gamma",  "-gamma",type=float,  default="0.001",    help="gamma")
 parser.add_argument("--epoch",  "-epoch",type=int, default=5000, help="number of epochs to run" )
-args = parser.parse_args()
+parser.add_argument("--style_layers", type=layer_list, default=STYLE_LAYERS,
+                    help="comma separated VGG layers for the style loss, weighted by w1..w5 in order, e.g. conv1_2,conv2_2,conv3_2")
+parser.add_argument("--content_layers", type=layer_list, default=CONTENT_LAYERS,
+                    help="comma separated VGG layers for the content loss")
+parser.add_argument("--style_cache", type=str, default=STYLE_CACHE_DIR, help="folder for cached style gram matrices")
+parser.add_argument("--style_cache_mb", type=int, default=STYLE_CACHE_MB, help="size limit of the style cache in MB")
+parser.add_argument("--no_style_cache", help="always compute the style gram matrices", action="store_true")
+parser.add_argument("--optimizer", type=str, default="adam", choices=["adam", "lbfgs"],
+                    help="adam, or lbfgs to use scipy's L-BFGS-B, which usually needs far fewer iterations")
+parser.add_argument("--stop_plateau", type=float, default=0,
+                    help="stop when the loss improves by less than this fraction over --stop_window iterations, "
+                         "e.g. 0.001, 0 to turn off")
+parser.add_argument("--stop_window", type=int, default=100, help="iterations the stopping conditions are measured over")
+parser.add_argument("--stop_pixel_delta", type=float, default=0,
+                    help="stop when pixels change by less than this per iteration on average, 0 to turn off")
+parser.add_argument("--time_budget", type=float, default=0, help="stop after this many seconds, 0 to turn off")
+parser.add_argument("--content_cache", type=str, default=CONTENT_CACHE_DIR, help="folder for cached content targets")
+parser.add_argument("--content_cache_mb", type=int, default=CONTENT_CACHE_MB, help="size limit of the content cache in MB")
+parser.add_argument("--no_content_cache", help="always compute the content targets", action="store_true")
+parser.add_argument("--result_cache", type=str, default=RESULT_CACHE_DIR, help="folder for the final images of jobs, see result_cache.py")
+parser.add_argument("--result_cache_mb", type=int, default=RESULT_CACHE_MB, help="size limit of the result cache in MB")
+parser.add_argument("--no_result_cache", help="always run the job, even if the same job ran before", action="store_true")
+parser.add_argument("--no_warm_start", help="start from the content image even if a job on the same images ran before, see warm_start.py", action="store_true")
+parser.add_argument("--pyramid", type=int, default=1,
+                    help="optimize at this many sizes, each half the next, ending at the image size; 1 turns it off")
+parser.add_argument("--pyramid_epoch", type=int, default=500,
+                    help="number of iterations at each size before the last, which runs epoch iterations")
+parser.add_argument("--tile", type=int, default=0,
+                    help="optimize the image in overlapping tiles of this many px, for print sizes that don't fit in memory, see tiled.py; 0 turns it off")
+parser.add_argument("--tile_overlap", type=int, default=64, help="least overlap of the tiles in px, over which they are blended")
+parser.add_argument("--tile_processes", type=int, default=0, help="tiles optimized at once, each in its own process; 0 for one per CPU")
+parser.add_argument("--engine", type=str, default="v1", choices=["v1", "tf2"],
+                    help="v1 runs a TF1 graph in a session; tf2 runs each iteration as one XLA compiled tf.function, see tf2_engine.py")
+parser.add_argument("--no_xla", help="with --engine tf2, run the tf.function without XLA", action="store_true")
+parser.add_argument("--precision", type=str, default="float32", choices=sorted(PRECISIONS),
+                    help="type of the VGG weights and layers; bfloat16 or float16 use half the memory bandwidth, the losses stay float32")
+parser.add_argument("--snapshot_every", type=int, default=100, help="save a snapshot every this many iterations, 0 for only the final image")
+parser.add_argument("--snapshot_seconds", type=float, default=0, help="also save a snapshot when this many seconds have passed since the last, 0 to turn off")
+parser.add_argument("--snapshot_format", type=str, default="jpg", choices=sorted(snapshot_writer.FORMATS), help="file format of the snapshots")
+parser.add_argument("--snapshot_quality", type=int, default=95, help="JPEG or WebP quality of the snapshots, 0 to 100")
+parser.add_argument("--keep_snapshots", type=int, default=0, help="keep only this many of the latest snapshots, 0 to keep them all")
+parser.add_argument("--progress", type=str, default=None,
+                    help="write JSON lines progress events to this file, or to stdout with -, which moves the printed output to stderr")
+parser.add_argument("--progress_every", type=int, default=10, help="iterations between progress events")
+parser.add_argument("--timing", type=str, default=None,
+                    help="write the time, CPU time and memory of each stage of the job to this JSON file, see stage_timing.py")
+parser.add_argument("--trace", type=str, default=None, help="also write the stages as a Chrome trace to this file")
+parser.add_argument("--log_level", type=str, default="info", choices=["debug", "info", "warning", "error"],
+                    help="level of the messages logged while loading and saving images")
+parser.add_argument("--checkpoint_every", type=int, default=500,
+                    help="save the optimizer state to " + checkpoint.CHECKPOINT_NAME + " in the output folder every this many iterations, 0 to turn off")
+parser.add_argument("--fast_style_dir", type=str, default="fast_style", help="folder of the style networks trained by fast_style.py")
+parser.add_argument("--no_fast_style", help="optimize even when a style network was trained for the style image", action="store_true")
+parser.add_argument("--preview", help="stylize in one pass, with the style network of the style or else the AdaIN decoder of adain.py, instead of optimizing", action="store_true")
+parser.add_argument("--adain_decoder", type=str, default="fast_style/adain_decoder.npz", help="the decoder trained by adain.py, for --preview")
+parser.add_argument("--adain_alpha", type=float, default=1.0, help="how much of the style --preview gives with the AdaIN decoder, from 0 to 1")
+parser.add_argument("--resume", help="continue from the checkpoint of the same job in the output folder, if there is one", action="store_true")
+parser.add_argument("--intra_op_threads", type=int, default=0, help="threads used inside one op, 0 for the TensorFlow default")
+parser.add_argument("--inter_op_threads", type=int, default=0, help="ops run at once, 0 for the TensorFlow default")
+parser.add_argument("--cpus", type=thread_tuning.cpu_list, default=None, help="run only on these CPUs, e.g. 0-7 or 0,2,4,6")
+parser.add_argument("--auto_threads", action="store_true",
+                    help="time a few iterations with different thread counts and use the fastest, remembered in " + thread_tuning.THREADS_CACHE)
 
-# Number of iterations to run.
-ITERATIONS = args.epoch
+# Arguments that set up the process running a job rather than the job, so a
+# style worker takes them when it starts, see style_worker.py.
+PROCESS_ARGS = {'engine', 'no_xla', 'GPU', 'intra_op_threads', 'inter_op_threads', 'cpus', 'auto_threads',
+                'progress', 'timing', 'trace', 'log_level'}
+# Arguments that never change the image a job gives: how its process is set up,
+# but for the engine, and where its caches, checkpoints and snapshots go.
+# checkpoint.py and result_cache.py leave them out of the hashes of jobs.
+RUN_ARGS = (PROCESS_ARGS - {'engine', 'no_xla'}) | {
+    'resume', 'checkpoint_every', 'style_cache', 'style_cache_mb', 'no_style_cache', 'content_cache',
+    'content_cache_mb', 'no_content_cache', 'result_cache', 'result_cache_mb', 'no_result_cache', 'tile_processes',
+    'snapshot_every', 'snapshot_seconds', 'keep_snapshots', 'progress_every'}
 
-# Image dimensions constants. 
-# image = Image.open(content_image_path)  
-#IMAGE_WIDTH = image.size[0]
-IMAGE_WIDTH = args.IMAGE_WIDTH
-IMAGE_HEIGHT = IMAGE_WIDTH
-COLOR_CHANNELS = 3
+def split_image_path(image_path):
+    """
+    Splits an image path into its folder and its name without the extension.
+    """
+    dot = 0
+    slash = 0
+    for c in reversed(image_path):
+        dot += 1
+        if c == ".":
+            break
+    for c in reversed(image_path):
+        slash += 1
+        if c =="/" or c =="\\":
+            break
+    # EDIT: removed 1 from 1 - slash to return proper file name
+    return image_path[:1-slash], image_path[-slash:-dot]
 
-# Style image layer weights
-w1 = args.w1
-w2 = args.w2
-w3 = args.w3
-w4 = args.w4
-w5 = args.w5
-
-# Content & Style weights
-alpha = args.alpha
-beta = args.beta
-gamma = args.gamma
-
-CONTENT_IMAGE = args.CONTENT_IMAGE
-STYLE_IMAGE = args.STYLE_IMAGE
-
-# Splitting content path & name
-dot = 0
-slash = 0
-for c in reversed(CONTENT_IMAGE):
-    dot += 1
-    if c == ".":
-        break
-for c in reversed(CONTENT_IMAGE):
-    slash += 1 
-    if c =="/" or c =="\\":
-        break
-content_path = CONTENT_IMAGE[:1-slash]
-# EDIT: removed 1 from 1 - slash to return proper file name
-content_name = CONTENT_IMAGE[-slash:-dot]
-
-# Splitting style path & name
-dot = 0 
-slash = 0 
-for c in reversed(STYLE_IMAGE):
-    dot += 1
-    if c == ".":
-        break
-for c in reversed(STYLE_IMAGE):
-    slash += 1
-    if c == "/" or c =="\\":
-        break
-# EDIT: removed 1 from 1 - slash to return proper file name
-style_path = STYLE_IMAGE[:1-slash]
-style_name = STYLE_IMAGE[-slash:-dot]
+def input_path(image_path):
+    """
+    Returns where an image given on the command line is: under input/, or
+    as given if it is absolute or only exists outside input/.
+    """
+    under_input = 'input/' + image_path
+    if os.path.isabs(image_path) or (not os.path.exists(under_input) and os.path.exists(image_path)):
+        return image_path
+    return under_input
+
+def vgg_weights_path():
+    """
+    Returns the converted conv-only weights if they exist, or the .mat file.
+    """
+    if os.path.isdir(VGG_CONV_WEIGHTS):
+        return VGG_CONV_WEIGHTS
+    return VGG_MODEL
 
 ###############################################################################
 
-def style_loss_func(sess, model):
+def gram_matrix(F, N, M):
     """
-    Style loss function as defined in the paper.
+    The gram matrix G of each image in the batch, in float32 whatever the
+    type of the layer, as the sums over M would lose precision otherwise.
     """
-    def gram_matrix(F, N, M):
-        """
-        The gram matrix G.
-        """
-        Ft = tf.reshape(F, (M, N))
-        return tf.matmul(tf.transpose(Ft), Ft)
+    Ft = tf.reshape(tf.cast(F, tf.float32), (-1, M, N))
+    return tf.matmul(Ft, Ft, transpose_a=True)
+
+def style_loss_func(model, style_grams, layer_weights, style_layers=STYLE_LAYERS):
+    """
+    Style loss function as defined in the paper, for each image in the batch.
 
-    def style_loss(a, x):
+    style_grams holds the gram matrices of the style images for each layer,
+    and layer_weights the weight of each layer for each image.
+    """
+    def style_loss(A, x):
         """
         The style loss calculation.
         """
         # N is the number of filters (at layer l).
-        N = a.shape[3]
+        N = int(x.shape[3])
         # M is the height times the width of the feature map (at layer l).
-        M = a.shape[1] * a.shape[2]
-        # A is the style representation of the original image (at layer l).
-        A = gram_matrix(a, N, M)
+        M = int(x.shape[1] * x.shape[2])
         # G is the style representation of the generated image (at layer l).
         G = gram_matrix(x, N, M)
-        result = (1 / (4 * N**2 * M**2)) * tf.reduce_sum(tf.pow(G - A, 2))
+        result = (1 / (4 * N**2 * M**2)) * tf.reduce_sum(tf.pow(G - A, 2), axis=[1, 2])
         return result
 
-    # Style layers to use.
-    layers = [
-            ('conv1_2', w1),
-            ('conv2_2', w2),
-            ('conv3_2', w3),
-            ('conv4_2', w4),
-            ('conv5_2', w5),
-            ]
-
-    E = [style_loss(sess.run(model[layer_name]), model[layer_name]) for layer_name, _ in layers]
-    W = [w for _, w in layers]
-    loss = sum([W[l] * E[l] for l in range(len(layers))])
+    E = [style_loss(style_grams[layer_name], model[layer_name]) for layer_name in style_layers]
+    loss = sum([layer_weights[:, l] * E[l] for l in range(len(style_layers))])
     return loss
 
-def content_loss_func(sess, model):
+def content_loss_func(model, content_targets, content_layers=CONTENT_LAYERS):
     """
-    Content loss function as defined in the paper.
+    Content loss function as defined in the paper, for each image in the batch.
+
+    content_targets holds the features of the content images for each layer.
     """
     def content_loss(p, x):
 
-        return 0.5 * tf.reduce_sum(tf.pow(x - p, 2))
-    loss = content_loss(sess.run(model['conv4_2']), model['conv4_2'])
+        return 0.5 * tf.reduce_sum(tf.pow(tf.cast(x, tf.float32) - p, 2), axis=[1, 2, 3])
+    loss = sum([content_loss(content_targets[layer_name], model[layer_name]) for layer_name in content_layers])
     return loss
 
-def content_dist(sess, model):
-
-    dist, dist_sum = distance_transform.dist_t(sess.run(model["input"]))
-    return tf.convert_to_tensor(dist, dtype=tf.float32), dist_sum
-
-def shape_loss_func(sess, model, dist_template, dist_sum):
-
-    content_image = sess.run(model['input'])
+def shape_loss_func(model, dist_template, shape_target):
+    """
+    Distance transform loss, for each image in the batch. shape_target is
+    the grayscale content image multiplied pixel-wise by dist_template.
+    """
     mixed_image   = model["input"]
 
     # Convert to grayscale
-    content_image = tf.image.rgb_to_grayscale(content_image)
     mixed_image   = tf.image.rgb_to_grayscale(mixed_image)
 
-    # Remove dimensions of size 1 from the shape of a tensor
-    content_image = tf.squeeze(content_image)
-    mixed_image   = tf.squeeze(mixed_image)
+    # Remove the channel dimension, of size 1
+    mixed_image   = mixed_image[:, :, :, 0]
 
     # Pixel-wise multiplication
-    content_dist  = content_image * dist_template
     mixed_dist    = mixed_image   * dist_template
 
-    loss_tensor = 0.5 * tf.reduce_sum(tf.pow(content_dist-mixed_dist, 2))
+    loss_tensor = 0.5 * tf.reduce_sum(tf.pow(shape_target-mixed_dist, 2), axis=[1, 2])
 
     return loss_tensor
-    
-if __name__ == '__main__':
+
+def build_style_transfer_graph(vgg_weights, height, width, style_layers=STYLE_LAYERS, content_layers=CONTENT_LAYERS,
+                               batch_size=1, precision='float32'):
+    """
+    Builds the VGG model, the three losses and the optimizer for one image size.
+
+    The VGG model stops at the deepest of the style and content layers. The
+    content, style and shape targets and the loss weights are held in
+    non-trainable variables, so the same graph can run any number of jobs of
+    that size. Returns a dict of the tensors and ops, like model.load_vgg_model.
+
+    With a batch_size above 1, that many jobs are optimized together, each
+    with its own targets and loss weights. The losses are summed, so each
+    image gets the same gradient it would get on its own; 'sample_losses'
+    holds the losses of each image. Setting an image's entry of 'active' to 0
+    freezes it: the train step leaves it as it was, for a job that stopped
+    before the others.
+
+    precision is one of PRECISIONS, the type of the VGG weights and layers.
+    The input image, the gram matrices and the losses are always float32.
+    """
+    if isinstance(vgg_weights, str):
+        vgg_weights = model.load_vgg_weights(vgg_weights, style_layers + content_layers)
+
+    graph = {}
+    graph['height'] = height
+    graph['width'] = width
+    graph['batch_size'] = batch_size
+    graph['precision'] = precision
+    graph['style_layers'] = style_layers
+    graph['content_layers'] = content_layers
+    graph['weights_id'] = model.weights_fingerprint(vgg_weights)
+    graph['model'] = net = model.load_vgg_model(vgg_weights, height, width, COLOR_CHANNELS,
+                                                layers=style_layers + content_layers, batch_size=batch_size,
+                                                dtype=PRECISIONS[precision])
+
+    def target(name, shape):
+        return tf.Variable(np.zeros(shape), dtype='float32', trainable=False, name=name)
+
+    # Weights of the loss terms, equation 7 of the paper, for each image.
+    graph['alpha'] = target('alpha', (batch_size,))
+    graph['beta']  = target('beta', (batch_size,))
+    graph['gamma'] = target('gamma', (batch_size,))
+    graph['layer_weights'] = target('layer_weights', (batch_size, len(style_layers)))
+
+    # Targets, filled in from the content and style images of each job.
+    graph['content_targets'] = {}
+    for layer_name in content_layers:
+        graph['content_targets'][layer_name] = target('content_target_' + layer_name, net[layer_name].shape.as_list())
+    graph['style_grams'] = {}
+    graph['grams'] = {}
+    for layer_name in style_layers:
+        N = int(net[layer_name].shape[3])
+        M = int(net[layer_name].shape[1] * net[layer_name].shape[2])
+        graph['grams'][layer_name] = gram_matrix(net[layer_name], N, M)
+        graph['style_grams'][layer_name] = target('style_gram_' + layer_name, (batch_size, N, N))
+    graph['dist_template'] = target('dist_template', (batch_size, height, width))
+    graph['shape_target'] = target('shape_target', (batch_size, height, width))
+    graph['gray_input'] = tf.image.rgb_to_grayscale(net['input'])[:, :, :, 0]
+
+    sample_losses = {}
+    sample_losses['content_loss'] = content_loss_func(net, graph['content_targets'], content_layers)
+    sample_losses['style_loss'] = style_loss_func(net, graph['style_grams'], graph['layer_weights'], style_layers)
+    sample_losses['shape_loss'] = shape_loss_func(net, graph['dist_template'], graph['shape_target'])
+
+    # Instantiate equation 7 of the paper.
+    sample_losses['total_loss'] = (graph['alpha'] * sample_losses['content_loss']
+                                   + graph['beta'] * sample_losses['style_loss']
+                                   + graph['gamma'] * sample_losses['shape_loss'])
+    graph['sample_losses'] = sample_losses
+    for name in LOSS_NAMES:
+        graph[name] = tf.reduce_sum(sample_losses[name])
+
+    # Gradient of the total loss for the input image, used by the L-BFGS optimizer.
+    graph['gradient'] = tf.gradients(graph['total_loss'], net['input'])[0]
+
+    # Then we minimize the total_loss, which is the equation 7.
+    optimizer = tf.train.AdamOptimizer(1.0)
+    if batch_size > 1:
+        # Adam keeps moving an image after its gradient is gone, so frozen
+        # images are put back after the update instead.
+        graph['active'] = tf.Variable(np.ones(batch_size), dtype='float32', trainable=False, name='active')
+        before = tf.identity(net['input'].read_value())
+        with tf.control_dependencies([before]):
+            update = optimizer.minimize(graph['total_loss'], var_list=[net['input']])
+        with tf.control_dependencies([update]):
+            active = graph['active'][:, np.newaxis, np.newaxis, np.newaxis]
+            graph['train_step'] = net['input'].assign(before + active * (net['input'].read_value() - before)).op
+    else:
+        graph['train_step'] = optimizer.minimize(graph['total_loss'], var_list=[net['input']])
+    graph['optimizer_slots'] = optimizer.variables()
+    graph['reset_optimizer'] = tf.variables_initializer(graph['optimizer_slots'])
+    return graph
+
+def style_layer_weights(args):
+    """
+    The w1..w5 weights, in the order of the style layers.
+    """
+    return [args.w1, args.w2, args.w3, args.w4, args.w5]
+
+def compute_style_grams(sess, graph, style_image):
+    """
+    Runs the style image through VGG once and returns the gram matrix of each style layer.
+    """
+    if 'function' in graph:
+        return graph['function'].compute_style_grams(style_image)
+    graph['model']['input'].load(style_image, sess)
+    grams = sess.run(graph['grams'])
+    return {layer_name: gram[0] for layer_name, gram in grams.items()}
+
+def open_style_cache(args):
+    """
+    Returns the style cache selected by the arguments, or None if it is turned off.
+    """
+    if args.no_style_cache:
+        return None
+    return target_cache.TargetCache(args.style_cache, args.style_cache_mb * 2**20)
+
+def style_cache_key(graph, style_path):
+    return target_cache.make_key(kind='style_grams', style=target_cache.file_hash(style_path),
+                                 height=graph['height'], width=graph['width'], layers=graph['style_layers'],
+                                 invert=style_invert, weights=graph['weights_id'], precision=graph['precision'])
+
+def load_style_grams(sess, graph, style_path, cache=None):
+    """
+    Returns the gram matrices of the style image at style_path. They come from
+    the cache when it has them; otherwise the image is run through VGG and the
+    result is stored in the cache.
+    """
+    if cache is not None:
+        key = style_cache_key(graph, style_path)
+        style_grams = cache.get(key)
+        if style_grams is not None:
+            return style_grams
+
+    style_image = utility.load_image(style_path, graph['height'], graph['width'], invert = style_invert)
+    style_grams = compute_style_grams(sess, graph, style_image)
+    if cache is not None:
+        cache.put(key, style_grams)
+    return style_grams
+
+def content_dist_template(content_image):
+    """
+    The distance template of the shape loss for a [1, h, w, 3] content image.
+    """
+    dist_template_inf, content_dist_sum = distance_transform.dist_t(content_image)
+    ### take power of distance template
+    dist_template = np.power(dist_template_inf,8)
+    dist_template[dist_template>np.power(2,30)] = np.power(2,30)
+    return dist_template
+
+def compute_content_targets(sess, graph, content_image, dist_template=None):
+    """
+    Runs the content image through VGG once and returns its features for each
+    content layer, its distance template and shape target, and the image itself.
+    dist_template, if given, is used instead of the one of content_image, as
+    for a tile of a larger image, whose distances reach past the tile.
+    """
+    # Construct content targets using content_image.
+    if 'function' in graph:
+        content_features, content_gray = graph['function'].content_features(content_image)
+    else:
+        net = graph['model']
+        net['input'].load(content_image, sess)
+        content_features, content_gray = sess.run([{layer_name: net[layer_name] for layer_name in graph['content_layers']},
+                                                   graph['gray_input']])
+
+    # Construct shape target using content image
+    if dist_template is None:
+        dist_template = content_dist_template(content_image)
+
+    # Stored as float32 whatever the precision of the layers.
+    content_targets = {layer_name: features.astype(np.float32) for layer_name, features in content_features.items()}
+    content_targets['content_image'] = content_image
+    content_targets['dist_template'] = dist_template
+    content_targets['shape_target'] = content_gray[0] * dist_template
+    return content_targets
+
+def open_result_cache(args):
+    """
+    Returns the result cache selected by the arguments, or None if it is turned off.
+    """
+    if args.no_result_cache:
+        return None
+    return result_cache.ResultCache(args.result_cache, args.result_cache_mb * 2**20)
+
+def open_content_cache(args):
+    """
+    Returns the content cache selected by the arguments, or None if it is turned off.
+    """
+    if args.no_content_cache:
+        return None
+    return target_cache.TargetCache(args.content_cache, args.content_cache_mb * 2**20)
+
+def content_cache_key(graph, content_path):
+    return target_cache.make_key(kind='content_targets', content=target_cache.file_hash(content_path),
+                                 height=graph['height'], width=graph['width'], layers=graph['content_layers'],
+                                 invert=content_invert, weights=graph['weights_id'], precision=graph['precision'])
+
+def load_content_targets(sess, graph, content_path, cache=None):
+    """
+    Returns the content targets of the content image at content_path, from the
+    cache when it has them, or from compute_content_targets, storing the result.
+    """
+    if cache is not None:
+        key = content_cache_key(graph, content_path)
+        content_targets = cache.get(key)
+        if content_targets is not None:
+            return content_targets
+
+    content_image = utility.load_image(content_path, graph['height'], graph['width'], invert = content_invert)
+    content_targets = compute_content_targets(sess, graph, content_image)
+    if cache is not None:
+        cache.put(key, content_targets)
+    return content_targets
+
+def set_job_targets(sess, graph, content_targets, style_grams, args):
+    """
+    Loads the content, shape and style targets of a job, together with the
+    loss weights, into the graph.
+    """
+    set_batch_targets(sess, graph, [content_targets], [style_grams], [args])
+
+def set_batch_targets(sess, graph, content_targets, style_grams, args):
+    """
+    Loads the targets and loss weights of a batch of jobs into the graph.
+    content_targets, style_grams and args are lists with one item per image.
+    """
+    # Content and shape targets.
+    for layer_name in graph['content_layers']:
+        graph['content_targets'][layer_name].load(np.concatenate([targets[layer_name] for targets in content_targets]), sess)
+    graph['dist_template'].load(np.stack([targets['dist_template'] for targets in content_targets]), sess)
+    graph['shape_target'].load(np.stack([targets['shape_target'] for targets in content_targets]), sess)
+
+    # Style targets.
+    for layer_name in graph['style_layers']:
+        graph['style_grams'][layer_name].load(np.stack([grams[layer_name] for grams in style_grams]), sess)
+
+    graph['alpha'].load([job_args.alpha for job_args in args], sess)
+    graph['beta'].load([job_args.beta for job_args in args], sess)
+    graph['gamma'].load([job_args.gamma for job_args in args], sess)
+    graph['layer_weights'].load([style_layer_weights(job_args)[:len(graph['style_layers'])] for job_args in args], sess)
+
+def early_stopping_policy(args):
+    """
+    Returns the EarlyStopping policy selected by the arguments.
+    """
+    return EarlyStopping(plateau=args.stop_plateau, window=args.stop_window,
+                         pixel_delta=args.stop_pixel_delta, time_budget=args.time_budget)
+
+def open_snapshot_writer(output_dir, args):
+    """
+    Returns a SnapshotWriter for output_dir with the snapshot cadence and format of the arguments.
+    """
+    return SnapshotWriter(output_dir, invert=result_invert, every=args.snapshot_every, seconds=args.snapshot_seconds,
+                          image_format=args.snapshot_format, quality=args.snapshot_quality, keep=args.keep_snapshots)
+
+def save_final_image(image, args, output_dir):
+    """
+    Writes an image made without optimizing, by fast_style.py or adain.py,
+    as the final snapshot, numbered args.epoch, so callers picking the last
+    snapshot find it. Returns the file name.
+    """
+    writer = open_snapshot_writer(output_dir, args)
+    try:
+        return writer.put(args.epoch, image, final=True)
+    finally:
+        writer.close()
+
+def save_snapshot(it, mixed_image, losses, args, writer, on_snapshot=None, final=False):
+    """
+    Prints the losses of an iteration and queues the image on a
+    SnapshotWriter, named by the iteration number. on_snapshot, if given, is
+    called from the writer thread once the file is written. Returns the file
+    name, or None if the writer skipped it; final snapshots are never skipped.
+    """
+    print('Iteration %d' % (it))
+    print('sum         : ', np.sum(mixed_image))
+    print('total_loss  : ', losses['total_loss'])
+    print("content_loss: ", args.alpha*losses['content_loss'])
+    print("style_loss  : ", args.beta *losses['style_loss'])
+    print("shape loss  : ", args.gamma*losses['shape_loss'])
+
+    if on_snapshot is None:
+        return writer.put(it, mixed_image, final)
+    total_loss = float(losses['total_loss'])
+    return writer.put(it, mixed_image, final, lambda filename: on_snapshot(it, filename, total_loss))
+
+class SessionSteps:
+    """
+    The operations of run_adam on a graph from build_style_transfer_graph
+    and its session. tf2_engine.StyleTransferFunction has the same methods.
+    """
+
+    def __init__(self, sess, graph):
+        self.sess = sess
+        self.graph = graph
+        self.fetches = {name: graph[name] for name in ('train_step',) + LOSS_NAMES}
+
+    def set_targets(self, content_targets, style_grams, args):
+        set_job_targets(self.sess, self.graph, content_targets, style_grams, args)
+
+    def reset(self, image):
+        """Put the image in the input and start the optimizer over."""
+        self.sess.run(self.graph['reset_optimizer'])
+        self.graph['model']['input'].load(image, self.sess)
+
+    def step(self):
+        """One optimizer step; returns the losses of the image before it."""
+        return self.sess.run(self.fetches)
+
+    def image(self):
+        return self.sess.run(self.graph['model']['input'])
+
+    def slots(self):
+        """The optimizer variables, for checkpoints."""
+        return self.sess.run(self.graph['optimizer_slots'])
+
+    def load_slots(self, slots):
+        for variable, value in zip(self.graph['optimizer_slots'], slots):
+            variable.load(value, self.sess)
+
+def optimizer_steps(sess, graph):
+    """
+    The SessionSteps of a graph, or the tf2_engine function standing in for it.
+    """
+    return graph['function'] if 'function' in graph else SessionSteps(sess, graph)
+
+def checkpoint_due(it, args):
+    """
+    Whether a checkpoint is saved after iteration it; not after the last, as the job is done then.
+    """
+    return args.checkpoint_every > 0 and 0 < it < args.epoch and it % args.checkpoint_every == 0
+
+def run_style_transfer(sess, graph, content_targets, style_grams, args, output_dir, on_snapshot=None,
+                       initial_image=None, first_iteration=0, on_checkpoint=None, resume=None, progress=None):
+    """
+    Runs one style transfer job on a graph from build_style_transfer_graph.
+    content_targets comes from load_content_targets or compute_content_targets,
+    and style_grams from load_style_grams or compute_style_grams.
+
+    The optimization starts from initial_image, or the content image if it is None.
+
+    Snapshots are saved to output_dir, a folder or a SnapshotWriter (or
+    anything with its due and put methods), at the cadence of the snapshot
+    arguments, and at the end; on_snapshot, if given, is called with the
+    iteration, the file name and the total loss.
+    Snapshots are numbered from first_iteration.
+
+    Every args.checkpoint_every iterations on_checkpoint, if given, is called
+    with the iteration, the image and the list of Adam slot values. resume is
+    a state returned by Checkpoint.load to continue from instead of starting.
+    progress, a ProgressTracker, if given, gets the losses of every iteration.
+    Returns the file name of the last snapshot.
+    """
+    steps = optimizer_steps(sess, graph)
+    steps.set_targets(content_targets, style_grams, args)
+    writer = output_dir
+    if isinstance(writer, str):
+        writer = open_snapshot_writer(output_dir, args)
+
+    # Content image as input image
+    if initial_image is None:
+        initial_image = content_targets['content_image']
+    initial_image = initial_image.copy()
+    first_step = 0
+    if resume is not None:
+        initial_image = resume['image']
+        # With a lower epoch than before, the last iteration is run again.
+        first_step = min(resume['iteration'] + 1, args.epoch)
+        print("Resuming from iteration %d" % (first_iteration + resume['iteration']))
+    steps.reset(initial_image)
+
+    if args.optimizer == 'lbfgs':
+        if 'function' in graph:
+            raise ValueError("--optimizer lbfgs runs on --engine v1 only")
+        # L-BFGS keeps its history in scipy, so a resumed job starts a new
+        # L-BFGS run from the checkpoint image.
+        lbfgs_args = argparse.Namespace(**vars(args))
+        lbfgs_args.epoch = args.epoch - first_step
+        def lbfgs_checkpoint(it, image, slots):
+            on_checkpoint(first_step + it, image, slots)
+        filename = run_lbfgs(sess, graph, initial_image, content_targets['dist_template'], lbfgs_args, writer,
+                             on_snapshot, first_iteration + first_step, lbfgs_checkpoint if on_checkpoint else None,
+                             progress)
+    else:
+        if resume is not None:
+            steps.load_slots(resume['slots'])
+        filename = run_adam(steps, args, writer, on_snapshot, first_iteration, first_step, on_checkpoint, progress)
+    if writer is not output_dir:
+        writer.close()
+    return filename
+
+def run_adam(steps, args, writer, on_snapshot=None, first_iteration=0, first_step=0, on_checkpoint=None,
+             progress=None):
+    """
+    The Adam loop of run_style_transfer, from iteration first_step, on the
+    image and optimizer state already in steps, a SessionSteps or a
+    tf2_engine function. Returns the file name of the last snapshot.
+    """
+    stopping = early_stopping_policy(args)
+    filename = None
+    for it in range(first_step, args.epoch+1):
+        # One run per iteration does the update and returns the losses of the
+        # forward pass it used.
+        losses = steps.step()
+        if progress is not None:
+            progress.update(first_iteration + it, losses)
+
+        snapshot = writer.due(it)
+        mixed_image = None
+        if snapshot or stopping.needs_image(it):
+            mixed_image = steps.image()
+        stop = stopping.update(it, losses['total_loss'], mixed_image)
+        final = stop or it == args.epoch
+
+        if snapshot or final:
+            # Print and save at the snapshot cadence, and the last iteration.
+            if mixed_image is None:
+                mixed_image = steps.image()
+            filename = save_snapshot(first_iteration + it, mixed_image, losses, args, writer, on_snapshot,
+                                     final) or filename
+        if stop:
+            print("Stopped at iteration %d: %s" % (it, stopping.reason))
+            break
+        if on_checkpoint is not None and checkpoint_due(it, args):
+            on_checkpoint(it, steps.image(), steps.slots())
+    return filename
+
+def shape_freedom(dist_template, gamma):
+    """
+    How free each pixel is to move under the shape loss, from 1 where the
+    distance template is 0 down to almost 0 where it is large and the pixel
+    is held to the content image. This is 1 / (1 + the shape loss curvature).
+    """
+    return 1.0 / (1.0 + gamma * np.square(dist_template.astype(np.float64)))
+
+class StopOptimization(Exception):
+    """Raised from the L-BFGS callback when the early stopping policy says to stop."""
+
+def run_lbfgs(sess, graph, initial_image, dist_template, args, writer, on_snapshot=None, first_iteration=0,
+              on_checkpoint=None, progress=None):
+    """
+    Minimizes the same total loss with scipy's L-BFGS-B instead of Adam, for
+    at most args.epoch iterations. Every loss evaluation is one sess.run that
+    returns the losses and the gradient for the image.
+
+    The shape loss weights pixels by dist_template, up to 2^30, which leaves
+    L-BFGS unable to take a first step. So it works on a scaled image instead,
+    where each pixel is scaled by the square root of its shape_freedom.
+
+    Snapshots, checkpoints and early stopping work like the Adam loop, per
+    L-BFGS iteration; the checkpoints have no slot values.
+    Returns the file name of the last snapshot.
+    """
+    net = graph['model']
+    shape = initial_image.shape
+    fetches = {name: graph[name] for name in ('gradient',) + LOSS_NAMES}
+    stopping = early_stopping_policy(args)
+
+    x0 = initial_image.ravel().astype(np.float64)
+    scale = np.sqrt(shape_freedom(dist_template, args.gamma))
+    scale = np.broadcast_to(scale[np.newaxis, :, :, np.newaxis], shape).ravel()
+    state = {'iteration': -1, 'evaluations': 0, 'losses': None, 'x': x0, 'filename': None, 'saved': -1}
+
+    def loss_and_gradient(y):
+        x = x0 + scale * y
+        net['input'].load(x.reshape(shape).astype(np.float32), sess)
+        losses = sess.run(fetches)
+        state['evaluations'] += 1
+        state['losses'] = losses
+        return float(losses['total_loss']), losses['gradient'].ravel().astype(np.float64) * scale
+
+    def step(x):
+        it = state['iteration'] = state['iteration'] + 1
+        state['x'] = x
+        mixed_image = x.reshape(shape).astype(np.float32)
+        if progress is not None:
+            progress.update(first_iteration + it, state['losses'])
+        stop = stopping.update(it, state['losses']['total_loss'], mixed_image)
+        if writer.due(it) or stop:
+            state['filename'] = save_snapshot(first_iteration + it, mixed_image, state['losses'], args, writer,
+                                              on_snapshot, stop) or state['filename']
+            state['saved'] = it
+        if stop:
+            print("Stopped at iteration %d: %s" % (it, stopping.reason))
+            raise StopOptimization()
+        if on_checkpoint is not None and checkpoint_due(it, args):
+            on_checkpoint(it, mixed_image, [])
+
+    def callback(y):
+        step(x0 + scale * y)
+
+    try:
+        y0 = np.zeros_like(x0)
+        loss_and_gradient(y0)
+        step(x0)
+        result = scipy.optimize.minimize(loss_and_gradient, y0, jac=True, method='L-BFGS-B',
+                                         callback=callback, options={'maxiter': args.epoch})
+        print("L-BFGS finished:", result.message)
+    except StopOptimization:
+        pass
+
+    # Leave the last accepted image in the input, and save it unless that was just done.
+    final_image = state['x'].reshape(shape).astype(np.float32)
+    net['input'].load(final_image, sess)
+    if state['saved'] != state['iteration']:
+        # The last evaluation may have been a line search trial, not this image.
+        loss_and_gradient((state['x'] - x0) / scale)
+        state['filename'] = save_snapshot(first_iteration + state['iteration'], final_image, state['losses'], args,
+                                          writer, on_snapshot, final=True)
+    print("L-BFGS used %d iterations and %d loss evaluations" % (state['iteration'], state['evaluations']))
+    return state['filename']
+
+def image_size(args, content_path):
+    """
+    The (height, width) of a job: IMAGE_HEIGHT x IMAGE_WIDTH, or if
+    IMAGE_HEIGHT is 0, a square, or with keep_aspect the height that keeps
+    the aspect ratio of the content image.
+    """
+    if args.IMAGE_HEIGHT:
+        return args.IMAGE_HEIGHT, args.IMAGE_WIDTH
+    if args.keep_aspect:
+        return utility.aspect_height(content_path, args.IMAGE_WIDTH), args.IMAGE_WIDTH
+    return args.IMAGE_WIDTH, args.IMAGE_WIDTH
+
+def pyramid_sizes(height, width, levels):
+    """
+    The (height, width) of each level of a pyramid, smallest first, each
+    half the size of the next and ending at height x width.
+    """
+    return [(height // 2**(levels - 1 - level), width // 2**(levels - 1 - level)) for level in range(levels)]
+
+def check_pyramid(height, width, levels):
+    """
+    Returns an error message if the pyramid can't be built for the size, or None.
+    """
+    if levels < 1 or min(pyramid_sizes(height, width, levels)[0]) < 32:
+        return "the pyramid needs at least 1 level, and its smallest size at least 32 pixels"
+    return None
+
+def upsample_image(image, height, width):
+    """
+    Resizes a [1, h, w, 3] image, as held in the model input, to height x width.
+    """
+    resized = cv2.resize(image[0], (width, height), interpolation=cv2.INTER_CUBIC)
+    return resized[np.newaxis].astype(np.float32)
+
+def run_pyramid(levels, content_path, style_path, args, output_dir, on_snapshot=None, on_progress=None):
+    """
+    Runs a style transfer job from coarse to fine. levels is a list of
+    (session, graph) pairs, smallest image size first. Each level gets its
+    own content, style and shape targets, and starts from the upsampled
+    result of the level before it, kept at the content image where the
+    shape loss allows no change. The levels before the last run
+    args.pyramid_epoch iterations; the last runs args.epoch.
+
+    Snapshot numbers continue from one level to the next, so the last
+    snapshot of the last level is the highest numbered file in output_dir.
+    With a single level this is the same as run_style_transfer.
+
+    Checkpoints are saved to output_dir every args.checkpoint_every
+    iterations and removed when the job is done. With args.resume, the job
+    continues from the checkpoint of the same job, skipping the levels it
+    had finished.
+
+    on_progress, if given, is called with a progress event every
+    args.progress_every iterations, see progress.py.
+
+    Unless args.resume or args.no_warm_start, the job starts from the
+    closest earlier run on the same images when there is one, see
+    warm_start.py, and its own final state is kept in the result cache.
+    Returns the file name of the last snapshot.
+    """
+    weights_id = levels[-1][1]['weights_id']
+    job_hash = checkpoint.job_hash(args, content_path, style_path, weights_id)
+    pair = warm_start.pair_key(content_path, style_path, weights_id)
+    metadata = warm_start.state_metadata(pair, args, len(levels))
+    job_checkpoint = checkpoint.Checkpoint(output_dir, job_hash, metadata)
+    results = open_result_cache(args)
+    writer = open_snapshot_writer(output_dir, args)
+    epochs = [args.pyramid_epoch] * (len(levels) - 1) + [args.epoch]
+    tracker = None
+    if on_progress is not None:
+        tracker = progress.ProgressTracker(sum(epoch + 1 for epoch in epochs), args.progress_every, on_progress,
+                                           {'total_loss': 1, 'content_loss': args.alpha, 'style_loss': args.beta,
+                                            'shape_loss': args.gamma})
+    # The number of the last snapshot written, the final one once the writer is closed.
+    last_snapshot = {}
+    def on_written(it, filename, total_loss, on_snapshot=on_snapshot):
+        last_snapshot['iteration'] = it
+        if tracker is not None:
+            tracker.snapshot(filename)
+        if on_snapshot is not None:
+            on_snapshot(it, filename, total_loss)
+
+    resume = job_checkpoint.load() if args.resume else None
+    image = None
+    warm = None
+    if resume is None and not args.no_warm_start:
+        with stage_timing.span('warm start search'):
+            warm = warm_start.find_warm_start(results, job_checkpoint.path, pair, job_hash, args)
+    if warm is not None:
+        skipped = sum(epoch + 1 for epoch in epochs[:-1])
+        if warm['job_hash'] == job_hash:
+            # The same optimization, run for fewer iterations: continue it.
+            resume = dict(warm, level=len(levels) - 1)
+            skipped += warm['iteration'] + 1
+            print("Warm start from %s, the same job run to iteration %d" % (warm['source'], warm['iteration']))
+        else:
+            image = warm['image']
+            print("Warm start from %s, a job with other %s" % (warm['source'], ', '.join(warm['differences'])))
+        print("Warm start saves %d of %d iterations" % (skipped, sum(epoch + 1 for epoch in epochs)))
+        if on_progress is not None:
+            on_progress({'event': 'warm_start', 'source': warm['source'], 'differences': warm['differences'],
+                         'iterations_saved': skipped})
+
+    first_iteration = 0
+    filename = None
+    for level, (sess, graph) in enumerate(levels):
+        level_args = argparse.Namespace(**vars(args))
+        if level < len(levels) - 1:
+            level_args.epoch = args.pyramid_epoch
+        if (resume is not None and level < resume['level']) or (warm is not None and level < len(levels) - 1):
+            first_iteration += level_args.epoch + 1
+            continue
+        if len(levels) > 1:
+            print("Pyramid level %d: %dx%d, %d iterations" % (level, graph['width'], graph['height'], level_args.epoch))
+
+        with stage_timing.span('content targets', level=level):
+            content_targets = load_content_targets(sess, graph, content_path, open_content_cache(args))
+        with stage_timing.span('style targets', level=level):
+            style_grams = load_style_grams(sess, graph, style_path, open_style_cache(args))
+        level_resume = None
+        if resume is not None and level == resume['level']:
+            level_resume = resume
+        elif image is not None:
+            # Pixels the shape loss holds to the content image keep their content
+            # value; blurring the coarse result into them would cost far more
+            # than the coarse level saved.
+            content_image = content_targets['content_image']
+            freedom = shape_freedom(content_targets['dist_template'], args.gamma)[np.newaxis, :, :, np.newaxis]
+            image = upsample_image(image, graph['height'], graph['width'])
+            image = (content_image + freedom * (image - content_image)).astype(np.float32)
+
+        def on_checkpoint(it, checkpoint_image, slots, level=level):
+            job_checkpoint.save(level, it, checkpoint_image, slots)
+
+        with stage_timing.span('optimize', level=level, epoch=level_args.epoch):
+            filename = run_style_transfer(sess, graph, content_targets, style_grams, level_args, writer, on_written,
+                                          initial_image=image, first_iteration=first_iteration,
+                                          on_checkpoint=on_checkpoint if args.checkpoint_every > 0 else None,
+                                          resume=level_resume, progress=tracker)
+        image = optimizer_steps(sess, graph).image()
+        first_iteration += level_args.epoch + 1
+    with stage_timing.span('wait for snapshots'):
+        writer.close()
+    if 'iteration' in last_snapshot:
+        last_iteration = last_snapshot['iteration'] - (first_iteration - args.epoch - 1)
+        if warm is not None:
+            # Early stopping may end a warm started job well before its epoch.
+            first_step = warm['iteration'] + 1 if warm['job_hash'] == job_hash else 0
+            print("Warm start: ran %d of the %d iterations of the job"
+                  % (last_iteration + 1 - first_step, sum(epoch + 1 for epoch in epochs)))
+        if results is not None:
+            with stage_timing.span('save warm start state'):
+                warm_start.save_state(results, job_hash, metadata, last_iteration, image,
+                                      optimizer_steps(sess, graph).slots())
+    job_checkpoint.remove()
+    return filename
+
+def main(argv=None):
+    """
+    Runs the job given by the command line arguments argv, or sys.argv.
+    """
+    args = parser.parse_args(argv)
+    stage_timing.start()
+    if len(args.style_layers) > len(style_layer_weights(args)):
+        parser.error("at most %d style layers can be weighted by w1..w5" % len(style_layer_weights(args)))
+    # The event stream first, as writing events to stdout moves the printed output to stderr.
+    events = progress.open_event_stream(args.progress) if args.progress else None
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format='%(message)s')
+
+    CONTENT_IMAGE = args.CONTENT_IMAGE
+    STYLE_IMAGE = args.STYLE_IMAGE
+
+    # Image dimensions constants.
+    try:
+        IMAGE_HEIGHT, IMAGE_WIDTH = image_size(args, input_path(CONTENT_IMAGE))
+    except ValueError as e:
+        parser.error(str(e))
+    if check_pyramid(IMAGE_HEIGHT, IMAGE_WIDTH, args.pyramid):
+        parser.error(check_pyramid(IMAGE_HEIGHT, IMAGE_WIDTH, args.pyramid))
+    if args.preview and not os.path.exists(args.adain_decoder):
+        # A style with a network from fast_style.py is previewed with it, without the decoder.
+        import fast_style
+        if args.no_fast_style or fast_style.network_path(input_path(STYLE_IMAGE), args.fast_style_dir) is None:
+            parser.error("--preview needs the AdaIN decoder, train it with adain.py or give its path with --adain_decoder")
+    if args.engine == 'tf2' and args.optimizer == 'lbfgs':
+        parser.error("--optimizer lbfgs runs on --engine v1 only")
+    if args.tile and (args.pyramid > 1 or args.tile_overlap >= args.tile):
+        parser.error("--tile needs a --tile_overlap below it, and doesn't do --pyramid")
+    if args.tile and args.resume:
+        parser.error("--tile jobs have no checkpoints, so they can't --resume")
+
+    # The job runs the way style_api.py runs it, in a StyleTransferWorker.
+    import style_worker
+
+    # Splitting content & style path & name
+    content_path, content_name = split_image_path(CONTENT_IMAGE)
+    style_path, style_name = split_image_path(STYLE_IMAGE)
+
     try:
         OUTPUT_DIR = ("output/" + content_name + "_vs_" + style_name)
         os.mkdir(OUTPUT_DIR)
     except:
         pass
     start_time = time.time()
-    
-    if args.GPU:
-        device = tf.device("/gpu:0")
+
+    if args.cpus:
+        thread_tuning.set_cpu_affinity(args.cpus)
+    if args.auto_threads:
+        # Tuned for the full size, where most of the time goes.
+        config = thread_tuning.tuned_session_config(IMAGE_HEIGHT, IMAGE_WIDTH, args.style_layers, args.content_layers)
     else:
-        device = tf.device("/cpu:0")
-
-    with device: 
-        with tf.Session() as sess:          
-
-            # Load images.
-            content_source = f'input/{CONTENT_IMAGE}'
-            style_source = 'input/' + STYLE_IMAGE
-            content_image = utility.load_image(content_source, IMAGE_HEIGHT, IMAGE_WIDTH, invert = content_invert)
-            style_image   = utility.load_image(style_source, IMAGE_HEIGHT, IMAGE_WIDTH, invert = style_invert)
-            # utility.save_image(OUTPUT_DIR+"/"+style_name+".png", style_image, invert = style_invert)
-            
-            # Load the model.
-            model = model.load_vgg_model(VGG_MODEL, IMAGE_HEIGHT, IMAGE_WIDTH, 3)
-            # Content image as input image
-            initial_image = content_image.copy()
-            # Initialize all variables
-            sess.run(tf.global_variables_initializer())
-            
-            # Construct content_loss using content_image.
-            sess.run(model['input'].assign(content_image))
-            content_loss = content_loss_func(sess, model)
-
-            # Construct shape loss using content image
-            sess.run(model["input"].assign(initial_image))
-            dist_template_inf, content_dist_sum = distance_transform.dist_t(content_image)
-            ### take power of distance template
-            dist_template = np.power(dist_template_inf,8)
-            dist_template[dist_template>np.power(2,30)] = np.power(2,30)
-            
-            shape_loss = shape_loss_func(sess, model, dist_template, content_dist_sum)
-    
-            # Construct style_loss using style_image.
-            sess.run(model['input'].assign(style_image))
-            style_loss = style_loss_func(sess, model)
-            
-            # Instantiate equation 7 of the paper.
-            total_loss = alpha * content_loss + beta * style_loss + gamma * shape_loss
-    
-            # Then we minimize the total_loss, which is the equation 7.
-            optimizer = tf.train.AdamOptimizer(1.0)
-            train_step = optimizer.minimize(total_loss)
-    
-            sess.run(tf.global_variables_initializer())
-            sess.run(model['input'].assign(initial_image))
-            for it in range(ITERATIONS+1):
-                sess.run(train_step)
-                
-                if it%100 == 0:
-                    # Print every 100 iteration.
-                    mixed_image = sess.run(model['input'])
-                    print('Iteration %d' % (it))
-                    print('sum         : ', sess.run(tf.reduce_sum(mixed_image)))
-                    print('total_loss  : ', sess.run(total_loss))
-                    print("content_loss: ", alpha*sess.run(content_loss))
-                    print("style_loss  : ", beta *sess.run(style_loss))
-                    print("shape loss  : ", gamma*sess.run(shape_loss))
-    
-                    if not os.path.exists(OUTPUT_DIR):
-                        os.mkdir(OUTPUT_DIR)
-    
-                    filename = OUTPUT_DIR + '/%d.jpg' % (it)
-                    utility.save_image(filename, mixed_image, invert = result_invert)
-                if sess.run(total_loss) < 1:
-                    break
-        sess.close()
+        config = thread_tuning.session_config(args.intra_op_threads, args.inter_op_threads)
+    if args.engine == 'tf2':
+        # Before anything makes a TF1 graph.
+        import tf2_engine
+        tf2_engine.enable(config)
+
+    # Images to use.
+    content_source = input_path(CONTENT_IMAGE)
+    style_source = input_path(STYLE_IMAGE)
+
+    # Only the VGG layers of the job are read, and only if it needs them.
+    layers = args.style_layers + args.content_layers
+    if args.preview:
+        import adain
+        layers = layers + [adain.ENCODER_LAYER]
+    worker = style_worker.StyleTransferWorker(vgg_weights_path(), args.GPU, config, args.engine, not args.no_xla,
+                                              layers)
+    filename = worker.run_args(args, content_source, style_source, OUTPUT_DIR,
+                               events.emit if events is not None else None)['image']
     end_time = time.time()
     print("Time taken = ", end_time - start_time)
+    stage_timing.write_report(args.timing, args.trace)
+    if events is not None:
+        events.emit({'event': 'done', 'image': filename, 'output_dir': OUTPUT_DIR, 'seconds': end_time - start_time})
+        events.close()
+
+if __name__ == '__main__':
+    # style_worker.py and the modules it uses import this file as
+    # StyleTransfer; make that this module rather than a second copy, with
+    # its own parser and globals, that turns TF2 behavior off again.
+    sys.modules.setdefault('StyleTransfer', sys.modules[__name__])
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import fast_style
+import model
+import precompute_targets
+import target_cache
+import thread_tuning
+import utility
+
+'''
+Single pass previews for any style image, with adaptive instance
+normalization (AdaIN, Huang and Belongie 2017).
+
+fast_style.py needs a network trained for each style. Here VGG up to
+conv4_1 is a fixed encoder of both the content and the style image; the
+mean and standard deviation of each channel of the content features are
+replaced by those of the style features, and a decoder trained once, on
+content images and many style images, turns the result back into an image.
+That works for style images the decoder never saw, so a preview of any
+style takes one pass, while the full optimization is kept for final renders.
+
+Usage: python adain.py --styles "style dataset/images/" --contents shapenet_subset/screenshots/
+                       [--size 256] [--batch_size 4] [--steps 40000] [--shape_weight 0.01]
+
+The decoder is trained with the content and style losses of the paper, and
+the shape loss of StyleTransfer.py so glyph outlines stay intact. It is
+written to fast_style/adain_decoder.npz every --save_every steps and at the
+end. StyleTransfer.py --preview and worker jobs with "preview": true then use
+it, when the style has no fast_style.py network of its own.
+'''
+
+DECODER_PATH = os.path.join(fast_style.NETWORK_DIR, 'adain_decoder.npz')
+
+ENCODER_LAYER = 'conv4_1'
+# Layers whose channel statistics make the style loss.
+STYLE_LAYERS = ['conv1_1', 'conv2_1', 'conv3_1', 'conv4_1']
+
+# Layers of the decoder: name, output channels, and whether its input is
+# upsampled first. It mirrors VGG up to conv4_1.
+DECODER_LAYERS = [('decoder4_1', 256, False),
+                  ('decoder3_4', 256, True), ('decoder3_3', 256, False), ('decoder3_2', 256, False),
+                  ('decoder3_1', 128, False),
+                  ('decoder2_2', 128, True), ('decoder2_1', 64, False),
+                  ('decoder1_2', 64, True), ('decoder1_1', 3, False)]
+
+# The input is padded to a multiple of this, the total stride of the encoder.
+STRIDE = 8
+
+# content_dist_template caps the distance templates at this. The shape loss
+# divides them by it and averages over the pixels, to be on the scale of the
+# other losses.
+DIST_TEMPLATE_MAX = 2.0**30
+
+EPSILON = 1e-5
+
+
+def channel_statistics(features):
+    '''
+    The mean and standard deviation of each channel of each image.
+    '''
+    mean, variance = tf.nn.moments(features, axes=[1, 2], keepdims=True)
+    return mean, tf.sqrt(variance + EPSILON)
+
+
+def adaptive_instance_norm(content_features, style_features, alpha=1.0):
+    '''
+    The content features with the channel statistics of the style features;
+    alpha below 1 blends them with the content features themselves.
+    '''
+    content_mean, content_std = channel_statistics(content_features)
+    style_mean, style_std = channel_statistics(style_features)
+    target = (content_features - content_mean) / content_std * style_std + style_mean
+    return alpha * target + (1 - alpha) * content_features
+
+
+def decoder(features, get_weight):
+    '''
+    Turn encoder features back into a batch of model input images.
+    get_weight(name, shape) returns each weight: fast_style.new_weight while
+    training, the saved values after.
+    '''
+    x = features
+    for name, channels, upsample in DECODER_LAYERS:
+        if upsample:
+            x = tf.image.resize(x, tf.shape(x)[1:3] * 2, method=tf.image.ResizeMethod.NEAREST_NEIGHBOR)
+        W = get_weight(name + '_W', (3, 3, int(x.shape[3]), channels))
+        x = tf.pad(x, [[0, 0], [1, 1], [1, 1], [0, 0]], mode='REFLECT')
+        x = tf.nn.conv2d(x, W, strides=(1, 1, 1, 1), padding='VALID') + get_weight(name + '_b', (channels,))
+        if name != DECODER_LAYERS[-1][0]:
+            x = tf.nn.relu(x)
+    return x
+
+
+def build_training_graph(vgg_weights, size, batch_size, args):
+    '''
+    The graph training the decoder: content images, their distance
+    templates and style images are fed, and the losses are averaged over the
+    batch.
+    '''
+    shape = (batch_size, size, size, StyleTransfer.COLOR_CHANNELS)
+    content = tf.placeholder(tf.float32, shape)
+    style = tf.placeholder(tf.float32, shape)
+    dist_template = tf.placeholder(tf.float32, shape[:3])
+
+    content_features = model.vgg_layers(content, vgg_weights, [ENCODER_LAYER])[ENCODER_LAYER]
+    style_net = model.vgg_layers(style, vgg_weights, STYLE_LAYERS)
+    target = adaptive_instance_norm(content_features, style_net[ENCODER_LAYER])
+    with tf.variable_scope('decoder'):
+        stylized = decoder(target, fast_style.new_weight)
+    net = model.vgg_layers(stylized, vgg_weights, STYLE_LAYERS)
+    net['input'] = stylized
+
+    graph = {'content': content, 'style': style, 'dist_template': dist_template, 'stylized': stylized}
+    # The features of the stylized image should be those given to the decoder.
+    graph['content_loss'] = tf.reduce_mean(tf.square(net[ENCODER_LAYER] - target))
+    style_loss = 0
+    for name in STYLE_LAYERS:
+        for stylized_statistic, style_statistic in zip(channel_statistics(net[name]), channel_statistics(style_net[name])):
+            style_loss += tf.reduce_mean(tf.norm(tf.reshape(stylized_statistic - style_statistic, (batch_size, -1)), axis=1))
+    graph['style_loss'] = style_loss
+    template = dist_template / DIST_TEMPLATE_MAX
+    shape_target = tf.image.rgb_to_grayscale(content)[:, :, :, 0] * template
+    graph['shape_loss'] = tf.reduce_mean(StyleTransfer.shape_loss_func(net, template, shape_target)) / size**2
+    graph['total_loss'] = (args.content_weight * graph['content_loss'] + args.style_weight * graph['style_loss']
+                           + args.shape_weight * graph['shape_loss'])
+    graph['variables'] = tf.trainable_variables('decoder')
+    graph['train_step'] = tf.train.AdamOptimizer(args.learning_rate).minimize(graph['total_loss'],
+                                                                              var_list=graph['variables'])
+    return graph
+
+
+def style_batch(paths, rng, size, batch_size):
+    '''
+    A random batch of style images at the training size.
+    '''
+    return np.concatenate([utility.load_image(paths[n], size, size, invert=StyleTransfer.style_invert)
+                           for n in rng.choice(len(paths), batch_size)])
+
+
+def save_decoder(path, weights, vgg_weights):
+    '''
+    Write the weights of a decoder, a dict from name to array, with the
+    fingerprint of the VGG weights of its encoder.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    target_cache.save_npz(path, weights_id=model.weights_fingerprint(vgg_weights), **weights)
+
+
+class AdaINNetwork:
+    """The encoder and a trained decoder in a graph and session of their own, stylizing images of any size."""
+
+    def __init__(self, path, vgg_weights, config=None):
+        with np.load(path) as data:
+            if str(data['weights_id']) != model.weights_fingerprint(vgg_weights):
+                raise ValueError("the decoder %s was trained with other VGG weights" % path)
+            weights = {name: data[name] for name in data.files if name != 'weights_id'}
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            shape = (1, None, None, StyleTransfer.COLOR_CHANNELS)
+            self.content = tf.placeholder(tf.float32, shape)
+            self.style = tf.placeholder(tf.float32, shape)
+            self.alpha = tf.placeholder_with_default(1.0, ())
+            encode = lambda image: model.vgg_layers(image, vgg_weights, [ENCODER_LAYER])[ENCODER_LAYER]
+            target = adaptive_instance_norm(encode(self.content), encode(self.style), self.alpha)
+            self.output = decoder(target, lambda name, shape: tf.constant(weights[name]))
+        self.graph.finalize()
+        self.sess = tf.Session(graph=self.graph, config=config)
+
+    def stylize(self, content_image, style_image, alpha=1.0):
+        """Return the content image, [1, h, w, 3] in the model input, in the style of the style image."""
+        def pad(image):
+            return np.pad(image, [(0, 0), (0, -image.shape[1] % STRIDE), (0, -image.shape[2] % STRIDE), (0, 0)],
+                          mode='reflect')
+        height, width = content_image.shape[1:3]
+        stylized = self.sess.run(self.output, {self.content: pad(content_image), self.style: pad(style_image),
+                                               self.alpha: alpha})
+        return stylized[:, :height, :width]
+
+    def close(self):
+        self.sess.close()
+
+
+def preview_job(network, content_path, style_path, height, width, args, output_dir):
+    '''
+    Stylize the content image of a StyleTransfer.py job with an AdaINNetwork
+    and write it as its final image. Returns the file name.
+    '''
+    content_image = utility.load_image(content_path, height, width, invert=StyleTransfer.content_invert)
+    style_image = utility.load_image(style_path, height, width, invert=StyleTransfer.style_invert)
+    return StyleTransfer.save_final_image(network.stylize(content_image, style_image, args.adain_alpha), args,
+                                          output_dir)
+
+
+def train(content_paths, style_paths, vgg_weights, args, config=None):
+    '''
+    Train the decoder for args.steps steps, saving it every args.save_every steps and at the end.
+    '''
+    # The distance template of each content image is computed once, as in fast_style.train.
+    templates = fast_style.DistTemplates(args.size, StyleTransfer.open_content_cache(args))
+    rng = np.random.RandomState(args.seed)
+    with tf.Graph().as_default():
+        graph = build_training_graph(vgg_weights, args.size, args.batch_size, args)
+        names = [variable.op.name[len('decoder/'):] for variable in graph['variables']]
+        with tf.Session(config=config) as sess:
+            sess.run(tf.global_variables_initializer())
+            start_time = time.time()
+            for step in range(1, args.steps + 1):
+                content, dist_template = fast_style.content_batch(content_paths, rng, args.size, args.batch_size,
+                                                                 templates)
+                style = style_batch(style_paths, rng, args.size, args.batch_size)
+                _, losses = sess.run([graph['train_step'], {name: graph[name] for name in StyleTransfer.LOSS_NAMES}],
+                                     {graph['content']: content, graph['style']: style,
+                                      graph['dist_template']: dist_template})
+                if step % args.print_every == 0:
+                    print("Step %d, %.2f s/step: %s" % (step, (time.time() - start_time) / step,
+                                                        ', '.join('%s %.4g' % item for item in losses.items())))
+                if step % args.save_every == 0 or step == args.steps:
+                    save_decoder(args.decoder, dict(zip(names, sess.run(graph['variables']))), vgg_weights)
+    print("Saved %s" % args.decoder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the AdaIN decoder for single pass previews of any style')
+    parser.add_argument('--styles', type=str, required=True, help='folder of style images, searched recursively')
+    parser.add_argument('--contents', type=str, required=True, help='folder of content images, searched recursively')
+    parser.add_argument('--size', type=int, default=256, help='side of the square training images, a multiple of 8')
+    parser.add_argument('--batch_size', type=int, default=4, help='content and style images per step')
+    parser.add_argument('--steps', type=int, default=40000, help='training steps')
+    parser.add_argument('--learning_rate', type=float, default=1e-4, help='learning rate of Adam')
+    parser.add_argument('--content_weight', type=float, default=1.0, help='content loss weight')
+    parser.add_argument('--style_weight', type=float, default=10.0, help='style loss weight')
+    parser.add_argument('--shape_weight', type=float, default=0.01, help='shape loss weight, 0 to leave it out')
+    parser.add_argument('--decoder', type=str, default=DECODER_PATH, help='file the decoder is saved to')
+    parser.add_argument('--save_every', type=int, default=500, help='save the decoder every this many steps')
+    parser.add_argument('--print_every', type=int, default=50, help='print the losses every this many steps')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the order of the images')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument("--content_cache", type=str, default=StyleTransfer.CONTENT_CACHE_DIR, help="folder for cached distance templates")
+    parser.add_argument("--content_cache_mb", type=int, default=StyleTransfer.CONTENT_CACHE_MB, help="size limit of the content cache in MB")
+    parser.add_argument("--no_content_cache", help="always compute the distance templates", action="store_true")
+    parser.add_argument("--intra_op_threads", type=int, default=0, help="threads used inside one op, 0 for the TensorFlow default")
+    parser.add_argument("--inter_op_threads", type=int, default=0, help="ops run at once, 0 for the TensorFlow default")
+    args = parser.parse_args()
+    if args.size % STRIDE:
+        parser.error("--size must be a multiple of %d" % STRIDE)
+
+    content_paths = precompute_targets.image_paths(args.contents, recursive=True)
+    style_paths = precompute_targets.image_paths(args.styles, recursive=True)
+    if not content_paths or not style_paths:
+        parser.error("no images in %s" % (args.contents if not content_paths else args.styles))
+
+    config = thread_tuning.session_config(args.intra_op_threads, args.inter_op_threads)
+    vgg_weights = model.load_vgg_weights(args.VGG_MODEL or StyleTransfer.vgg_weights_path(), STYLE_LAYERS)
+    print("Training the decoder on %d content and %d style images" % (len(content_paths), len(style_paths)))
+    train(content_paths, style_paths, vgg_weights, args, config)
@@ -0,0 +1,93 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from StyleTransfer import tf
+import adain
+import fast_style
+import model
+
+SIZE = 32
+
+
+class AdaptiveInstanceNormTestCase(unittest.TestCase):
+
+    def test_takes_the_style_statistics(self):
+        rng = np.random.RandomState(0)
+        content = rng.randn(2, 4, 5, 3).astype(np.float32) * 3 + 1
+        style = rng.randn(2, 6, 6, 3).astype(np.float32) * 5 - 2
+        with tf.Graph().as_default(), tf.Session() as sess:
+            result, blended = sess.run([adain.adaptive_instance_norm(content, style),
+                                        adain.adaptive_instance_norm(content, style, alpha=0.0)])
+        np.testing.assert_allclose(style.mean(axis=(1, 2)), result.mean(axis=(1, 2)), rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(style.std(axis=(1, 2)), result.std(axis=(1, 2)), rtol=1e-3)
+        np.testing.assert_allclose(content, blended, rtol=1e-5)
+
+
+class DecoderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        rng = np.random.RandomState(0)
+        self.style_paths = []
+        for n in range(2):
+            self.style_paths.append(os.path.join(self.folder, 'style%d.png' % n))
+            cv2.imwrite(self.style_paths[-1], rng.randint(0, 256, (SIZE, SIZE, 3)).astype(np.uint8))
+        # A white disc on black, like the logos.
+        self.content_path = os.path.join(self.folder, 'disc.png')
+        disc = np.zeros((SIZE, SIZE, 3), np.uint8)
+        cv2.circle(disc, (SIZE // 2, SIZE // 2), SIZE // 3, (255, 255, 255), -1)
+        cv2.imwrite(self.content_path, disc)
+        self.args = argparse.Namespace(content_weight=1.0, style_weight=10.0, shape_weight=0.01, learning_rate=1e-3)
+        self.vgg_weights = model.random_vgg_weights(adain.STYLE_LAYERS)
+        self.path = os.path.join(self.folder, 'decoder.npz')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def train(self, steps):
+        """Train and save a decoder; returns the total loss of each step, and the last batch and its output."""
+        rng = np.random.RandomState(0)
+        with tf.Graph().as_default():
+            graph = adain.build_training_graph(self.vgg_weights, SIZE, 2, self.args)
+            names = [variable.op.name[len('decoder/'):] for variable in graph['variables']]
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                losses = []
+                for _ in range(steps):
+                    content, dist_template = fast_style.content_batch([self.content_path], rng, SIZE, 2)
+                    feed = {graph['content']: content, graph['dist_template']: dist_template,
+                            graph['style']: adain.style_batch(self.style_paths, rng, SIZE, 2)}
+                    losses.append(sess.run([graph['train_step'], graph['total_loss']], feed)[1])
+                adain.save_decoder(self.path, dict(zip(names, sess.run(graph['variables']))), self.vgg_weights)
+                stylized = sess.run(graph['stylized'], feed)
+        return losses, content, feed[graph['style']], stylized
+
+    def test_training_lowers_the_loss(self):
+        losses, _, _, _ = self.train(10)
+        self.assertTrue(np.isfinite(losses).all())
+        self.assertLess(losses[-1], losses[0])
+
+    def test_saved_decoder_stylizes_any_size(self):
+        _, content, style, stylized = self.train(1)
+        network = adain.AdaINNetwork(self.path, self.vgg_weights)
+        try:
+            np.testing.assert_allclose(stylized[:1], network.stylize(content[:1], style[:1]), rtol=1e-4, atol=1e-2)
+            odd_size = np.random.RandomState(1).rand(1, 30, 45, 3).astype(np.float32) * 255 - 128
+            self.assertEqual((1, 30, 45, 3), network.stylize(odd_size, style[:1, :20], alpha=0.5).shape)
+        finally:
+            network.close()
+
+    def test_decoder_of_other_weights_refused(self):
+        self.train(1)
+        with self.assertRaises(ValueError):
+            adain.AdaINNetwork(self.path, model.random_vgg_weights(adain.STYLE_LAYERS, seed=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import fast_style
+import model
+import style_worker
+import thread_tuning
+
+'''
+Run a list of style transfer jobs, several of them at once in one graph.
+
+Usage: python batch_style_transfer.py --jobs jobs.json [--batch_size 4] [--GPU]
+
+jobs.json holds a JSON list of jobs, or one job per line, in the format of
+worker_client.py. Jobs are grouped by image size and layers, and each group
+is optimized batch_size jobs at a time: their images are stacked in one input
+and their losses summed, so the convolutions run on the whole batch. Each job
+keeps its own targets, loss weights, epoch and early stopping, and writes its
+snapshots to its own output folder, like a single StyleTransfer.py run. A
+job that stops early is frozen at its final image while the rest go on.
+
+Batches run Adam only on the v1 engine, without the pyramid, tiles, previews,
+checkpoints, warm starts, style networks or the result cache; jobs asking for
+those are rejected, run them with StyleTransfer.py. Every job needs
+"no_warm_start": true, and a job whose style has a style network
+"no_fast_style": true, to be optimized here.
+'''
+
+
+def load_jobs(path):
+    '''
+    Read the jobs from a JSON list, or a file with one JSON job per line.
+    '''
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def unsupported_options(job, args):
+    '''
+    Return the names of the options of a job that run_batch doesn't honour.
+    The engine isn't one of them, as style_worker.job_args refuses it.
+    '''
+    options = []
+    if args.optimizer != 'adam':
+        options.append('optimizer')
+    for name in ('pyramid', 'tile', 'preview', 'resume', 'checkpoint_every'):
+        if getattr(args, name) != StyleTransfer.parser.get_default(name):
+            options.append(name)
+    if not args.no_warm_start:
+        options.append('warm start')
+    if not args.no_fast_style and os.path.exists(fast_style.network_name(args.STYLE_IMAGE, args.fast_style_dir)):
+        options.append('style network')
+    if not args.no_result_cache and ('result_cache' in job or 'result_cache_mb' in job):
+        options.append('result_cache')
+    return options
+
+
+def group_jobs(jobs):
+    '''
+    Parse the jobs and group them by the graph they need. Returns a dict from
+    (height, width, style layers, content layers, precision) to a list of (args, output folder).
+    Raises ValueError for a job with options batches don't support.
+    '''
+    groups = {}
+    for job in jobs:
+        args = style_worker.job_args(job)
+        options = unsupported_options(job, args)
+        if options:
+            raise ValueError("batched jobs don't support %s: %r" % (', '.join(options), job))
+        key = StyleTransfer.image_size(args, args.CONTENT_IMAGE) + (tuple(args.style_layers), tuple(args.content_layers),
+                                                                       args.precision)
+        groups.setdefault(key, []).append((args, style_worker.job_output_dir(job, args)))
+    return groups
+
+
+def run_batch(sess, graph, target_graph, jobs):
+    '''
+    Optimize up to graph['batch_size'] jobs together. jobs is a list of
+    (args, output folder); target_graph is a batch size 1 graph of the same
+    size and layers in the same session, used to compute the targets the
+    caches don't have. Returns the file name of the last snapshot of each job.
+    '''
+    net = graph['model']
+    all_args = [args for args, output_dir in jobs]
+    content_targets = [StyleTransfer.load_content_targets(sess, target_graph, args.CONTENT_IMAGE,
+                                                          StyleTransfer.open_content_cache(args)) for args in all_args]
+    style_grams = [StyleTransfer.load_style_grams(sess, target_graph, args.STYLE_IMAGE,
+                                                  StyleTransfer.open_style_cache(args)) for args in all_args]
+    StyleTransfer.set_batch_targets(sess, graph, content_targets, style_grams, all_args)
+
+    # Content images as input images
+    sess.run(graph['reset_optimizer'])
+    active = [True] * len(jobs)
+    if 'active' in graph:
+        graph['active'].load(np.float32(active), sess)
+    net['input'].load(np.concatenate([targets['content_image'] for targets in content_targets]), sess)
+
+    stopping = [StyleTransfer.early_stopping_policy(args) for args in all_args]
+    writers = [StyleTransfer.open_snapshot_writer(output_dir, args) for args, output_dir in jobs]
+    filenames = [None] * len(jobs)
+    fetches = {'train_step': graph['train_step'], 'losses': graph['sample_losses']}
+    for it in range(max(args.epoch for args in all_args) + 1):
+        losses = sess.run(fetches)['losses']
+
+        snapshots = [active[n] and writers[n].due(it) for n in range(len(jobs))]
+        mixed_image = None
+        if any(snapshots[n] or active[n] and (stopping[n].needs_image(it) or it == jobs[n][0].epoch)
+               for n in range(len(jobs))):
+            mixed_image = sess.run(net['input'])
+
+        for n, (args, output_dir) in enumerate(jobs):
+            if not active[n]:
+                continue
+            image = mixed_image[n:n+1] if mixed_image is not None else None
+            stop = stopping[n].update(it, losses['total_loss'][n], image)
+            if it == args.epoch and not stop:
+                stop = True
+                stopping[n].reason = "epoch reached"
+            if snapshots[n] or stop:
+                if image is None:
+                    mixed_image = sess.run(net['input'])
+                    image = mixed_image[n:n+1]
+                print("Job %d:" % n, output_dir)
+                job_losses = {name: losses[name][n] for name in StyleTransfer.LOSS_NAMES}
+                filenames[n] = StyleTransfer.save_snapshot(it, image, job_losses, args, writers[n],
+                                                           final=stop) or filenames[n]
+            if stop:
+                print("Job %d stopped at iteration %d: %s" % (n, it, stopping[n].reason))
+                active[n] = False
+                writers[n].close()
+                # It stays in the batch until all the jobs have stopped,
+                # frozen at the image saved for it.
+                if 'active' in graph:
+                    graph['active'].load(np.float32(active), sess)
+        if not any(active):
+            break
+    return filenames
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run style transfer jobs in batches')
+    parser.add_argument('--jobs', type=str, required=True, help='JSON file with the list of jobs')
+    parser.add_argument('--batch_size', type=int, default=4, help='Number of jobs to optimize together')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument("--GPU", "-GPU", help="Use GPU", action="store_true")
+    parser.add_argument("--intra_op_threads", type=int, default=0, help="threads used inside one op, 0 for the TensorFlow default")
+    parser.add_argument("--inter_op_threads", type=int, default=0, help="ops run at once, 0 for the TensorFlow default")
+    parser.add_argument("--cpus", type=thread_tuning.cpu_list, default=None, help="run only on these CPUs, e.g. 0-7")
+    args = parser.parse_args()
+
+    try:
+        groups = group_jobs(load_jobs(args.jobs))
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.cpus:
+        thread_tuning.set_cpu_affinity(args.cpus)
+    config = thread_tuning.session_config(args.intra_op_threads, args.inter_op_threads)
+
+    start_time = time.time()
+    vgg_weights = model.load_vgg_weights(args.VGG_MODEL or StyleTransfer.vgg_weights_path())
+    device = "/gpu:0" if args.GPU else "/cpu:0"
+    count = 0
+    # (height, width, style layers, content layers, precision, batch size) -> (session, batch graph, target graph)
+    sessions = {}
+    for (height, width, style_layers, content_layers, precision), jobs in groups.items():
+        for start in range(0, len(jobs), args.batch_size):
+            batch = jobs[start:start + args.batch_size]
+            key = (height, width, style_layers, content_layers, precision, len(batch))
+            if key not in sessions:
+                tf_graph = tf.Graph()
+                with tf_graph.as_default(), tf.device(device):
+                    target_graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width,
+                                                                            list(style_layers), list(content_layers),
+                                                                            precision=precision)
+                    graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, list(style_layers),
+                                                                     list(content_layers), batch_size=len(batch),
+                                                                     precision=precision)
+                    init = tf.global_variables_initializer()
+                tf_graph.finalize()
+                sess = tf.Session(graph=tf_graph, config=config)
+                sess.run(init)
+                sessions[key] = (sess, graph, target_graph)
+            sess, graph, target_graph = sessions[key]
+            print("Batch of %d jobs at %dx%d" % (len(batch), width, height))
+            run_batch(sess, graph, target_graph, batch)
+            count += len(batch)
+
+    seconds = time.time() - start_time
+    print("%d jobs in %.1f seconds, %.1f per hour" % (count, seconds, count * 3600 / seconds))
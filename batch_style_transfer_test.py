@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+import batch_style_transfer
+import fast_style
+import model
+import StyleTransfer
+from StyleTransfer import tf
+import test_fixtures
+import utility
+
+SIZE = 32
+
+
+class BatchStyleTransferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.content_path, self.style_path = test_fixtures.write_test_images(self.folder, (SIZE, SIZE), (SIZE, SIZE))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def job(self, name, **values):
+        return dict({'CONTENT_IMAGE': self.content_path, 'STYLE_IMAGE': self.style_path, 'IMAGE_WIDTH': SIZE,
+                     'IMAGE_HEIGHT': SIZE, 'no_style_cache': True, 'no_content_cache': True, 'no_warm_start': True,
+                     'fast_style_dir': os.path.join(self.folder, 'fast_style'), 'snapshot_format': 'png',
+                     'output_dir': os.path.join(self.folder, name)}, **values)
+
+    def test_rejects_options_batches_ignore(self):
+        options = [{'optimizer': 'lbfgs'}, {'pyramid': 2}, {'tile': 16}, {'preview': True},
+                   {'resume': True}, {'checkpoint_every': 100}, {'result_cache': os.path.join(self.folder, 'results')}]
+        for values in options:
+            with self.assertRaisesRegex(ValueError, "don't support %s" % list(values)[0]):
+                batch_style_transfer.group_jobs([self.job('a'), self.job('b', **values)])
+        with self.assertRaisesRegex(ValueError, "don't support warm start"):
+            batch_style_transfer.group_jobs([self.job('a'), self.job('b', no_warm_start=False)])
+        with self.assertRaisesRegex(ValueError, "'engine' is set when the worker starts"):
+            batch_style_transfer.group_jobs([self.job('a'), self.job('b', engine='tf2')])
+
+        # A style with a network only when the job would use it.
+        network_path = fast_style.network_name(self.style_path, os.path.join(self.folder, 'fast_style'))
+        os.makedirs(os.path.dirname(network_path))
+        open(network_path, 'wb').close()
+        with self.assertRaisesRegex(ValueError, "don't support style network"):
+            batch_style_transfer.group_jobs([self.job('a')])
+        groups = batch_style_transfer.group_jobs([self.job('a', no_fast_style=True),
+                                                  self.job('b', no_fast_style=True, alpha=0.01)])
+        self.assertEqual([(SIZE, SIZE)], [key[:2] for key in groups])
+        self.assertEqual(2, len(list(groups.values())[0]))
+
+    def test_stopped_job_is_frozen(self):
+        groups = batch_style_transfer.group_jobs([self.job('short', epoch=2), self.job('long', epoch=6)])
+        (key, jobs), = groups.items()
+        height, width, style_layers, content_layers, precision = key
+        vgg_weights = model.random_vgg_weights()
+        with tf.Graph().as_default():
+            target_graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, list(style_layers),
+                                                                    list(content_layers), precision=precision)
+            graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, list(style_layers),
+                                                             list(content_layers), batch_size=2, precision=precision)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                filenames = batch_style_transfer.run_batch(sess, graph, target_graph, jobs)
+                images = sess.run(graph['model']['input'])
+
+        self.assertEqual(['2.png', '6.png'], [os.path.basename(filename) for filename in filenames])
+        short = cv2.imread(os.path.join(self.folder, 'short', '2.png'))
+        frozen = utility.to_pixels(images[0:1], StyleTransfer.result_invert)
+        np.testing.assert_array_equal(frozen, short)
+
+
+if __name__ == '__main__':
+    unittest.main()
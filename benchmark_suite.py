@@ -0,0 +1,315 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import StyleTransfer
+import engine_benchmark
+import model
+import stage_timing
+import style_worker
+import thread_tuning
+
+'''
+Reproducible benchmark of the style transfer engine that runs anywhere,
+without the VGG weights file or any input images.
+
+Usage: python benchmark_suite.py [--widths 150 300 600] [--threads 1 4]
+                                 [--engine v1 tf2] [--json results/abc123.json]
+                                 [--baseline results/def456.json]
+                                 [--optimizers adam lbfgs] [--quality 0.1]
+
+Everything a run needs is made up: the content image is a glyph rendered
+from fonts/, black on white like the cropped logos, the style image is a
+procedural texture (stripes, noise or dots), and the VGG weights are
+model.random_vgg_weights, with the shapes and layer names of the real ones.
+All of it is seeded, so runs on different commits do the same work.
+
+Each combination of width, thread count, engine and precision runs in a
+process of its own, so its peak memory is its own and the tf2 engine can
+turn on TF2 behavior. A run measures:
+ * first_frame_seconds: building the graph, the targets, the first Adam
+   iteration and fetching its image, what a user waits for before the first
+   snapshot, less loading the weights and starting Python;
+ * iterations_per_second over --epoch iterations after the first;
+ * peak_rss_mb, the peak memory of the process, None on Windows.
+
+The JSON results hold the commit, the machine and the settings with them;
+--baseline prints the change in iterations per second against an earlier
+results file for the combinations both have.
+
+--optimizers also races the optimizers of StyleTransfer.py --optimizer at
+each width, on the v1 engine with the most threads given. Each runs from the
+content image for --optimizer_epoch iterations, and the report gives the
+iterations and seconds it took to bring the total loss down to --quality
+times the loss of the content image, None if it never did, and its final
+loss. An L-BFGS iteration costs one or more loss evaluations, so the
+seconds are the fairer comparison.
+'''
+
+# Procedural style textures, see style_image.
+STYLES = ('stripes', 'noise', 'dots')
+
+
+def glyph_image(text, font_path, size):
+    '''
+    Return a size x size uint8 BGR image of text in black on white, filling
+    most of the image like a cropped logo.
+    '''
+    image = Image.new('RGB', (size, size), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(font_path, size)
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    # Scale the font so the glyph spans 80% of the larger side.
+    font = ImageFont.truetype(font_path, max(1, int(size * size * 0.8 / max(right - left, bottom - top))))
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    draw.text(((size - (right - left)) / 2 - left, (size - (bottom - top)) / 2 - top), text, (0, 0, 0), font=font)
+    return np.array(image)[:, :, ::-1].copy()
+
+
+def style_image(name, size, seed=0):
+    '''
+    Return a size x size uint8 BGR procedural texture: zebra like 'stripes',
+    smooth colored 'noise', or random 'dots'.
+    '''
+    rng = np.random.RandomState(seed)
+    if name == 'stripes':
+        y, x = np.mgrid[0:size, 0:size] / size
+        angle = rng.uniform(0, np.pi)
+        wobble = cv2.resize(rng.rand(4, 4), (size, size), interpolation=cv2.INTER_CUBIC)
+        phase = 12 * np.pi * (x * np.cos(angle) + y * np.sin(angle) + 0.1 * wobble)
+        gray = (np.sin(phase) > 0) * 255
+        return np.repeat(gray[:, :, np.newaxis], 3, axis=2).astype(np.uint8)
+    if name == 'noise':
+        image = np.zeros((size, size, 3))
+        for cells in (4, 8, 16, 32):
+            image += cv2.resize(rng.rand(cells, cells, 3), (size, size), interpolation=cv2.INTER_CUBIC) / cells
+        image = (image - image.min()) / (image.max() - image.min())
+        return (image * 255).astype(np.uint8)
+    if name == 'dots':
+        image = np.full((size, size, 3), rng.randint(0, 256, 3), np.uint8)
+        for _ in range(size // 4):
+            center = tuple(int(value) for value in rng.randint(0, size, 2))
+            color = tuple(int(value) for value in rng.randint(0, 256, 3))
+            cv2.circle(image, center, int(rng.randint(2, max(3, size // 12))), color, -1)
+        return image
+    raise ValueError("unknown style %r, expected one of %s" % (name, ', '.join(STYLES)))
+
+
+def model_input(pixels, invert):
+    '''
+    Turn a uint8 image into the model input, like utility.load_image.
+    '''
+    image = pixels.astype(np.float32)
+    if invert == 1:
+        image = 255.0 - image
+    return image[np.newaxis] - StyleTransfer.MEAN_VALUES.astype(np.float32)
+
+
+def run_config(config, args):
+    '''
+    Time one combination of the settings, see the module documentation.
+    config has the 'width', 'threads', 'engine' and 'precision'.
+    '''
+    engine, jit_compile = engine_benchmark.ENGINES[config['engine']]
+    session_config = thread_tuning.session_config(config['threads'], 1)
+    if engine == 'tf2':
+        import tf2_engine
+        tf2_engine.enable(session_config)
+    width = config['width']
+    vgg_weights = model.random_vgg_weights(args.style_layers + args.content_layers, seed=args.seed)
+    content_image = model_input(glyph_image(args.text, args.font, width), StyleTransfer.content_invert)
+    style = model_input(style_image(args.style, width, args.seed), StyleTransfer.style_invert)
+
+    start_time = time.time()
+    if engine == 'tf2':
+        sess = None
+        graph = tf2_engine.build_style_transfer_function(vgg_weights, width, width, args.style_layers,
+                                                         args.content_layers, config['precision'],
+                                                         jit_compile=jit_compile)
+    else:
+        tf = StyleTransfer.tf
+        graph = StyleTransfer.build_style_transfer_graph(vgg_weights, width, width, args.style_layers,
+                                                         args.content_layers, precision=config['precision'])
+        sess = tf.Session(config=session_config)
+        sess.run(tf.global_variables_initializer())
+    steps = StyleTransfer.optimizer_steps(sess, graph)
+    steps.set_targets(StyleTransfer.compute_content_targets(sess, graph, content_image),
+                      StyleTransfer.compute_style_grams(sess, graph, style), args)
+    steps.reset(content_image)
+    iteration_time = time.time()
+    steps.step()
+    first_iteration_seconds = time.time() - iteration_time
+    steps.image()
+    first_frame_seconds = time.time() - start_time
+
+    start_time = time.time()
+    for _ in range(args.epoch):
+        steps.step()
+    seconds = time.time() - start_time
+    if sess is not None:
+        sess.close()
+    return dict(config, height=width, first_frame_seconds=first_frame_seconds,
+                first_iteration_seconds=first_iteration_seconds, iterations_per_second=args.epoch / seconds,
+                peak_rss_mb=stage_timing.peak_rss_mb())
+
+
+class LossTrace:
+    """Stands in for a progress.ProgressTracker, keeping the seconds and total loss of each iteration."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.iterations = []
+
+    def update(self, iteration, losses):
+        self.iterations.append((iteration, time.time() - self.start_time, float(losses['total_loss'])))
+
+
+class NoSnapshots:
+    """Stands in for a snapshot_writer.SnapshotWriter, writing nothing."""
+
+    def due(self, it):
+        return False
+
+    def put(self, number, image, final=False, on_written=None):
+        return None
+
+
+def run_optimizer(config, args):
+    '''
+    Race one optimizer, see the module documentation. config has the
+    'width', 'threads' and 'optimizer'.
+    '''
+    tf = StyleTransfer.tf
+    width = config['width']
+    job_args = argparse.Namespace(**vars(args))
+    job_args.optimizer = config['optimizer']
+    job_args.epoch = args.optimizer_epoch
+    vgg_weights = model.random_vgg_weights(args.style_layers + args.content_layers, seed=args.seed)
+    content_image = model_input(glyph_image(args.text, args.font, width), StyleTransfer.content_invert)
+    style = model_input(style_image(args.style, width, args.seed), StyleTransfer.style_invert)
+    with tf.Graph().as_default():
+        graph = StyleTransfer.build_style_transfer_graph(vgg_weights, width, width, args.style_layers,
+                                                         args.content_layers)
+        with tf.Session(config=thread_tuning.session_config(config['threads'], 1)) as sess:
+            sess.run(tf.global_variables_initializer())
+            content_targets = StyleTransfer.compute_content_targets(sess, graph, content_image)
+            style_grams = StyleTransfer.compute_style_grams(sess, graph, style)
+            trace = LossTrace()
+            StyleTransfer.run_style_transfer(sess, graph, content_targets, style_grams, job_args, NoSnapshots(),
+                                             progress=trace)
+    target_loss = args.quality * trace.iterations[0][2]
+    reached = [(iteration, seconds) for iteration, seconds, loss in trace.iterations if loss <= target_loss]
+    iterations_to_quality, seconds_to_quality = reached[0] if reached else (None, None)
+    return dict(config, height=width, iterations=trace.iterations[-1][0], seconds=trace.iterations[-1][1],
+                final_loss=trace.iterations[-1][2], target_loss=target_loss,
+                iterations_to_quality=iterations_to_quality, seconds_to_quality=seconds_to_quality)
+
+
+def git_commit():
+    '''
+    Return the commit of the working tree, with '-dirty' if it has changes, or None outside git.
+    '''
+    folder = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=folder, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=folder,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if changes else '')
+
+
+def config_name(result):
+    return '%dpx %d threads %s %s' % (result['width'], result['threads'], result['engine'], result['precision'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the style transfer engine with made up images and weights')
+    parser.add_argument('--widths', type=int, nargs='+', default=[150, 300, 600], help='square image sizes to time')
+    parser.add_argument('--threads', type=int, nargs='+', default=None,
+                        help='TensorFlow intra op thread counts to time, 1 and all the CPUs by default')
+    parser.add_argument('--engine', type=str, nargs='+', choices=sorted(engine_benchmark.ENGINES), default=['v1'],
+                        help='engines to time, see engine_benchmark.py')
+    parser.add_argument('--precision', type=str, nargs='+', choices=sorted(StyleTransfer.PRECISIONS),
+                        default=['float32'], help='precisions of the VGG layers to time')
+    parser.add_argument('--epoch', type=int, default=20, help='Adam iterations timed after the first')
+    parser.add_argument('--text', type=str, default='A', help='glyph of the content image')
+    parser.add_argument('--font', type=str, default=os.path.join('fonts', 'Roboto', 'Roboto-Bold.ttf'),
+                        help='font of the glyph')
+    parser.add_argument('--style', type=str, default='stripes', choices=STYLES, help='procedural style image')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the weights and the style image')
+    parser.add_argument('--json', type=str, default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=None, help='results JSON of an earlier run to compare with')
+    parser.add_argument('--optimizers', type=str, nargs='+', choices=['adam', 'lbfgs'], default=[],
+                        help='also race these optimizers to --quality at each width')
+    parser.add_argument('--optimizer_epoch', type=int, default=200, help='iterations of each optimizer raced')
+    parser.add_argument('--quality', type=float, default=0.1,
+                        help='fraction of the loss of the content image the optimizers race to')
+    args = parser.parse_args()
+
+    # The StyleTransfer.py defaults for the layers and loss weights.
+    job_args = style_worker.job_args({'epoch': args.epoch})
+    for name in ('epoch', 'text', 'font', 'style', 'seed', 'optimizer_epoch', 'quality'):
+        setattr(job_args, name, getattr(args, name))
+    cpu_count = thread_tuning.available_cpus()
+    threads = args.threads or sorted({1, cpu_count})
+    configs = [{'width': width, 'threads': thread_count, 'engine': engine, 'precision': precision}
+               for width in args.widths for thread_count in threads for engine in args.engine
+               for precision in args.precision]
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for config in configs:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_config, (config, job_args))
+        peak = '%6.0f MB' % result['peak_rss_mb'] if result['peak_rss_mb'] is not None else 'unknown'
+        print("%-32s first frame %6.2f s, %7.2f it/s, peak %s"
+              % (config_name(result), result['first_frame_seconds'], result['iterations_per_second'], peak))
+        results.append(result)
+
+    optimizers = []
+    for width in args.widths:
+        for optimizer in args.optimizers:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_optimizer, ({'width': width, 'threads': max(threads),
+                                                     'optimizer': optimizer}, job_args))
+            if result['iterations_to_quality'] is None:
+                reached = 'not reached in %d iterations' % result['iterations']
+            else:
+                reached = 'reached in %d iterations, %.2f s' % (result['iterations_to_quality'],
+                                                               result['seconds_to_quality'])
+            print("%dpx %-5s loss %.3g %s, final loss %.3g after %.2f s"
+                  % (width, optimizer, result['target_loss'], reached, result['final_loss'], result['seconds']))
+            optimizers.append(result)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {config_name(result): result for result in json.load(f)['results']}
+        print("Against %s:" % args.baseline)
+        for result in results:
+            if config_name(result) in baseline:
+                before = baseline[config_name(result)]['iterations_per_second']
+                print("%-32s %7.2f -> %7.2f it/s, %+.1f%%" % (config_name(result), before,
+                                                              result['iterations_per_second'],
+                                                              100 * (result['iterations_per_second'] / before - 1)))
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or '.', exist_ok=True)
+        report = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                              'cpus': cpu_count, 'tensorflow': StyleTransfer.tf.__version__},
+                  'settings': {'epoch': args.epoch, 'text': args.text, 'font': args.font, 'style': args.style,
+                               'seed': args.seed, 'style_layers': job_args.style_layers,
+                               'content_layers': job_args.content_layers, 'optimizer_epoch': args.optimizer_epoch,
+                               'quality': args.quality},
+                  'results': results, 'optimizers': optimizers}
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+import numpy as np
+
+import benchmark_suite
+import style_worker
+
+FONT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts', 'Roboto', 'Roboto-Bold.ttf')
+
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+
+    def test_glyph_is_centered_black_on_white(self):
+        image = benchmark_suite.glyph_image('A', FONT, 64)
+        self.assertEqual((64, 64, 3), image.shape)
+        rows, columns = np.nonzero(image[:, :, 0] < 128)
+        self.assertGreater(len(rows), 64)
+        self.assertTrue(np.all(image[0] == 255))
+        # Fills most of the image, with the glyph in the middle.
+        self.assertGreater(rows.max() - rows.min(), 40)
+        self.assertLess(abs((rows.max() + rows.min()) / 2 - 31.5), 3)
+        self.assertLess(abs((columns.max() + columns.min()) / 2 - 31.5), 3)
+
+    def test_styles_are_seeded_textures(self):
+        for name in benchmark_suite.STYLES:
+            image = benchmark_suite.style_image(name, 48, seed=3)
+            self.assertEqual((48, 48, 3), image.shape)
+            self.assertEqual(np.uint8, image.dtype)
+            self.assertGreater(image.std(), 10)
+            np.testing.assert_array_equal(image, benchmark_suite.style_image(name, 48, seed=3))
+        self.assertRaises(ValueError, benchmark_suite.style_image, 'plaid', 48)
+
+    def test_run_config_measures(self):
+        args = style_worker.job_args({'epoch': 2})
+        args.text, args.font, args.style, args.seed = 'g', FONT, 'noise', 0
+        config = {'width': 32, 'threads': 1, 'engine': 'v1', 'precision': 'float32'}
+        result = benchmark_suite.run_config(config, args)
+        self.assertEqual(32, result['height'])
+        self.assertEqual('v1', result['engine'])
+        self.assertGreater(result['iterations_per_second'], 0)
+        self.assertGreaterEqual(result['first_frame_seconds'], result['first_iteration_seconds'])
+        self.assertGreater(result['peak_rss_mb'], 0)
+
+    def test_run_optimizer_races_to_the_quality(self):
+        args = style_worker.job_args({})
+        args.text, args.font, args.style, args.seed = 'g', FONT, 'noise', 0
+        args.optimizer_epoch, args.quality = 5, 0.9
+        results = {optimizer: benchmark_suite.run_optimizer({'width': 32, 'threads': 1, 'optimizer': optimizer}, args)
+                   for optimizer in ('adam', 'lbfgs')}
+        self.assertEqual(5, results['adam']['iterations'])
+        self.assertEqual(results['adam']['target_loss'], results['lbfgs']['target_loss'])
+        # The shape loss throws Adam off at first; L-BFGS works on a scaled image.
+        lbfgs = results['lbfgs']
+        self.assertLessEqual(lbfgs['iterations'], 5)
+        self.assertLess(lbfgs['final_loss'], lbfgs['target_loss'])
+        self.assertGreater(lbfgs['iterations_to_quality'], 0)
+        self.assertLessEqual(lbfgs['seconds_to_quality'], lbfgs['seconds'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+import target_cache
+
+'''
+Checkpoints of a running StyleTransfer.py job, so a job that dies can be
+resumed with --resume instead of starting over.
+
+A checkpoint is one .npz file in the output folder of the job holding the
+optimized image, the Adam slot variables, the pyramid level and iteration
+it was taken at, and a hash of everything the optimization depends on: the
+content and style files, the VGG weights and the job arguments, less those
+of run_args(). A checkpoint is only resumed when the hash matches, so another
+job writing to the same output folder never picks it up.
+'''
+
+CHECKPOINT_NAME = 'checkpoint.npz'
+
+# Besides StyleTransfer.RUN_ARGS, arguments that don't change the optimization
+# up to an iteration, so they may differ between a job and its resumption;
+# epoch can be raised to run the job for longer. Both engines take the same
+# steps and keep the same Adam slots.
+RESUME_ARGS = {'epoch', 'engine', 'no_xla', 'stop_plateau', 'stop_window', 'stop_pixel_delta', 'time_budget',
+               'snapshot_format', 'snapshot_quality', 'fast_style_dir', 'no_fast_style', 'adain_decoder',
+               'adain_alpha', 'no_warm_start'}
+
+
+def run_args():
+    '''
+    Return the names of the arguments a job and its resumption may differ in.
+    '''
+    # Imported here, as StyleTransfer uses this module.
+    import StyleTransfer
+    return StyleTransfer.RUN_ARGS | RESUME_ARGS
+
+
+def job_hash(args, content_path, style_path, weights_id):
+    '''
+    Return the hash identifying the optimization of a job.
+    '''
+    excluded = run_args()
+    fields = {name: value for name, value in vars(args).items() if name not in excluded}
+    return target_cache.make_key(args=fields, content=target_cache.file_hash(content_path),
+                                 style=target_cache.file_hash(style_path), weights=weights_id)
+
+
+class Checkpoint:
+    """The checkpoint file of one job, see the module documentation."""
+
+    def __init__(self, output_dir, job_hash, metadata=None):
+        self.path = os.path.join(output_dir, CHECKPOINT_NAME)
+        self.job_hash = job_hash
+        # Arrays describing the job, saved for warm_start.py.
+        self.metadata = metadata or {}
+
+    def save(self, level, iteration, image, slots):
+        """Store the image and the list of Adam slot values reached at a pyramid level and iteration."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        arrays = {'slot_%d' % n: slot for n, slot in enumerate(slots)}
+        arrays.update(self.metadata)
+        target_cache.save_npz(self.path, job_hash=self.job_hash, level=level, iteration=iteration, image=image,
+                              **arrays)
+
+    def load(self):
+        """
+        Return the saved state as a dict with 'level', 'iteration', 'image'
+        and 'slots', or None if there is no checkpoint for this job.
+        """
+        try:
+            with np.load(self.path) as data:
+                if str(data['job_hash']) != self.job_hash:
+                    print("Not resuming, the checkpoint in %s is for another job" % self.path)
+                    return None
+                slot_count = len([name for name in data.files if name.startswith('slot_')])
+                return {'level': int(data['level']), 'iteration': int(data['iteration']), 'image': data['image'],
+                        'slots': [data['slot_%d' % n] for n in range(slot_count)]}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def remove(self):
+        """Delete the checkpoint, once the job is done."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
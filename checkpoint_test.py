@@ -0,0 +1,49 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import checkpoint
+from checkpoint import Checkpoint
+
+
+class CheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.content_path = os.path.join(self.folder, 'content.png')
+        with open(self.content_path, 'wb') as f:
+            f.write(b'not really a png')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def job_hash(self, **args):
+        fields = dict(alpha=0.001, epoch=100, intra_op_threads=0)
+        fields.update(args)
+        return checkpoint.job_hash(argparse.Namespace(**fields), self.content_path, self.content_path, 'weights')
+
+    def test_save_and_load(self):
+        job_checkpoint = Checkpoint(self.folder, self.job_hash())
+        image = np.arange(12, dtype=np.float32).reshape(1, 2, 2, 3)
+        job_checkpoint.save(1, 500, image, [np.float32(0.9), image * 2])
+        state = job_checkpoint.load()
+        self.assertEqual((1, 500), (state['level'], state['iteration']))
+        np.testing.assert_array_equal(image, state['image'])
+        np.testing.assert_array_equal(image * 2, state['slots'][1])
+
+        job_checkpoint.remove()
+        self.assertIsNone(job_checkpoint.load())
+
+    def test_other_job_not_loaded(self):
+        image = np.zeros((1, 2, 2, 3), dtype=np.float32)
+        Checkpoint(self.folder, self.job_hash()).save(0, 100, image, [])
+        self.assertIsNone(Checkpoint(self.folder, self.job_hash(alpha=0.01)).load())
+        self.assertIsNotNone(Checkpoint(self.folder, self.job_hash(epoch=5000, intra_op_threads=4)).load())
+
+
+if __name__ == '__main__':
+    unittest.main()
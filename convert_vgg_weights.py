@@ -0,0 +1,37 @@
+import argparse
+import os
+import time
+
+import model
+
+'''
+Convert imagenet-vgg-verydeep-19.mat into the conv-only weight folder used by StyleTransfer.py.
+
+The .mat file is about 500 MB and most of it is the fully connected layers, which
+style transfer never uses, but scipy.io.loadmat reads all of it on every run.
+This writes only the 16 conv kernels and biases as .npy files plus an index, which
+model.load_vgg_weights memory maps instead, so only the conv layers a graph uses
+are read, when it is built. They are still copied into each graph as constants.
+
+Usage: python convert_vgg_weights.py [--VGG_MODEL imagenet-vgg-verydeep-19.mat] [--saveto imagenet-vgg-verydeep-19-conv]
+
+Run it once; StyleTransfer.py and style_worker.py use the folder when it exists.
+'''
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract the VGG-19 conv weights into a memory mappable folder')
+    parser.add_argument('--VGG_MODEL', type=str, default='imagenet-vgg-verydeep-19.mat', help='Path to the VGG-19 .mat file')
+    parser.add_argument('--saveto', type=str, default='imagenet-vgg-verydeep-19-conv', help='Folder to write the conv weights to')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    vgg_weights = model.load_vgg_weights(args.VGG_MODEL)
+    model.save_conv_weights(vgg_weights, args.saveto)
+    print("Wrote %d conv layers to %s (%.1f MB, was %.1f MB) in %.1f seconds" % (
+        len(vgg_weights), args.saveto, folder_size(args.saveto) / 2**20,
+        os.path.getsize(args.VGG_MODEL) / 2**20, time.time() - start_time))
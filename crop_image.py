@@ -2,13 +2,19 @@ from PIL import Image, ImageOps
 import argparse
 import sys
 
+import stage_timing
+
 parser = argparse.ArgumentParser(description='A Neural Algorithm of Artistic Style')
 # Args for style transfer
 parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, help = "Path to content image")
 parser.add_argument("--CROPPED_IMAGE", "-CROPPED_IMAGE", type=str, help = "Path to content image", default="empty")
+parser.add_argument("--no_pad", help = "Keep the shape of the crop instead of padding it to a white square", action="store_true")
+parser.add_argument("--timing", type=str, default=None, help="Write the time and memory of each stage to this JSON file, see stage_timing.py")
+parser.add_argument("--trace", type=str, default=None, help="Also write the stages as a Chrome trace to this file")
 
 
 args = parser.parse_args()
+stage_timing.start()
 
 image_name = 'input/' + args.CONTENT_IMAGE
 
@@ -18,22 +24,28 @@ else:
     saved_image = 'input/' + args.CROPPED_IMAGE
 
 try:
-    source_image = Image.open(image_name)
-    source_image = source_image.convert('RGBA')
-    white_background = Image.new('RGBA', source_image.size, (255,255,255))
-    source_image = Image.alpha_composite(white_background, source_image)
-    source_image = source_image.convert('RGB')
-    invert_image = source_image.convert('RGB')
-    invert_image = ImageOps.invert(invert_image)
-    print('post')
-    trim_box = invert_image.getbbox()
-    source_image = source_image.crop(trim_box)
-    size = source_image.size
-    max_size = max(size[0], size[1])
-    square = Image.new('RGB', (max_size, max_size), (255,255,255))
-    position = ((max_size - size[0]) // 2, (max_size - size[1]) // 2)
-    square.paste(source_image, position)
-    square.save(saved_image)
+    with stage_timing.span('load image'):
+        source_image = Image.open(image_name)
+        source_image = source_image.convert('RGBA')
+    with stage_timing.span('crop'):
+        white_background = Image.new('RGBA', source_image.size, (255,255,255))
+        source_image = Image.alpha_composite(white_background, source_image)
+        source_image = source_image.convert('RGB')
+        invert_image = source_image.convert('RGB')
+        invert_image = ImageOps.invert(invert_image)
+        print('post')
+        trim_box = invert_image.getbbox()
+        source_image = source_image.crop(trim_box)
+        if not args.no_pad:
+            size = source_image.size
+            max_size = max(size[0], size[1])
+            square = Image.new('RGB', (max_size, max_size), (255,255,255))
+            position = ((max_size - size[0]) // 2, (max_size - size[1]) // 2)
+            square.paste(source_image, position)
+            source_image = square
+    with stage_timing.span('save image'):
+        source_image.save(saved_image)
+    stage_timing.write_report(args.timing, args.trace)
 except:
     print('Error loading image--crop.')
     print(sys.exc_info())
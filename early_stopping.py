@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+
+'''
+Decides when a style transfer optimization has converged and should stop early.
+
+The optimizer reports the total loss of every iteration with update(). Every
+window iterations it also passes the current image, so the average pixel change
+can be measured. The run stops when any of the enabled conditions holds:
+
+* the loss is below min_loss (the original stopping rule of StyleTransfer.py)
+* the best loss of the last window is less than the plateau fraction lower than
+  the best loss of the window before it
+* the pixels changed by less than pixel_delta per iteration on average over the last window
+* more than time_budget seconds have passed since the policy was created
+'''
+
+
+class EarlyStopping:
+    """Tracks the loss and image of an optimization and says when to stop."""
+
+    def __init__(self, plateau=0.0, window=100, pixel_delta=0.0, time_budget=0.0, min_loss=1.0):
+        """
+        Args:
+            plateau (float): Relative improvement of the best loss over a window below which
+                the run stops; 0 turns it off
+            window (int): Number of iterations the plateau and pixel change are measured over
+            pixel_delta (float): Mean absolute pixel change per iteration below which the run
+                stops; 0 turns it off
+            time_budget (float): Seconds after which the run stops; 0 turns it off
+            min_loss (float): Loss below which the run stops
+        """
+        self.plateau = plateau
+        self.window = max(1, window)
+        self.pixel_delta = pixel_delta
+        self.time_budget = time_budget
+        self.min_loss = min_loss
+        self.start_time = time.time()
+        # Best loss of the window in progress, and of the one before it.
+        self.window_best_loss = np.inf
+        self.previous_best_loss = np.inf
+        self.window_image = None
+        self.reason = None
+
+    def needs_image(self, iteration):
+        """Return True if update() wants the current image at this iteration."""
+        return self.pixel_delta > 0 and iteration % self.window == 0
+
+    def update(self, iteration, loss, image=None):
+        """
+        Record the loss of an iteration, and the image if needs_image() asked for it.
+        Returns True if the optimization should stop; the reason is kept in self.reason.
+        """
+        loss = float(loss)
+
+        if loss < self.min_loss:
+            self.reason = "loss %g is below %g" % (loss, self.min_loss)
+        elif self.time_budget > 0 and time.time() - self.start_time > self.time_budget:
+            self.reason = "time budget of %g seconds used" % self.time_budget
+        elif iteration == 0:
+            # The loss of the untouched initial image is usually lower than the
+            # first steps, which move the whole image at once, so it is left out
+            # of the windows.
+            self.window_image = image
+        else:
+            self.window_best_loss = min(self.window_best_loss, loss)
+            if iteration % self.window == 0:
+                self.check_window(image)
+                self.previous_best_loss = self.window_best_loss
+                self.window_best_loss = np.inf
+
+        return self.reason is not None
+
+    def check_window(self, image):
+        if self.plateau > 0 and np.isfinite(self.previous_best_loss):
+            improvement = (self.previous_best_loss - self.window_best_loss) / max(abs(self.previous_best_loss), 1e-12)
+            if improvement < self.plateau:
+                self.reason = "loss improved by %.3g%% over the last %d iterations" % (improvement * 100, self.window)
+        if self.pixel_delta > 0 and image is not None:
+            if self.window_image is not None:
+                delta = np.mean(np.abs(image - self.window_image)) / self.window
+                if delta < self.pixel_delta and self.reason is None:
+                    self.reason = "pixels changed by %.3g per iteration over the last %d iterations" % (delta, self.window)
+            self.window_image = image
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from early_stopping import EarlyStopping
+
+
+def run(policy, losses, images=None):
+    for it, loss in enumerate(losses):
+        image = None
+        if images is not None and policy.needs_image(it):
+            image = images[it]
+        if policy.update(it, loss, image):
+            return it
+    return None
+
+
+class EarlyStoppingTestCase(unittest.TestCase):
+
+    def test_min_loss(self):
+        policy = EarlyStopping()
+        self.assertEqual(3, run(policy, [10, 8, 4, 0.5, 0.2]))
+
+    def test_plateau(self):
+        # Halves every 10 iterations for 40 iterations, then stays flat.
+        losses = [1000.0 * 0.5 ** (min(it, 40) // 10) for it in range(100)]
+        policy = EarlyStopping(plateau=0.01, window=10)
+        self.assertEqual(50, run(policy, losses))
+        self.assertIn("improved", policy.reason)
+
+    def test_initial_loss_is_ignored(self):
+        # The first steps are worse than the initial image, but then improve.
+        losses = [1.0e3] + [1.0e6 * 0.5 ** (it // 10) for it in range(1, 60)]
+        policy = EarlyStopping(plateau=0.01, window=10)
+        self.assertIsNone(run(policy, losses))
+
+    def test_pixel_delta(self):
+        images = [np.full((1, 4, 4, 3), float(min(it, 20))) for it in range(60)]
+        policy = EarlyStopping(pixel_delta=0.5, window=10)
+        self.assertEqual(30, run(policy, [100.0] * 60, images))
+        self.assertIn("pixels", policy.reason)
+
+    def test_time_budget(self):
+        policy = EarlyStopping(time_budget=1)
+        policy.start_time -= 2
+        self.assertEqual(0, run(policy, [100.0, 90.0]))
+
+    def test_off_by_default(self):
+        policy = EarlyStopping()
+        self.assertIsNone(run(policy, [100.0] * 500))
+
+
+if __name__ == '__main__':
+    unittest.main()
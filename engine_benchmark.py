@@ -0,0 +1,113 @@
+import argparse
+import json
+import multiprocessing
+import time
+
+import StyleTransfer
+import model
+import style_worker
+import utility
+
+'''
+Compare the --engine settings of StyleTransfer.py: the v1 graph and session,
+and the tf2 function with and without XLA.
+
+Usage: python engine_benchmark.py --CONTENT_IMAGE a.png --STYLE_IMAGE styles/zebra_1.jpg
+                                  [--widths 300 600] [-epoch 100] [--json results.json]
+
+The TF2 behavior can only be turned on for a whole process, so each engine
+and width runs in a process of its own. Each computes its targets and runs
+the same number of Adam iterations from the content image after a first
+one, which for the tf2 engine includes tracing and compiling the function.
+The report gives that first iteration, the seconds per iteration after it,
+and the speedup over v1 at the same width.
+'''
+
+# --engine and --no_xla of each engine compared.
+ENGINES = {'v1': ('v1', False), 'tf2': ('tf2', True), 'tf2-no-xla': ('tf2', False)}
+
+
+def run_engine(name, vgg_path, content_path, style_path, args):
+    '''
+    Run args.epoch Adam iterations on one engine, in a new process. Returns
+    the seconds taken by the first iteration and per iteration after it.
+    '''
+    engine, jit_compile = ENGINES[name]
+    if engine == 'tf2':
+        import tf2_engine
+        tf2_engine.enable()
+    vgg_weights = model.load_vgg_weights(vgg_path, args.style_layers + args.content_layers)
+    height, width = StyleTransfer.image_size(args, content_path)
+    content_image = utility.load_image(content_path, height, width, invert=StyleTransfer.content_invert)
+    style_image = utility.load_image(style_path, height, width, invert=StyleTransfer.style_invert)
+    if engine == 'tf2':
+        sess = None
+        graph = tf2_engine.build_style_transfer_function(vgg_weights, height, width, args.style_layers,
+                                                         args.content_layers, jit_compile=jit_compile)
+    else:
+        tf = StyleTransfer.tf
+        graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, args.style_layers,
+                                                         args.content_layers)
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer())
+    steps = StyleTransfer.optimizer_steps(sess, graph)
+    steps.set_targets(StyleTransfer.compute_content_targets(sess, graph, content_image),
+                      StyleTransfer.compute_style_grams(sess, graph, style_image), args)
+    steps.reset(content_image)
+
+    start_time = time.time()
+    steps.step()
+    first_seconds = time.time() - start_time
+    start_time = time.time()
+    for _ in range(args.epoch):
+        steps.step()
+    seconds = (time.time() - start_time) / args.epoch
+    if sess is not None:
+        sess.close()
+    return {'height': height, 'width': width, 'first_iteration_seconds': first_seconds, 'seconds_per_iteration': seconds}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the style transfer engines against v1')
+    parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, required=True, help="Path to content image, in input/")
+    parser.add_argument("--STYLE_IMAGE", "-STYLE_IMAGE", type=str, required=True, help="Path to style image, in input/")
+    parser.add_argument("--widths", type=int, nargs='+', default=[300, 600], help="image widths to time")
+    parser.add_argument("--epoch", "-epoch", type=int, default=100, help="Adam iterations timed at each width")
+    parser.add_argument('--engine', type=str, nargs='+', choices=sorted(ENGINES), default=['v1', 'tf2', 'tf2-no-xla'],
+                        help='engines to compare, v1 is always run')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    content_path = 'input/' + args.CONTENT_IMAGE
+    style_path = 'input/' + args.STYLE_IMAGE
+    engines = ['v1'] + [engine for engine in args.engine if engine != 'v1']
+    vgg_path = args.VGG_MODEL or StyleTransfer.vgg_weights_path()
+    context = multiprocessing.get_context('spawn')
+
+    results = {}
+    for width in args.widths:
+        # The StyleTransfer.py defaults for everything but the size.
+        job_args = style_worker.job_args({'CONTENT_IMAGE': content_path, 'STYLE_IMAGE': style_path,
+                                          'IMAGE_WIDTH': width, 'epoch': args.epoch})
+        results[width] = {}
+        for engine in engines:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_engine, (engine, vgg_path, content_path, style_path, job_args))
+            print("%s at width %d: %.4f seconds per iteration" % (engine, width, result['seconds_per_iteration']))
+            results[width][engine] = result
+        baseline = results[width]['v1']
+        for result in results[width].values():
+            result['iterations_per_second'] = 1 / result['seconds_per_iteration']
+            result['speedup'] = baseline['seconds_per_iteration'] / result['seconds_per_iteration']
+
+    print("%-6s %-11s %10s %8s %8s" % ('width', 'engine', 'first (s)', 'it/s', 'speedup'))
+    for width in args.widths:
+        for engine in engines:
+            result = results[width][engine]
+            print("%-6d %-11s %10.2f %8.2f %8.2f" % (width, engine, result['first_iteration_seconds'],
+                                                     result['iterations_per_second'], result['speedup']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'content': content_path, 'style': style_path, 'epoch': args.epoch,
+                       'results': {str(width): result for width, result in results.items()}}, f, indent=2)
@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import model
+import precompute_targets
+import target_cache
+import thread_tuning
+import utility
+from utility import VGG_MEAN
+
+'''
+Feed-forward style networks, trained once per style of the library.
+
+Optimizing an image takes thousands of VGG forward and backward passes per
+logo. A style network, the image transformation network of Johnson et al.,
+made narrower to train on a CPU, learns to turn any content image into the
+stylized one in a single forward pass. It is trained on a folder of content
+images with the same content, style and shape losses as StyleTransfer.py.
+
+Usage: python fast_style.py --style images/zebra_1.jpg [images/...] --contents shapenet_subset/screenshots/
+                            [--size 256] [--batch_size 4] [--steps 20000]
+
+A --style folder trains a network for every image in it. The network of
+each style is written to fast_style/<style name>.npz every --save_every steps
+and at the end, together with a hash of the style image, so it is only used
+for that image. StyleTransfer.py and style_worker.py then use it instead of
+optimizing when a job has that style, unless given --no_fast_style. The loss
+weights and layers it was trained with are saved with it too: a job asking
+for others is optimized instead, or for --preview, stylized with a warning.
+'''
+
+NETWORK_DIR = 'fast_style'
+
+# Channels of the layers before the residual blocks, and of the residual blocks.
+CHANNELS = (16, 32, 64)
+RESIDUAL_BLOCKS = 5
+
+# The input is padded to a multiple of this, the total stride of the network.
+STRIDE = 4
+
+# The shape loss of an untrained network is around 1e25, whose gradients
+# would overflow the second moments of Adam in float32. Adam minimizes the
+# loss times this instead, with its epsilon scaled the same way, which gives
+# the same steps as the loss itself.
+LOSS_SCALE = 2.0**-40
+
+# Arrays of a network file that aren't weights.
+METADATA = ('style_hash', 'job')
+# Arguments of the losses a network is trained for, saved in its 'job'.
+LOSS_ARGS = ('alpha', 'beta', 'gamma', 'w1', 'w2', 'w3', 'w4', 'w5', 'style_layers', 'content_layers')
+
+
+def new_weight(name, shape):
+    '''
+    Make a trainable weight of the network, see transform_network; adain.py
+    makes the weights of its decoder with it too.
+    '''
+    if name.endswith('_scale'):
+        initializer = tf.ones_initializer()
+    elif name.endswith('_offset') or name.endswith('_b'):
+        initializer = tf.zeros_initializer()
+    else:
+        initializer = tf.glorot_uniform_initializer()
+    return tf.get_variable(name, shape, initializer=initializer)
+
+
+def conv_layer(x, name, get_weight, channels, kernel, stride=1, relu=True):
+    '''
+    A reflection padded convolution, an instance normalization and a ReLU.
+    '''
+    W = get_weight(name + '_W', (kernel, kernel, int(x.shape[3]), channels))
+    x = tf.pad(x, [[0, 0], [kernel // 2, kernel // 2], [kernel // 2, kernel // 2], [0, 0]], mode='REFLECT')
+    x = tf.nn.conv2d(x, W, strides=(1, stride, stride, 1), padding='VALID')
+    mean, variance = tf.nn.moments(x, axes=[1, 2], keepdims=True)
+    x = (x - mean) * tf.rsqrt(variance + 1e-5)
+    x = x * get_weight(name + '_scale', (channels,)) + get_weight(name + '_offset', (channels,))
+    return tf.nn.relu(x) if relu else x
+
+
+def transform_network(image, get_weight):
+    '''
+    Stylize a batch of model input images (see utility.load_image) whose sides
+    are multiples of STRIDE, returning model input images of the same size.
+    get_weight(name, shape) returns each weight: new_weight while training,
+    the saved values after.
+    '''
+    x = (image + VGG_MEAN) / 255 - 0.5
+    x = conv_layer(x, 'conv1', get_weight, CHANNELS[0], 9)
+    x = conv_layer(x, 'conv2', get_weight, CHANNELS[1], 3, stride=2)
+    x = conv_layer(x, 'conv3', get_weight, CHANNELS[2], 3, stride=2)
+    for block in range(RESIDUAL_BLOCKS):
+        name = 'residual%d' % (block + 1)
+        x = x + conv_layer(conv_layer(x, name + 'a', get_weight, CHANNELS[2], 3), name + 'b', get_weight,
+                           CHANNELS[2], 3, relu=False)
+    # Nearest neighbor upsampling and a convolution, which unlike transposed
+    # convolutions leaves no checkerboard pattern.
+    for layer, channels in (('deconv1', CHANNELS[1]), ('deconv2', CHANNELS[0])):
+        x = tf.image.resize(x, tf.shape(x)[1:3] * 2, method=tf.image.ResizeMethod.NEAREST_NEIGHBOR)
+        x = conv_layer(x, layer, get_weight, channels, 3)
+    x = conv_layer(x, 'output', get_weight, 3, 9, relu=False)
+    return 255 * tf.sigmoid(x) - VGG_MEAN
+
+
+def style_grams(vgg_weights, style_path, size, args):
+    '''
+    The gram matrix of each style layer for the style image at the training size.
+    '''
+    style_image = utility.load_image(style_path, size, size, invert=StyleTransfer.style_invert)
+    with tf.Graph().as_default():
+        net = model.vgg_layers(tf.constant(style_image), vgg_weights, args.style_layers)
+        grams = {name: StyleTransfer.gram_matrix(net[name], int(net[name].shape[3]),
+                                                 int(net[name].shape[1] * net[name].shape[2]))
+                 for name in args.style_layers}
+        with tf.Session() as sess:
+            return sess.run(grams)
+
+
+def build_training_graph(vgg_weights, grams, size, batch_size, args, learning_rate=1e-3):
+    '''
+    The graph training a network for one style: the content images and
+    their distance templates are fed, and the losses of the stylized images
+    are those of StyleTransfer.py, averaged over the batch.
+    '''
+    content = tf.placeholder(tf.float32, (batch_size, size, size, StyleTransfer.COLOR_CHANNELS))
+    dist_template = tf.placeholder(tf.float32, (batch_size, size, size))
+    with tf.variable_scope('transform'):
+        stylized = transform_network(content, new_weight)
+
+    layers = args.style_layers + args.content_layers
+    net = model.vgg_layers(stylized, vgg_weights, layers)
+    net['input'] = stylized
+    content_net = model.vgg_layers(content, vgg_weights, args.content_layers)
+    content_targets = {name: tf.stop_gradient(content_net[name]) for name in args.content_layers}
+    shape_target = tf.image.rgb_to_grayscale(content)[:, :, :, 0] * dist_template
+    layer_weights = tf.constant([StyleTransfer.style_layer_weights(args)[:len(args.style_layers)]], tf.float32)
+
+    graph = {'content': content, 'dist_template': dist_template, 'stylized': stylized}
+    graph['content_loss'] = tf.reduce_mean(StyleTransfer.content_loss_func(net, content_targets, args.content_layers))
+    graph['style_loss'] = tf.reduce_mean(StyleTransfer.style_loss_func(
+        net, {name: tf.constant(gram) for name, gram in grams.items()}, layer_weights, args.style_layers))
+    graph['shape_loss'] = tf.reduce_mean(StyleTransfer.shape_loss_func(net, dist_template, shape_target))
+    graph['total_loss'] = (args.alpha * graph['content_loss'] + args.beta * graph['style_loss']
+                           + args.gamma * graph['shape_loss'])
+    graph['variables'] = tf.trainable_variables('transform')
+    optimizer = tf.train.AdamOptimizer(learning_rate, epsilon=1e-8 * LOSS_SCALE)
+    graph['train_step'] = optimizer.minimize(graph['total_loss'] * LOSS_SCALE, var_list=graph['variables'])
+    return graph
+
+
+def loss_differences(path, args):
+    '''
+    Return the names of the loss arguments of a job that the network at path
+    was trained with other values of, an empty list if it fits the job.
+    '''
+    with np.load(path) as data:
+        trained = json.loads(str(data['job']))
+    return [name for name in LOSS_ARGS if trained.get(name) != getattr(args, name)]
+
+
+class DistTemplates:
+    """
+    The distance templates of the content images at the training size, each
+    computed once and kept, as float32 like the graph takes them. With a
+    content cache they are stored there too, so later trainings skip them.
+    """
+
+    def __init__(self, size, cache=None):
+        self.size = size
+        self.cache = cache
+        # Content image path -> its distance template.
+        self.templates = {}
+
+    def key(self, path):
+        return target_cache.make_key(kind='dist_template', content=target_cache.file_hash(path), height=self.size,
+                                     width=self.size, invert=StyleTransfer.content_invert)
+
+    def get(self, path, image):
+        """Return the distance template of the content image at path, loaded at the training size as image."""
+        if path not in self.templates:
+            stored = self.cache.get(self.key(path)) if self.cache is not None else None
+            if stored is not None:
+                template = stored['dist_template']
+            else:
+                template = StyleTransfer.content_dist_template(image).astype(np.float32)
+                if self.cache is not None:
+                    self.cache.put(self.key(path), {'dist_template': template})
+            self.templates[path] = template
+        return self.templates[path]
+
+
+def content_batch(paths, rng, size, batch_size, templates=None):
+    '''
+    A random batch of content images at the training size and their distance
+    templates, from templates, a DistTemplates for the size, if given.
+    '''
+    batch = [paths[n] for n in rng.choice(len(paths), batch_size)]
+    images = [utility.load_image(path, size, size, invert=StyleTransfer.content_invert) for path in batch]
+    if templates is None:
+        templates = DistTemplates(size)
+    return np.concatenate(images), np.stack([templates.get(path, image) for path, image in zip(batch, images)])
+
+
+def network_name(style_path, network_dir=NETWORK_DIR):
+    return os.path.join(network_dir, os.path.splitext(os.path.basename(style_path))[0] + '.npz')
+
+
+def save_network(path, weights, style_path, args):
+    '''
+    Write the weights of a network, a dict from name to array, with the
+    hash of its style image and the loss arguments it was trained with.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    job = {name: getattr(args, name) for name in LOSS_ARGS}
+    target_cache.save_npz(path, style_hash=target_cache.file_hash(style_path), job=json.dumps(job), **weights)
+
+
+def network_path(style_path, network_dir=NETWORK_DIR):
+    '''
+    Return the path of the network trained for a style image, or None if
+    there is none, or it was trained on a different image of the same name.
+    '''
+    path = network_name(style_path, network_dir)
+    try:
+        with np.load(path) as data:
+            if str(data['style_hash']) == target_cache.file_hash(style_path):
+                return path
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+class FastStyleNetwork:
+    """A trained style network in a graph and session of its own, stylizing images of any size."""
+
+    def __init__(self, path, config=None):
+        with np.load(path) as data:
+            weights = {name: data[name] for name in data.files if name not in METADATA}
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.input = tf.placeholder(tf.float32, (1, None, None, StyleTransfer.COLOR_CHANNELS))
+            self.output = transform_network(self.input, lambda name, shape: tf.constant(weights[name]))
+        self.graph.finalize()
+        self.sess = tf.Session(graph=self.graph, config=config)
+
+    def stylize(self, image):
+        """Return the stylized image of a [1, h, w, 3] model input image."""
+        height, width = image.shape[1:3]
+        pad = [(0, 0), (0, -height % STRIDE), (0, -width % STRIDE), (0, 0)]
+        stylized = self.sess.run(self.output, {self.input: np.pad(image, pad, mode='reflect')})
+        return stylized[:, :height, :width]
+
+    def close(self):
+        self.sess.close()
+
+
+def stylize_job(network, content_path, height, width, args, output_dir):
+    '''
+    Stylize the content image of a StyleTransfer.py job with a
+    FastStyleNetwork and write it as its final image. Returns the file name.
+    '''
+    content_image = utility.load_image(content_path, height, width, invert=StyleTransfer.content_invert)
+    return StyleTransfer.save_final_image(network.stylize(content_image), args, output_dir)
+
+
+def train(style_path, content_paths, vgg_weights, args, config=None, templates=None):
+    '''
+    Train the network of one style for args.steps steps, saving it every
+    args.save_every steps and at the end. templates is the DistTemplates of
+    the content images, shared by the styles, or None to make one.
+    '''
+    path = network_name(style_path, args.network_dir)
+    if templates is None:
+        templates = DistTemplates(args.size, StyleTransfer.open_content_cache(args))
+    rng = np.random.RandomState(args.seed)
+    grams = style_grams(vgg_weights, style_path, args.size, args)
+    with tf.Graph().as_default():
+        graph = build_training_graph(vgg_weights, grams, args.size, args.batch_size, args, args.learning_rate)
+        names = [variable.op.name[len('transform/'):] for variable in graph['variables']]
+        with tf.Session(config=config) as sess:
+            sess.run(tf.global_variables_initializer())
+            start_time = time.time()
+            for step in range(1, args.steps + 1):
+                content, dist_template = content_batch(content_paths, rng, args.size, args.batch_size, templates)
+                _, losses = sess.run([graph['train_step'], {name: graph[name] for name in StyleTransfer.LOSS_NAMES}],
+                                     {graph['content']: content, graph['dist_template']: dist_template})
+                if step % args.print_every == 0:
+                    print("Step %d, %.2f s/step: %s" % (step, (time.time() - start_time) / step,
+                                                        ', '.join('%s %.4g' % item for item in losses.items())))
+                if step % args.save_every == 0 or step == args.steps:
+                    save_network(path, dict(zip(names, sess.run(graph['variables']))), style_path, args)
+    print("Saved %s" % path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train a feed-forward style network for each style image')
+    parser.add_argument('--style', type=str, nargs='+', required=True, help='style images, or folders of them')
+    parser.add_argument('--contents', type=str, required=True, help='folder of content images, searched recursively')
+    parser.add_argument('--size', type=int, default=256, help='side of the square training images, a multiple of 4')
+    parser.add_argument('--batch_size', type=int, default=4, help='content images per step')
+    parser.add_argument('--steps', type=int, default=20000, help='training steps per style')
+    parser.add_argument('--learning_rate', type=float, default=1e-3, help='learning rate of Adam')
+    parser.add_argument('--alpha', type=float, default=StyleTransfer.parser.get_default('alpha'), help='content loss weight')
+    parser.add_argument('--beta', type=float, default=StyleTransfer.parser.get_default('beta'), help='style loss weight')
+    parser.add_argument('--gamma', type=float, default=StyleTransfer.parser.get_default('gamma'), help='shape loss weight')
+    parser.add_argument('--network_dir', type=str, default=NETWORK_DIR, help='folder the networks are saved in')
+    parser.add_argument('--save_every', type=int, default=500, help='save the network every this many steps')
+    parser.add_argument('--print_every', type=int, default=50, help='print the losses every this many steps')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the order of the content images')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument("--intra_op_threads", type=int, default=0, help="threads used inside one op, 0 for the TensorFlow default")
+    parser.add_argument("--inter_op_threads", type=int, default=0, help="ops run at once, 0 for the TensorFlow default")
+    args = parser.parse_args()
+    if args.size % STRIDE:
+        parser.error("--size must be a multiple of %d" % STRIDE)
+
+    # The StyleTransfer.py defaults for the layers and their weights.
+    job_args = StyleTransfer.parser.parse_args([])
+    for name, value in vars(args).items():
+        setattr(job_args, name, value)
+    style_paths = []
+    for path in args.style:
+        style_paths.extend(precompute_targets.image_paths(path) if os.path.isdir(path) else [path])
+    content_paths = precompute_targets.image_paths(args.contents, recursive=True)
+    if not content_paths:
+        parser.error("no images in %s" % args.contents)
+
+    config = thread_tuning.session_config(args.intra_op_threads, args.inter_op_threads)
+    vgg_weights = model.load_vgg_weights(args.VGG_MODEL or StyleTransfer.vgg_weights_path(),
+                                         job_args.style_layers + job_args.content_layers)
+    # The distance templates of the content images don't depend on the style.
+    templates = DistTemplates(args.size, StyleTransfer.open_content_cache(job_args))
+    for style_path in style_paths:
+        print("Training the network of %s on %d content images" % (style_path, len(content_paths)))
+        train(style_path, content_paths, vgg_weights, job_args, config, templates)
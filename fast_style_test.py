@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import fast_style
+import model
+import target_cache
+
+SIZE = 32
+
+
+class FastStyleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        rng = np.random.RandomState(0)
+        self.style_path = os.path.join(self.folder, 'zebra.png')
+        cv2.imwrite(self.style_path, rng.randint(0, 256, (SIZE, SIZE, 3)).astype(np.uint8))
+        # A white disc on black, like the logos.
+        self.content_path = os.path.join(self.folder, 'disc.png')
+        disc = np.zeros((SIZE, SIZE, 3), np.uint8)
+        cv2.circle(disc, (SIZE // 2, SIZE // 2), SIZE // 3, (255, 255, 255), -1)
+        cv2.imwrite(self.content_path, disc)
+        self.args = StyleTransfer.parser.parse_args(['--style_layers', 'conv1_2,conv2_2', '--content_layers', 'conv2_2'])
+        self.vgg_weights = model.random_vgg_weights(self.args.style_layers + self.args.content_layers)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def train(self, steps):
+        """Train a network for a few steps and save it; returns its path and the total loss of each step."""
+        grams = fast_style.style_grams(self.vgg_weights, self.style_path, SIZE, self.args)
+        rng = np.random.RandomState(0)
+        path = fast_style.network_name(self.style_path, self.folder)
+        with tf.Graph().as_default():
+            graph = fast_style.build_training_graph(self.vgg_weights, grams, SIZE, 2, self.args)
+            names = [variable.op.name[len('transform/'):] for variable in graph['variables']]
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                losses = []
+                for _ in range(steps):
+                    content, dist_template = fast_style.content_batch([self.content_path], rng, SIZE, 2)
+                    feed = {graph['content']: content, graph['dist_template']: dist_template}
+                    losses.append(sess.run([graph['train_step'], graph['total_loss']], feed)[1])
+                fast_style.save_network(path, dict(zip(names, sess.run(graph['variables']))), self.style_path,
+                                        self.args)
+                stylized = sess.run(graph['stylized'], feed)
+        return path, losses, content, stylized
+
+    def test_training_lowers_the_loss(self):
+        _, losses, _, _ = self.train(10)
+        self.assertTrue(np.isfinite(losses).all())
+        self.assertLess(losses[-1], losses[0])
+
+    def test_saved_network_stylizes_any_size(self):
+        path, _, content, stylized = self.train(1)
+        self.assertEqual(path, fast_style.network_path(self.style_path, self.folder))
+        network = fast_style.FastStyleNetwork(path)
+        try:
+            np.testing.assert_allclose(stylized[:1], network.stylize(content[:1]), rtol=1e-4, atol=1e-2)
+            odd_size = np.random.RandomState(1).rand(1, 30, 45, 3).astype(np.float32) * 255 - 128
+            self.assertEqual((1, 30, 45, 3), network.stylize(odd_size).shape)
+        finally:
+            network.close()
+
+    def test_distance_templates_computed_once(self):
+        cache = target_cache.TargetCache(os.path.join(self.folder, 'cache'), 2**20)
+        templates = fast_style.DistTemplates(SIZE, cache)
+        content, dist_template = fast_style.content_batch([self.content_path], np.random.RandomState(0), SIZE, 2,
+                                                          templates)
+        np.testing.assert_allclose(StyleTransfer.content_dist_template(content[:1]), dist_template[0], rtol=1e-6)
+        # Not computed again, neither in this training nor in the next one, which finds it in the cache.
+        self.assertIs(templates.get(self.content_path, None), templates.get(self.content_path, None))
+        np.testing.assert_array_equal(dist_template[1], fast_style.DistTemplates(SIZE, cache).get(self.content_path, None))
+
+    def test_loss_differences(self):
+        path, _, _, _ = self.train(1)
+        self.assertEqual([], fast_style.loss_differences(path, self.args))
+        self.args.beta = 2 * self.args.beta
+        self.args.content_layers = ['conv1_2']
+        self.assertEqual(['beta', 'content_layers'], fast_style.loss_differences(path, self.args))
+
+    def test_network_of_another_image_not_used(self):
+        path, _, _, _ = self.train(1)
+        cv2.imwrite(self.style_path, np.zeros((SIZE, SIZE, 3), np.uint8))
+        self.assertIsNone(fast_style.network_path(self.style_path, self.folder))
+        self.assertIsNone(fast_style.network_path(os.path.join(self.folder, 'unknown.png'), self.folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
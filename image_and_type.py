@@ -4,6 +4,8 @@ import argparse
 
 from numpy.core.fromnumeric import resize
 
+import stage_timing
+
 '''
 Create a logo by combining an imagr with text
 
@@ -229,7 +231,10 @@ if __name__ == '__main__':
     parser.add_argument('--alignright', help='Align image to the right of the text', action='store_true')
     parser.add_argument('--aligncenter', help='Center image and text', action='store_true')
     parser.add_argument('--resize', type=str, help='widthxheight', default=None)
+    parser.add_argument('--timing', type=str, default=None, help='Write the time and memory of each stage to this JSON file, see stage_timing.py')
+    parser.add_argument('--trace', type=str, default=None, help='Also write the stages as a Chrome trace to this file')
     args = parser.parse_args()
+    stage_timing.start()
 
     # Cast inputs as needed
     spacer = int(args.spacer)
@@ -257,21 +262,23 @@ if __name__ == '__main__':
 
     # Load the image and resize it; exit if there's an error
     try:
-        get_image = args.image
-        source_image = Image.open(get_image)
-        if args.resize is not None:
-            resize_width, resize_height = args.resize.split('x')
-            resize_width, resize_height = int(resize_width), int(resize_height)
-            source_image = source_image.resize((resize_width, resize_height))
-            #source_image.resize((resize_width, resize_height))
-        else:
-            source_image.thumbnail((image_size, image_size))
+        with stage_timing.span('load image'):
+            get_image = args.image
+            source_image = Image.open(get_image)
+            if args.resize is not None:
+                resize_width, resize_height = args.resize.split('x')
+                resize_width, resize_height = int(resize_width), int(resize_height)
+                source_image = source_image.resize((resize_width, resize_height))
+                #source_image.resize((resize_width, resize_height))
+            else:
+                source_image.thumbnail((image_size, image_size))
     except:
         print('Error loading image--.')
         exit()
 
     # Pick the right font and create a font object to render the text
-    font = ImageFont.truetype(select_font(args.sans, args.serif, args.script, args.bold, args.ital), font_size)
+    with stage_timing.span('load font'):
+        font = ImageFont.truetype(select_font(args.sans, args.serif, args.script, args.bold, args.ital), font_size)
 
     # Determine all the dimensions needed, including the image size for the output logo
     source_image_width, source_image_height = source_image.size
@@ -295,8 +302,11 @@ if __name__ == '__main__':
 
     # Render the type; depending on the 
     text_top = padding + source_image_height + spacer
-    render_text(logo, font, args.text, text_color, text_top, text_spacing, padding, args.alignleft, args.alignright, args.stacked)
+    with stage_timing.span('render text'):
+        render_text(logo, font, args.text, text_color, text_top, text_spacing, padding, args.alignleft, args.alignright, args.stacked)
 
     saveto = 'logos/' + args.saveto
     print(saveto)
-    logo.save(saveto)
\ No newline at end of file
+    with stage_timing.span('save logo'):
+        logo.save(saveto)
+    stage_timing.write_report(args.timing, args.trace)
\ No newline at end of file
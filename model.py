@@ -5,46 +5,160 @@ import tensorflow as tf
 import numpy as np
 import scipy.misc
 import scipy.io
+import hashlib
+import json
+import os
 
-def load_vgg_model(path, IMAGE_HEIGHT, IMAGE_WIDTH, COLOR_CHANNELS):
+# Index of each conv layer in the layers of imagenet-vgg-verydeep-19.mat.
+VGG_CONV_LAYERS = [
+    (0, 'conv1_1'), (2, 'conv1_2'),
+    (5, 'conv2_1'), (7, 'conv2_2'),
+    (10, 'conv3_1'), (12, 'conv3_2'), (14, 'conv3_3'), (16, 'conv3_4'),
+    (19, 'conv4_1'), (21, 'conv4_2'), (23, 'conv4_3'), (25, 'conv4_4'),
+    (28, 'conv5_1'), (30, 'conv5_2'), (32, 'conv5_3'), (34, 'conv5_4'),
+]
+
+# Number of filters of the conv layers in each block of VGG-19.
+VGG_BLOCK_CHANNELS = {'conv1': 64, 'conv2': 128, 'conv3': 256, 'conv4': 512, 'conv5': 512}
+
+# The layers of the VGG-19 model, in the order they are built.
+VGG_LAYERS = [
+    'conv1_1', 'conv1_2', 'avgpool1',
+    'conv2_1', 'conv2_2', 'avgpool2',
+    'conv3_1', 'conv3_2', 'conv3_3', 'conv3_4', 'avgpool3',
+    'conv4_1', 'conv4_2', 'conv4_3', 'conv4_4', 'avgpool4',
+    'conv5_1', 'conv5_2', 'conv5_3', 'conv5_4', 'avgpool5',
+]
+
+# Name of the index file in a folder written by save_conv_weights.
+CONV_WEIGHTS_INDEX = 'index.json'
+
+def layers_up_to(layers=None):
+    """
+    Return the VGG layers that have to be built to compute all of layers,
+    that is every layer up to the deepest one. None means all of them.
+    """
+    if layers is None:
+        return VGG_LAYERS
+    for layer_name in layers:
+        if layer_name not in VGG_LAYERS:
+            raise ValueError("unknown VGG layer %r" % layer_name)
+    last = max(VGG_LAYERS.index(layer_name) for layer_name in layers)
+    return VGG_LAYERS[:last + 1]
+
+def load_vgg_weights(path, layers=None):
+    """
+    Load the conv weights and biases of the VGG model as a dict from layer
+    name to (W, b), so they can be passed to load_vgg_model more than once
+    without reading them again. If layers is given, only the weights needed
+    to compute them are kept.
+
+    path is either imagenet-vgg-verydeep-19.mat, or a folder written by
+    save_conv_weights, whose arrays are memory mapped rather than parsed out
+    of the whole .mat file.
+    """
+    if os.path.isdir(path):
+        return load_conv_weights(path)
 
     vgg = scipy.io.loadmat(path)
     vgg_layers = vgg['layers']
-    
-    def weights(layer, expected_layer_name):
-        """
-        Return the weights and bias from the VGG model for a given layer.
-        """
+
+    needed = layers_up_to(layers)
+    vgg_weights = {}
+    for layer, expected_layer_name in VGG_CONV_LAYERS:
+        if expected_layer_name not in needed:
+            continue
         W = vgg_layers[0][layer][0][0][2][0][0]
         b = vgg_layers[0][layer][0][0][2][0][1]
         layer_name = vgg_layers[0][layer][0][0][0][0]
-        
+
         assert layer_name == expected_layer_name, "expected %r, but given %r" % (expected_layer_name, layer_name)
-        return W, b
+        vgg_weights[layer_name] = (W, np.reshape(b, (b.size)))
+    return vgg_weights
 
-    def relu(conv2d_layer):
-        """
-        Return the RELU function wrapped over a TensorFlow layer. Expects a
-        Conv2d layer input.
-        """
-        return tf.nn.relu(conv2d_layer)
+def save_conv_weights(vgg_weights, folder):
+    """
+    Save the conv weights and biases from load_vgg_weights as one .npy file
+    per array plus an index, leaving out the fully connected layers.
 
-    def conv2d(prev_layer, layer, layer_name):
-        """
-        Return the Conv2D layer using the weights, biases from the VGG
-        model at 'layer'.
-        """
-        W, b = weights(layer, layer_name)
-        W = tf.constant(W)
-        b = tf.constant(np.reshape(b, (b.size)))
-        return tf.nn.conv2d(prev_layer, filters=W, strides=[1, 1, 1, 1], padding='SAME') + b
+    np.save aligns the array data in each file, so load_conv_weights can
+    memory map them.
+    """
+    os.makedirs(folder, exist_ok=True)
+    index = {'layers': []}
+    for _, layer_name in VGG_CONV_LAYERS:
+        W, b = vgg_weights[layer_name]
+        entry = {'name': layer_name, 'W': layer_name + '_W.npy', 'b': layer_name + '_b.npy'}
+        np.save(os.path.join(folder, entry['W']), np.ascontiguousarray(W, dtype=np.float32))
+        np.save(os.path.join(folder, entry['b']), np.ascontiguousarray(np.reshape(b, (b.size)), dtype=np.float32))
+        index['layers'].append(entry)
+    with open(os.path.join(folder, CONV_WEIGHTS_INDEX), 'w') as f:
+        json.dump(index, f, indent=2)
+
+def load_conv_weights(folder):
+    """
+    Memory map the conv weights and biases written by save_conv_weights.
+    Only the layers vgg_layers builds are read, and they are read then: the
+    graph holds them as constants, so each graph built keeps a copy in its
+    GraphDef.
+    """
+    with open(os.path.join(folder, CONV_WEIGHTS_INDEX)) as f:
+        index = json.load(f)
+    vgg_weights = {}
+    for entry in index['layers']:
+        W = np.load(os.path.join(folder, entry['W']), mmap_mode='r')
+        b = np.load(os.path.join(folder, entry['b']), mmap_mode='r')
+        vgg_weights[entry['name']] = (W, b)
+    return vgg_weights
+
+def random_vgg_weights(layers=None, seed=0):
+    """
+    Return weights with the shapes of the VGG-19 conv layers, drawn at random
+    and scaled to keep the activations in a sensible range. Only the layers
+    needed for layers are made. They are for timing and testing without the
+    real weights, not for style transfer.
+    """
+    rng = np.random.RandomState(seed)
+    needed = layers_up_to(layers)
+    vgg_weights = {}
+    channels = 3
+    for _, layer_name in VGG_CONV_LAYERS:
+        if layer_name not in needed:
+            break
+        filters = VGG_BLOCK_CHANNELS[layer_name.split('_')[0]]
+        W = (rng.randn(3, 3, channels, filters) * np.sqrt(2.0 / (9 * channels))).astype(np.float32)
+        vgg_weights[layer_name] = (W, np.zeros(filters, dtype=np.float32))
+        channels = filters
+    return vgg_weights
 
-    def conv2d_relu(prev_layer, layer, layer_name):
+def weights_fingerprint(vgg_weights):
+    """
+    Return a short hash that tells sets of VGG weights apart, for caching
+    values computed with them. Only the first layer is hashed, which is enough
+    to tell the real weights from converted or randomly generated ones.
+    """
+    W, b = vgg_weights[VGG_CONV_LAYERS[0][1]]
+    digest = hashlib.sha1(np.ascontiguousarray(W).tobytes())
+    digest.update(np.ascontiguousarray(b).tobytes())
+    return digest.hexdigest()[:16]
+
+def vgg_layers(image, vgg_weights, layers=None, dtype=tf.float32):
+    """
+    Run an image tensor through the VGG-19 conv and pooling layers, up to the
+    deepest of layers, and return a dict of the output of each layer.
+    With a dtype other than float32, the weights and the layers are stored
+    in it; the image is cast to it. The weights are copied into the graph as
+    constants.
+    """
+    def conv2d_relu(prev_layer, layer_name):
         """
         Return the Conv2D + RELU layer using the weights, biases from the VGG
-        model at 'layer'.
+        model at 'layer_name'.
         """
-        return relu(conv2d(prev_layer, layer, layer_name))
+        W, b = vgg_weights[layer_name]
+        W = tf.constant(W, dtype=dtype)
+        b = tf.constant(b, dtype=dtype)
+        return tf.nn.relu(tf.nn.conv2d(prev_layer, filters=W, strides=[1, 1, 1, 1], padding='SAME') + b)
 
     def avgpool(prev_layer):
         """
@@ -52,35 +166,35 @@ def load_vgg_model(path, IMAGE_HEIGHT, IMAGE_WIDTH, COLOR_CHANNELS):
         """
         return tf.nn.avg_pool(prev_layer, ksize=[1, 2, 2, 1], strides=[1, 2, 2, 1], padding='SAME')
 
-    # Constructs the graph model.
+    net = {}
+    prev_layer = image
+    if dtype != tf.float32:
+        prev_layer = tf.cast(prev_layer, dtype)
+    for layer_name in layers_up_to(layers):
+        if layer_name.startswith('conv'):
+            net[layer_name] = conv2d_relu(prev_layer, layer_name)
+        else:
+            net[layer_name] = avgpool(prev_layer)
+        prev_layer = net[layer_name]
+    return net
+
+def load_vgg_model(path, IMAGE_HEIGHT, IMAGE_WIDTH, COLOR_CHANNELS, layers=None, batch_size=1, dtype=tf.float32):
+
+    # path is either a path for load_vgg_weights or the weights it returned.
+    # If layers is given, the graph stops at the deepest of them, and the
+    # weights of the layers after it are never used. The input holds
+    # batch_size images.
+    # With a dtype other than float32, the weights and the layers are stored
+    # in it, while the input stays float32 for the optimizer.
+    if isinstance(path, str):
+        vgg_weights = load_vgg_weights(path, layers)
+    else:
+        vgg_weights = path
+
+    # Constructs the graph model, up to the deepest of the requested layers.
     graph = {}
     
-    graph['input']    = tf.Variable(np.zeros((1, IMAGE_HEIGHT, IMAGE_WIDTH, COLOR_CHANNELS)), dtype = 'float32')
-    
-    graph['conv1_1']  = conv2d_relu(graph['input'], 0, 'conv1_1')
-    graph['conv1_2']  = conv2d_relu(graph['conv1_1'], 2, 'conv1_2')
-    graph['avgpool1'] = avgpool(graph['conv1_2'])
-    
-    graph['conv2_1']  = conv2d_relu(graph['avgpool1'], 5, 'conv2_1')
-    graph['conv2_2']  = conv2d_relu(graph['conv2_1'], 7, 'conv2_2')
-    graph['avgpool2'] = avgpool(graph['conv2_2'])
-    
-    graph['conv3_1']  = conv2d_relu(graph['avgpool2'], 10, 'conv3_1')
-    graph['conv3_2']  = conv2d_relu(graph['conv3_1'], 12, 'conv3_2')
-    graph['conv3_3']  = conv2d_relu(graph['conv3_2'], 14, 'conv3_3')
-    graph['conv3_4']  = conv2d_relu(graph['conv3_3'], 16, 'conv3_4')
-    graph['avgpool3'] = avgpool(graph['conv3_4'])
-    
-    graph['conv4_1']  = conv2d_relu(graph['avgpool3'], 19, 'conv4_1')
-    graph['conv4_2']  = conv2d_relu(graph['conv4_1'], 21, 'conv4_2')
-    graph['conv4_3']  = conv2d_relu(graph['conv4_2'], 23, 'conv4_3')
-    graph['conv4_4']  = conv2d_relu(graph['conv4_3'], 25, 'conv4_4')
-    graph['avgpool4'] = avgpool(graph['conv4_4'])
-    
-    graph['conv5_1']  = conv2d_relu(graph['avgpool4'], 28, 'conv5_1')
-    graph['conv5_2']  = conv2d_relu(graph['conv5_1'], 30, 'conv5_2')
-    graph['conv5_3']  = conv2d_relu(graph['conv5_2'], 32, 'conv5_3')
-    graph['conv5_4']  = conv2d_relu(graph['conv5_3'], 34, 'conv5_4')
-    graph['avgpool5'] = avgpool(graph['conv5_4'])
+    graph['input']    = tf.Variable(np.zeros((batch_size, IMAGE_HEIGHT, IMAGE_WIDTH, COLOR_CHANNELS)), dtype = 'float32')
+    graph.update(vgg_layers(graph['input'], vgg_weights, layers, dtype))
     
-    return graph
\ No newline at end of file
+    return graph
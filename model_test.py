@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import model
+
+
+def random_conv_weights():
+    rng = np.random.RandomState(0)
+    vgg_weights = {}
+    channels = 3
+    for _, layer_name in model.VGG_CONV_LAYERS:
+        W = rng.randn(3, 3, channels, 4).astype(np.float32)
+        b = rng.randn(4).astype(np.float32)
+        vgg_weights[layer_name] = (W, b)
+        channels = 4
+    return vgg_weights
+
+
+class ConvWeightsTestCase(unittest.TestCase):
+
+    def test_save_and_load_conv_weights(self):
+        vgg_weights = random_conv_weights()
+        with tempfile.TemporaryDirectory() as folder:
+            model.save_conv_weights(vgg_weights, folder)
+            loaded = model.load_vgg_weights(folder)
+
+            self.assertEqual(set(vgg_weights), set(loaded))
+            for layer_name, (W, b) in vgg_weights.items():
+                np.testing.assert_array_equal(W, loaded[layer_name][0])
+                np.testing.assert_array_equal(b, loaded[layer_name][1])
+                self.assertIsInstance(loaded[layer_name][0], np.memmap)
+            del loaded
+
+    def test_conv_weights_only_writes_conv_layers(self):
+        vgg_weights = random_conv_weights()
+        vgg_weights['fc6'] = (np.zeros((1, 1, 4, 8), dtype=np.float32), np.zeros(8, dtype=np.float32))
+        with tempfile.TemporaryDirectory() as folder:
+            model.save_conv_weights(vgg_weights, folder)
+            self.assertEqual(2 * len(model.VGG_CONV_LAYERS) + 1, len(os.listdir(folder)))
+
+
+class LayersUpToTestCase(unittest.TestCase):
+
+    def test_stops_at_deepest_layer(self):
+        layers = model.layers_up_to(['conv3_2', 'conv1_2'])
+        self.assertEqual('conv3_2', layers[-1])
+        self.assertIn('avgpool2', layers)
+        self.assertNotIn('conv3_3', layers)
+
+    def test_all_layers_by_default(self):
+        self.assertEqual(model.VGG_LAYERS, model.layers_up_to())
+
+    def test_unknown_layer(self):
+        with self.assertRaises(ValueError):
+            model.layers_up_to(['conv6_1'])
+
+
+class RandomVggWeightsTestCase(unittest.TestCase):
+
+    def test_shapes(self):
+        vgg_weights = model.random_vgg_weights(['conv3_1'])
+        self.assertEqual(['conv1_1', 'conv1_2', 'conv2_1', 'conv2_2', 'conv3_1'], sorted(vgg_weights))
+        self.assertEqual((3, 3, 3, 64), vgg_weights['conv1_1'][0].shape)
+        self.assertEqual((3, 3, 128, 256), vgg_weights['conv3_1'][0].shape)
+        self.assertEqual((256,), vgg_weights['conv3_1'][1].shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
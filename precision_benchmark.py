@@ -0,0 +1,133 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import model
+import style_worker
+import utility
+
+'''
+Compare the --precision settings of StyleTransfer.py on one content and style image.
+
+Usage: python precision_benchmark.py --CONTENT_IMAGE a.png --STYLE_IMAGE styles/zebra_1.jpg
+                                     [-width 300] [-epoch 200] [--precision float32 bfloat16 float16]
+                                     [--json results.json]
+
+Each precision gets its own graph and session, computes its own targets,
+and runs the same number of Adam iterations from the content image. The
+report gives the iterations per second, the speedup over float32, and how
+far the final image is from the float32 one: the mean and largest pixel
+difference, and its total loss measured by the float32 graph, so the losses
+of all the precisions are comparable.
+'''
+
+
+def run_precision(precision, vgg_weights, content_path, style_path, args):
+    '''
+    Run args.epoch Adam iterations at one precision. Returns the seconds per
+    iteration, the final image and the loss the graph gives it.
+    '''
+    height, width = StyleTransfer.image_size(args, content_path)
+    tf_graph = tf.Graph()
+    with tf_graph.as_default():
+        graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, args.style_layers,
+                                                         args.content_layers, precision=precision)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            content_image = utility.load_image(content_path, height, width, invert=StyleTransfer.content_invert)
+            style_image = utility.load_image(style_path, height, width, invert=StyleTransfer.style_invert)
+            content_targets = StyleTransfer.compute_content_targets(sess, graph, content_image)
+            style_grams = StyleTransfer.compute_style_grams(sess, graph, style_image)
+            StyleTransfer.set_job_targets(sess, graph, content_targets, style_grams, args)
+            graph['model']['input'].load(content_image, sess)
+
+            # The first steps pay for allocating memory and picking kernels.
+            sess.run(graph['train_step'])
+            start_time = time.time()
+            for _ in range(args.epoch):
+                sess.run(graph['train_step'])
+            seconds = (time.time() - start_time) / args.epoch
+            image, loss = sess.run([graph['model']['input'], graph['total_loss']])
+    return seconds, image, float(loss)
+
+
+def float32_losses(images, vgg_weights, content_path, style_path, args):
+    '''
+    Return the total loss of each image as the float32 graph measures it.
+    '''
+    height, width = StyleTransfer.image_size(args, content_path)
+    tf_graph = tf.Graph()
+    with tf_graph.as_default():
+        graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, args.style_layers,
+                                                         args.content_layers)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            content_image = utility.load_image(content_path, height, width, invert=StyleTransfer.content_invert)
+            style_image = utility.load_image(style_path, height, width, invert=StyleTransfer.style_invert)
+            StyleTransfer.set_job_targets(sess, graph, StyleTransfer.compute_content_targets(sess, graph, content_image),
+                                          StyleTransfer.compute_style_grams(sess, graph, style_image), args)
+            losses = []
+            for image in images:
+                graph['model']['input'].load(image, sess)
+                losses.append(float(sess.run(graph['total_loss'])))
+    return losses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the style transfer precisions against float32')
+    parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, required=True, help="Path to content image, in input/")
+    parser.add_argument("--STYLE_IMAGE", "-STYLE_IMAGE", type=str, required=True, help="Path to style image, in input/")
+    parser.add_argument("--IMAGE_WIDTH", "-width", type=int, default=300, help="width of image")
+    parser.add_argument("--IMAGE_HEIGHT", "-height", type=int, default=0, help="height of image, 0 for the width, or see --keep_aspect")
+    parser.add_argument("--keep_aspect", help="without --IMAGE_HEIGHT, keep the aspect ratio of the content image", action="store_true")
+    parser.add_argument("--epoch", "-epoch", type=int, default=200, help="Adam iterations timed at each precision")
+    parser.add_argument('--precision', type=str, nargs='+', choices=sorted(StyleTransfer.PRECISIONS),
+                        default=['float32', 'bfloat16', 'float16'], help='precisions to compare, float32 is always run')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    content_path = 'input/' + args.CONTENT_IMAGE
+    style_path = 'input/' + args.STYLE_IMAGE
+    # The StyleTransfer.py defaults for everything but the size.
+    job_args = style_worker.job_args({'CONTENT_IMAGE': content_path, 'STYLE_IMAGE': style_path,
+                                      'IMAGE_WIDTH': args.IMAGE_WIDTH, 'IMAGE_HEIGHT': args.IMAGE_HEIGHT,
+                                      'keep_aspect': args.keep_aspect,
+                                      'epoch': args.epoch})
+    precisions = ['float32'] + [precision for precision in args.precision if precision != 'float32']
+    vgg_weights = model.load_vgg_weights(args.VGG_MODEL or StyleTransfer.vgg_weights_path(),
+                                         job_args.style_layers + job_args.content_layers)
+
+    results = {}
+    images = []
+    for precision in precisions:
+        seconds, image, loss = run_precision(precision, vgg_weights, content_path, style_path, job_args)
+        print("%s: %.4f seconds per iteration" % (precision, seconds))
+        results[precision] = {'seconds_per_iteration': seconds, 'loss': loss}
+        images.append(image)
+
+    baseline = results['float32']
+    for precision, image, loss in zip(precisions, images,
+                                      float32_losses(images, vgg_weights, content_path, style_path, job_args)):
+        difference = np.abs(image - images[0])
+        results[precision].update({'iterations_per_second': 1 / results[precision]['seconds_per_iteration'],
+                                   'speedup': baseline['seconds_per_iteration'] / results[precision]['seconds_per_iteration'],
+                                   'mean_pixel_difference': float(difference.mean()),
+                                   'max_pixel_difference': float(difference.max()),
+                                   'float32_loss': loss})
+
+    print("%-9s %8s %8s %12s %12s %12s" % ('precision', 'it/s', 'speedup', 'mean diff', 'max diff', 'f32 loss'))
+    for precision in precisions:
+        result = results[precision]
+        print("%-9s %8.2f %8.2f %12.4g %12.4g %12.4g" % (precision, result['iterations_per_second'], result['speedup'],
+                                                         result['mean_pixel_difference'], result['max_pixel_difference'],
+                                                         result['float32_loss']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            height, width = StyleTransfer.image_size(job_args, content_path)
+            json.dump({'content': content_path, 'style': style_path, 'width': width, 'height': height,
+                       'epoch': args.epoch, 'results': results}, f, indent=2)
@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+
+import StyleTransfer
+from StyleTransfer import tf
+import utility
+
+'''
+Fill the StyleTransfer.py target caches ahead of time for a whole folder of images.
+
+Usage: python precompute_targets.py [--styles images/] [--contents shapenet_subset/screenshots/] [--IMAGE_WIDTH 150 300]
+                                    [--IMAGE_HEIGHT 100 | --keep_aspect]
+
+Every image in the --styles folder is run through VGG once per image size and
+its gram matrices are stored in the style cache, so later style transfer jobs
+with that style, size and layer set skip the style forward pass. The style
+image is resized to the size of the job, so with --keep_aspect and --contents
+the styles are cached at each height the content images give for each width,
+the sizes of jobs on them; otherwise at --IMAGE_HEIGHT, or square.
+
+Every image in the --contents folder and its subfolders, for example the
+ShapeNet subset from build_shapenet_subset.py, gets its content features,
+distance template and shape target stored in the content cache the same way,
+at --IMAGE_HEIGHT, or square, or with --keep_aspect at the height that keeps
+its aspect ratio.
+
+Images that are already cached are skipped.
+'''
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def image_paths(folder, recursive=False):
+    '''
+    Return the paths of the images in folder, and its subfolders if recursive, sorted by name.
+    '''
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        paths.extend(os.path.join(dirpath, name) for name in filenames if name.lower().endswith(IMAGE_EXTENSIONS))
+        if not recursive:
+            break
+    return sorted(paths)
+
+
+def target_sizes(kind, paths, width, image_height=0, content_paths=(), keep_aspect=False):
+    '''
+    Return a dict from height to the paths whose style ('style') or content
+    ('content') targets are cached at that height for one width, see the
+    module documentation.
+    '''
+    sizes = {}
+    if image_height or not keep_aspect:
+        sizes[image_height or width] = list(paths)
+    elif kind == 'content':
+        for path in paths:
+            sizes.setdefault(utility.aspect_height(path, width), []).append(path)
+    else:
+        heights = {utility.aspect_height(path, width) for path in content_paths} or {width}
+        sizes = {height: list(paths) for height in heights}
+    return sizes
+
+
+def precompute(paths, height, width, args, kind, vgg_path=None):
+    '''
+    Store the style ('style') or content ('content') targets of every image in
+    paths for one image size, with the VGG weights at vgg_path, or the default
+    ones if None. Returns the number of images computed and the number already
+    cached.
+    '''
+    if kind == 'style':
+        cache = StyleTransfer.open_style_cache(args)
+        cache_key = StyleTransfer.style_cache_key
+    else:
+        cache = StyleTransfer.open_content_cache(args)
+        cache_key = StyleTransfer.content_cache_key
+    computed = cached = 0
+    tf_graph = tf.Graph()
+    with tf_graph.as_default():
+        graph = StyleTransfer.build_style_transfer_graph(vgg_path or StyleTransfer.vgg_weights_path(), height,
+                                                         width, args.style_layers, args.content_layers,
+                                                         precision=args.precision)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            for path in paths:
+                key = cache_key(graph, path)
+                if cache.get(key) is not None:
+                    cached += 1
+                    continue
+                if kind == 'style':
+                    style_image = utility.load_image(path, height, width, invert = StyleTransfer.style_invert)
+                    cache.put(key, StyleTransfer.compute_style_grams(sess, graph, style_image))
+                else:
+                    content_image = utility.load_image(path, height, width, invert = StyleTransfer.content_invert)
+                    cache.put(key, StyleTransfer.compute_content_targets(sess, graph, content_image))
+                computed += 1
+    return computed, cached
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the style transfer target caches')
+    parser.add_argument('--styles', type=str, default=None, help='Folder of style images to cache')
+    parser.add_argument('--contents', type=str, default=None, help='Folder of content images to cache, searched recursively')
+    parser.add_argument('--IMAGE_WIDTH', '-width', type=int, nargs='+', default=[300], help='Image widths to cache the targets for')
+    parser.add_argument('--IMAGE_HEIGHT', '-height', type=int, default=0,
+                        help='Image height to cache the targets for, 0 for the width')
+    parser.add_argument('--keep_aspect', action='store_true',
+                        help='without --IMAGE_HEIGHT, keep the aspect ratio of each content image, and cache the styles at the heights of the contents')
+    parser.add_argument('--style_layers', type=StyleTransfer.layer_list, default=StyleTransfer.STYLE_LAYERS, help='comma separated VGG layers for the style loss')
+    parser.add_argument('--content_layers', type=StyleTransfer.layer_list, default=StyleTransfer.CONTENT_LAYERS, help='comma separated VGG layers for the content loss')
+    parser.add_argument('--precision', type=str, default='float32', choices=sorted(StyleTransfer.PRECISIONS), help='type of the VGG weights and layers')
+    parser.add_argument('--style_cache', type=str, default=StyleTransfer.STYLE_CACHE_DIR, help='folder for cached style gram matrices')
+    parser.add_argument('--style_cache_mb', type=int, default=StyleTransfer.STYLE_CACHE_MB, help='size limit of the style cache in MB')
+    parser.add_argument('--content_cache', type=str, default=StyleTransfer.CONTENT_CACHE_DIR, help='folder for cached content targets')
+    parser.add_argument('--content_cache_mb', type=int, default=StyleTransfer.CONTENT_CACHE_MB, help='size limit of the content cache in MB')
+    args = parser.parse_args()
+    args.no_style_cache = False
+    args.no_content_cache = False
+    if args.styles is None and args.contents is None:
+        parser.error("pass --styles and/or --contents")
+
+    content_paths = image_paths(args.contents, recursive=True) if args.contents is not None else []
+    jobs = []
+    if args.styles is not None:
+        jobs.append(('style', image_paths(args.styles)))
+    if args.contents is not None:
+        jobs.append(('content', content_paths))
+
+    for kind, paths in jobs:
+        for width in args.IMAGE_WIDTH:
+            # Images are grouped by size, as each size needs its own graph.
+            sizes = target_sizes(kind, paths, width, args.IMAGE_HEIGHT, content_paths, args.keep_aspect)
+            for height, size_paths in sorted(sizes.items()):
+                start_time = time.time()
+                computed, cached = precompute(size_paths, height, width, args, kind)
+                print("Size %dx%d: computed %d %s targets, %d already cached, in %.1f seconds" % (
+                    width, height, computed, kind, cached, time.time() - start_time))
@@ -0,0 +1,58 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+import StyleTransfer
+from StyleTransfer import tf
+import precompute_targets
+import test_fixtures
+
+
+class PrecomputeTargetsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.vgg_path = test_fixtures.write_random_weights(self.folder)
+        # A wide content image, and a style image of another size.
+        self.content_path, self.style_path = test_fixtures.write_test_images(self.folder, (20, 64), (48, 48))
+        self.args = argparse.Namespace(style_layers=['conv1_2', 'conv2_2'], content_layers=['conv2_2'],
+                                       precision='float32', style_cache=os.path.join(self.folder, 'style_grams'),
+                                       style_cache_mb=16, no_style_cache=False, IMAGE_WIDTH=32, IMAGE_HEIGHT=0,
+                                       keep_aspect=True)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_styles_at_the_heights_of_the_contents(self):
+        self.assertEqual({10: [self.style_path]},
+                         precompute_targets.target_sizes('style', [self.style_path], 32, 0, [self.content_path], True))
+        self.assertEqual({32: [self.style_path]}, precompute_targets.target_sizes('style', [self.style_path], 32, 0,
+                                                                                  keep_aspect=True))
+        # Square without keep_aspect, like the jobs.
+        self.assertEqual({32: [self.content_path]},
+                         precompute_targets.target_sizes('content', [self.content_path], 32, 0, [self.content_path]))
+        self.assertEqual({16: [self.content_path]},
+                         precompute_targets.target_sizes('content', [self.content_path], 32, 16))
+
+    def test_non_square_job_hits_the_precomputed_style(self):
+        for height, paths in precompute_targets.target_sizes('style', [self.style_path], 32, 0,
+                                                             [self.content_path], True).items():
+            self.assertEqual((1, 0), precompute_targets.precompute(paths, height, 32, self.args, 'style',
+                                                                   self.vgg_path))
+
+        # The size of a job on the wide content image, from its aspect ratio.
+        height, width = StyleTransfer.image_size(self.args, self.content_path)
+        self.assertEqual((10, 32), (height, width))
+        self.args.keep_aspect = False
+        self.assertEqual((32, 32), StyleTransfer.image_size(self.args, self.content_path))
+        with tf.Graph().as_default():
+            graph = StyleTransfer.build_style_transfer_graph(self.vgg_path, height, width, self.args.style_layers,
+                                                             self.args.content_layers)
+            key = StyleTransfer.style_cache_key(graph, self.style_path)
+        self.assertIsNotNone(StyleTransfer.open_style_cache(self.args).get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
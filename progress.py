@@ -0,0 +1,85 @@
+import sys
+import threading
+import time
+
+import worker_client
+
+'''
+Machine readable progress of a style transfer job, for the UI and for
+graphing runs, instead of parsing the printed output and scanning the output
+folder for new images.
+
+Events are dicts sent one JSON object per line, in the format of the
+style_worker.py events (see worker_client.py), plus a progress event sent
+every few iterations:
+    {"event": "progress", "iteration": 120, "total_iterations": 5001,
+     "losses": {"total_loss": 3.1e6, "content_loss": 2.0e6, "style_loss": 1.0e6, "shape_loss": 1.0e5},
+     "iterations_per_second": 9.5, "eta_seconds": 513.8, "image": "output/a_vs_b/100.jpg"}
+
+The losses are each term times its weight, so they add up to the total.
+The ETA assumes the job runs all its iterations, which early stopping may cut
+short, and image is the latest snapshot written, or null before the first.
+'''
+
+
+class EventStream:
+    """Writes events as JSON lines to a binary stream; safe to use from several threads."""
+
+    def __init__(self, stream, close_stream=False):
+        self.stream = stream
+        self.close_stream = close_stream
+        self.lock = threading.Lock()
+
+    def emit(self, event):
+        with self.lock:
+            self.stream.write(worker_client.encode_line(event))
+            self.stream.flush()
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+
+
+def open_event_stream(destination):
+    '''
+    Return an EventStream writing to a file, or to stdout if destination is
+    '-'. stdout is then kept for the events alone: everything printed goes to
+    stderr instead.
+    '''
+    if destination == '-':
+        stream = sys.stdout.buffer
+        sys.stdout.flush()
+        sys.stdout = sys.stderr
+        return EventStream(stream)
+    return EventStream(open(destination, 'ab'), close_stream=True)
+
+
+class ProgressTracker:
+    """Sends a progress event every so many iterations of a job, see the module documentation."""
+
+    def __init__(self, total_iterations, every, on_event, weights):
+        self.total_iterations = total_iterations
+        self.every = every
+        self.on_event = on_event
+        # Loss name -> weight, for the losses in the events.
+        self.weights = weights
+        self.image = None
+        self.last = None
+
+    def snapshot(self, filename):
+        """Remember the latest snapshot written, for the next progress events."""
+        self.image = filename
+
+    def update(self, iteration, losses):
+        """Called every iteration with its losses; sends a progress event every self.every iterations."""
+        if self.every <= 0 or iteration % self.every != 0:
+            return
+        now = time.time()
+        rate = eta = None
+        if self.last is not None and iteration > self.last[0]:
+            rate = (iteration - self.last[0]) / (now - self.last[1])
+            eta = max(0, self.total_iterations - 1 - iteration) / rate
+        self.last = (iteration, now)
+        self.on_event({'event': 'progress', 'iteration': iteration, 'total_iterations': self.total_iterations,
+                       'losses': {name: float(losses[name]) * self.weights.get(name, 1) for name in self.weights},
+                       'iterations_per_second': rate, 'eta_seconds': eta, 'image': self.image})
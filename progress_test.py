@@ -0,0 +1,38 @@
+import io
+import unittest
+
+import progress
+import worker_client
+
+
+class ProgressTrackerTestCase(unittest.TestCase):
+
+    def test_events(self):
+        events = []
+        tracker = progress.ProgressTracker(101, 10, events.append, {'total_loss': 1, 'style_loss': 0.5})
+        losses = {'total_loss': 4.0, 'style_loss': 6.0, 'shape_loss': 1.0}
+        for iteration in range(21):
+            tracker.update(iteration, losses)
+        tracker.snapshot('output/a_vs_b/20.jpg')
+        tracker.update(30, losses)
+
+        self.assertEqual([0, 10, 20, 30], [event['iteration'] for event in events])
+        self.assertIsNone(events[0]['iterations_per_second'])
+        self.assertEqual({'total_loss': 4.0, 'style_loss': 3.0}, events[1]['losses'])
+        self.assertAlmostEqual(70 / events[3]['iterations_per_second'], events[3]['eta_seconds'])
+        self.assertEqual([None, None, None, 'output/a_vs_b/20.jpg'], [event['image'] for event in events])
+
+
+class EventStreamTestCase(unittest.TestCase):
+
+    def test_json_lines(self):
+        stream = io.BytesIO()
+        events = progress.EventStream(stream)
+        events.emit({'event': 'snapshot', 'iteration': 100})
+        events.emit({'event': 'done'})
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(['snapshot', 'done'], [worker_client.decode_line(line)['event'] for line in lines])
+
+
+if __name__ == '__main__':
+    unittest.main()
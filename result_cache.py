@@ -0,0 +1,91 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+
+import snapshot_writer
+import target_cache
+from target_cache import TargetCache
+
+'''
+Cache of the final images of StyleTransfer.py jobs, so running exactly the
+same job again, from the CLI, style_and_compose.py, the worker or the UI,
+takes milliseconds instead of a full optimization.
+
+The key hashes the bytes of the content and style images, every argument of
+the job but StyleTransfer.RUN_ARGS and HASHED_ARGS, ENGINE_VERSION, the VGG
+weights file and the style network or AdaIN decoder used, if any. An entry
+holds the bytes of the final image file, in the snapshot format of the job,
+which a hit writes back into the output folder under its original name. The
+cache is size bounded like the target caches, dropping the least recently
+used results.
+'''
+
+# Bump when a change to the losses or the optimizers changes the image a job
+# gives, so results of the old code aren't returned.
+ENGINE_VERSION = 1
+
+# Arguments replaced in the key by hashes: the image paths by hashes of the
+# images, and the network folders by hashes of the networks.
+HASHED_ARGS = {'CONTENT_IMAGE', 'STYLE_IMAGE', 'fast_style_dir', 'adain_decoder'}
+
+logger = logging.getLogger(__name__)
+
+
+def file_id(path):
+    '''
+    Identify a large file, or a folder by its model.py index, by its path,
+    size and modification time, which unlike hashing it costs nothing.
+    '''
+    if os.path.isdir(path):
+        path = os.path.join(path, 'index.json')
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+
+def result_key(args, content_path, style_path, vgg_path, network_path=None):
+    '''
+    Return the key of the result of a job, see the module documentation.
+    '''
+    # Imported here, as StyleTransfer uses this module.
+    import StyleTransfer
+    excluded = StyleTransfer.RUN_ARGS | HASHED_ARGS
+    fields = {name: value for name, value in vars(args).items() if name not in excluded}
+    return target_cache.make_key(kind='result', engine_version=ENGINE_VERSION, args=fields,
+                                 content=target_cache.file_hash(content_path),
+                                 style=target_cache.file_hash(style_path), weights=file_id(vgg_path),
+                                 network=target_cache.file_hash(network_path) if network_path else None)
+
+
+class ResultCache(TargetCache):
+    """TargetCache of the final image files of jobs."""
+
+    def store(self, key, filename):
+        """Keep the final image file of a job."""
+        with open(filename, 'rb') as f:
+            data = np.frombuffer(f.read(), dtype=np.uint8)
+        self.put(key, {'image': data, 'name': np.array(os.path.basename(filename)),
+                       'shape': np.array(cv2.imdecode(data, cv2.IMREAD_COLOR).shape)})
+
+    def restore(self, key, output_dir):
+        """
+        Write the final image stored for key into output_dir and return its
+        file name, or return None if the cache doesn't have it.
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        filename = os.path.join(output_dir, str(entry['name']))
+        stem = os.path.splitext(str(entry['name']))[0]
+        if stem.isdigit():
+            # Like a final snapshot, it must be the highest numbered one in the folder.
+            snapshot_writer.remove_snapshots_above(output_dir, int(stem))
+        tmp_path = filename + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(entry['image'].tobytes())
+        os.replace(tmp_path, filename)
+        # The message of snapshot_writer, which the UI watches for new images.
+        logger.info("Saved image file shape is:  %s", tuple(int(n) for n in entry['shape']))
+        return filename
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+import StyleTransfer
+from result_cache import ResultCache
+import result_cache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        rng = np.random.RandomState(0)
+        self.paths = {}
+        for name in ('content.png', 'style.png'):
+            self.paths[name] = os.path.join(self.folder, name)
+            cv2.imwrite(self.paths[name], rng.randint(0, 256, (8, 8, 3)).astype(np.uint8))
+        self.paths['vgg.npz'] = os.path.join(self.folder, 'vgg.npz')
+        np.savez(self.paths['vgg.npz'], conv1_1=np.zeros(4))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def key(self, argv):
+        args = StyleTransfer.parser.parse_args(argv)
+        return result_cache.result_key(args, self.paths['content.png'], self.paths['style.png'], self.paths['vgg.npz'])
+
+    def test_key_covers_the_job(self):
+        key = self.key(['--epoch', '100'])
+        self.assertEqual(key, self.key(['--epoch', '100', '--intra_op_threads', '2', '--no_style_cache']))
+        self.assertNotEqual(key, self.key(['--epoch', '101']))
+        cv2.imwrite(self.paths['style.png'], np.zeros((8, 8, 3), np.uint8))
+        self.assertNotEqual(key, self.key(['--epoch', '100']))
+
+    def test_store_and_restore(self):
+        cache = ResultCache(os.path.join(self.folder, 'results'), 2**20)
+        self.assertIsNone(cache.restore('key', self.folder))
+        cache.store('key', self.paths['content.png'])
+        output_dir = os.path.join(self.folder, 'output')
+        filename = cache.restore('key', output_dir)
+        self.assertEqual(os.path.join(output_dir, 'content.png'), filename)
+        with open(filename, 'rb') as restored, open(self.paths['content.png'], 'rb') as original:
+            self.assertEqual(original.read(), restored.read())
+
+    def test_restore_removes_higher_numbered_snapshots(self):
+        cache = ResultCache(os.path.join(self.folder, 'results'), 2**20)
+        path = os.path.join(self.folder, '500.jpg')
+        cv2.imwrite(path, np.zeros((8, 8, 3), np.uint8))
+        cache.store('key', path)
+        output_dir = os.path.join(self.folder, 'output')
+        os.makedirs(output_dir)
+        for name in ('100.jpg', '5000.jpg'):
+            open(os.path.join(output_dir, name), 'w').close()
+        cache.restore('key', output_dir)
+        self.assertEqual(['100.jpg', '500.jpg'], sorted(os.listdir(output_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
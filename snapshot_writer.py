@@ -0,0 +1,135 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+import stage_timing
+import utility
+
+'''
+Writes the snapshots of a style transfer job from a background thread, so
+the optimizer doesn't wait on image encoding and disk writes.
+
+A SnapshotWriter decides when a snapshot is due, every so many iterations
+and/or seconds, and takes the image of the model input as it is. Turning it
+back into pixels, encoding and writing it happen on the writer thread. The
+queue between them is bounded: when the disk falls behind, snapshots are
+skipped rather than slowing the optimizer down, except the final one, which
+is always written. With keep set, only the last keep snapshots stay on disk.
+
+Callers take the highest numbered snapshot in the folder as the result, so
+before the final one is written, any numbered above it are removed: an
+earlier job with more iterations, or a tiled or one pass job, which number
+their image by --epoch, may have left them there.
+'''
+
+# File extension and cv2.imwrite quality flag of each format.
+FORMATS = {'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+           'png': ('.png', None),
+           'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY)}
+
+logger = logging.getLogger(__name__)
+
+
+def remove_snapshots_above(output_dir, number):
+    '''
+    Remove the snapshots in output_dir numbered above number, see the module documentation.
+    '''
+    extensions = {extension for extension, _ in FORMATS.values()}
+    for name in os.listdir(output_dir):
+        stem, extension = os.path.splitext(name)
+        if extension in extensions and stem.isdigit() and int(stem) > number:
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except OSError:
+                pass
+
+
+class SnapshotWriter:
+    """Background writer of the snapshots of one job, see the module documentation."""
+
+    def __init__(self, output_dir, invert=0, every=100, seconds=0, image_format='jpg', quality=95, keep=0,
+                 queue_size=4):
+        self.output_dir = output_dir
+        self.invert = invert
+        self.every = every
+        self.seconds = seconds
+        self.extension, quality_flag = FORMATS[image_format]
+        self.params = [quality_flag, quality] if quality_flag is not None else []
+        self.keep = keep
+        self.kept = []
+        self.skipped = 0
+        self.last_time = time.time()
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        os.makedirs(output_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self.write_loop, name='snapshot writer', daemon=True)
+        self.thread.start()
+
+    def due(self, it):
+        """Whether a snapshot is due at iteration it, by iteration count or time since the last one."""
+        if self.every > 0 and it % self.every == 0:
+            return True
+        return self.seconds > 0 and time.time() - self.last_time >= self.seconds
+
+    def put(self, number, image, final=False, on_written=None):
+        """
+        Queue a [1, h, w, 3] model input image to be written as snapshot
+        number. on_written, if given, is called with the file name from the
+        writer thread once the file is on disk. Returns the file name, or
+        None if the queue was full and the snapshot skipped.
+        """
+        self.last_time = time.time()
+        filename = os.path.join(self.output_dir, '%d%s' % (number, self.extension))
+        try:
+            self.queue.put((filename, image, on_written, number if final else None), block=final)
+        except queue.Full:
+            self.skipped += 1
+            return None
+        return filename
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                filename, image, on_written, final_number = item
+                if final_number is not None:
+                    remove_snapshots_above(self.output_dir, final_number)
+                with stage_timing.span('write snapshot', file=os.path.basename(filename)):
+                    pixels = utility.to_pixels(image, self.invert)
+                    cv2.imwrite(filename, pixels, self.params)
+                logger.info("Saved image file shape is:  %s", pixels.shape)
+                self.kept.append(filename)
+                while self.keep > 0 and len(self.kept) > self.keep:
+                    try:
+                        os.remove(self.kept.pop(0))
+                    except OSError:
+                        pass
+                if on_written is not None:
+                    on_written(filename)
+            except Exception as e:
+                # Reported by flush, in the thread of the job.
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until every queued snapshot is written, and raise the first error writing them."""
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        """Write the queued snapshots and stop the writer thread."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.skipped:
+            print("Skipped %d snapshots while the disk was busy" % self.skipped)
+        if self.error is not None:
+            raise self.error
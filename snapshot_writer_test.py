@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from snapshot_writer import SnapshotWriter
+
+
+class SnapshotWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.image = np.zeros((1, 8, 12, 3), dtype=np.float32)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_keeps_last_snapshots(self):
+        written = []
+        writer = SnapshotWriter(self.folder, image_format='png', keep=2)
+        for number in range(5):
+            writer.put(number, self.image, final=True, on_written=written.append)
+        writer.close()
+        self.assertEqual(['3.png', '4.png'], sorted(os.listdir(self.folder)))
+        self.assertEqual(5, len(written))
+        self.assertEqual((8, 12, 3), cv2.imread(os.path.join(self.folder, '4.png')).shape)
+
+    def test_final_snapshot_removes_higher_numbered_ones(self):
+        for name in ('5000.jpg', '4900.png', '50.jpg', 'notes.txt'):
+            open(os.path.join(self.folder, name), 'w').close()
+        writer = SnapshotWriter(self.folder, image_format='png')
+        writer.put(200, self.image)
+        writer.flush()
+        self.assertIn('5000.jpg', os.listdir(self.folder))
+        writer.put(300, self.image, final=True)
+        writer.close()
+        self.assertEqual(['200.png', '300.png', '50.jpg', 'notes.txt'], sorted(os.listdir(self.folder)))
+
+    def test_cadence(self):
+        writer = SnapshotWriter(self.folder, every=100)
+        self.assertTrue(writer.due(200))
+        self.assertFalse(writer.due(250))
+        writer.close()
+
+        writer = SnapshotWriter(self.folder, every=0, seconds=0)
+        self.assertFalse(writer.due(0))
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, and the memory figures are None there.
+    resource = None
+
+'''
+Where the time of a logo generation job goes: interpreter startup, loading
+the VGG weights, building the graphs, the targets, the optimization, the
+snapshot writes, and the crop_image.py and image_and_type.py subprocesses.
+
+A script calls start() first in its main, wraps each stage in
+    with stage_timing.span('load VGG weights'):
+        ...
+and calls write_report() at the end. Each span records the wall time and
+CPU time it took, and the peak RSS of the process when it ended along with
+how much the span raised it, both None on Windows, which doesn't tell. The
+CPU time is that of the whole process, all threads included. Spans nest, and
+may come from any thread, like the snapshot writer's. Nothing is recorded
+before start() or after write_report(), so library code can be wrapped
+freely, and the long lived worker isn't affected.
+
+The report is JSON:
+    {"script": "StyleTransfer.py", "argv": [...], "started_at": 1700000000.0,
+     "seconds": 42.0, "cpu_seconds": 160.2, "peak_rss_mb": 2210.5,
+     "spans": [{"name": "load VGG weights", "start": 1.92, "seconds": 0.41,
+                "cpu_seconds": 0.40, "peak_rss_mb": 812.3, "rss_growth_mb": 560.2,
+                "thread": "MainThread", "depth": 0}, ...],
+     "children": [the reports of the scripts it ran]}
+Times are in seconds, and span starts are counted from started_at, the
+start of the process. The first span, "startup", covers the interpreter and
+the imports, up to start(). A script that runs another one passes it
+--timing and adds the report it writes with add_child.
+
+With a trace path the spans are also written as Chrome trace events, to
+open in chrome://tracing or ui.perfetto.dev, one track per process and thread.
+'''
+
+# The recording in progress, set by start().
+_state = {'started_at': None, 'spans': [], 'children': [], 'lock': threading.Lock()}
+# Nesting depth of the spans open in each thread.
+_local = threading.local()
+
+
+def process_start_time():
+    '''
+    Return the unix time this process started, or now where the OS doesn't tell.
+    '''
+    try:
+        with open('/proc/self/stat') as f:
+            # The fields after the command name, which may hold spaces; starttime is field 22.
+            ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+def peak_rss_mb():
+    '''
+    Return the highest resident set size this process has reached, in MB, or None without the resource module.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere.
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def start():
+    '''
+    Start recording the spans of this process, forgetting any earlier ones.
+    '''
+    now = time.time()
+    started_at = min(process_start_time(), now)
+    rss = peak_rss_mb()
+    with _state['lock']:
+        _state['started_at'] = started_at
+        _state['children'] = []
+        _state['spans'] = [{'name': 'startup', 'start': 0.0, 'seconds': now - started_at,
+                            'cpu_seconds': time.process_time(), 'peak_rss_mb': rss, 'rss_growth_mb': rss,
+                            'thread': threading.current_thread().name, 'depth': 0}]
+
+
+@contextlib.contextmanager
+def span(name, **details):
+    '''
+    Record the time and memory of the code in the with block as a span.
+    details are added to the span, e.g. the pyramid level.
+    '''
+    started_at = _state['started_at']
+    if started_at is None:
+        yield
+        return
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    start_time, start_cpu, start_rss = time.time(), time.process_time(), peak_rss_mb()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        rss = peak_rss_mb()
+        record = {'name': name, 'start': start_time - started_at, 'seconds': time.time() - start_time,
+                  'cpu_seconds': time.process_time() - start_cpu, 'peak_rss_mb': rss,
+                  'rss_growth_mb': rss - start_rss if rss is not None else None, 'thread': threading.current_thread().name, 'depth': depth}
+        record.update(details)
+        with _state['lock']:
+            if _state['started_at'] == started_at:
+                _state['spans'].append(record)
+
+
+def read_report(path):
+    '''
+    Return the report a script wrote to path, or None if it didn't.
+    '''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def add_child(report):
+    '''
+    Add the report of a script this one ran, if it wrote one.
+    '''
+    if report is not None and _state['started_at'] is not None:
+        with _state['lock']:
+            _state['children'].append(report)
+
+
+def report():
+    '''
+    Return the report of the spans recorded since start(), see the module documentation.
+    '''
+    with _state['lock']:
+        spans = sorted(_state['spans'], key=lambda record: record['start'])
+        return {'script': os.path.basename(sys.argv[0]), 'argv': sys.argv[1:], 'started_at': _state['started_at'],
+                'seconds': time.time() - _state['started_at'], 'cpu_seconds': time.process_time(),
+                'peak_rss_mb': peak_rss_mb(), 'spans': spans, 'children': list(_state['children'])}
+
+
+def trace_events(job_report):
+    '''
+    Return the Chrome trace events of a report and the reports of its
+    children, each child a process, timed from the start of the first.
+    '''
+    events = []
+    reports = [job_report]
+    for pid, process_report in enumerate(reports, 1):
+        reports.extend(process_report.get('children', []))
+        offset = process_report['started_at'] - job_report['started_at']
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                       'args': {'name': ' '.join([process_report['script']] + process_report['argv'])}})
+        threads = {}
+        for record in process_report['spans']:
+            if record['thread'] not in threads:
+                threads[record['thread']] = len(threads) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': threads[record['thread']],
+                               'args': {'name': record['thread']}})
+            args = {name: value for name, value in record.items() if name not in ('name', 'start', 'seconds')}
+            events.append({'name': record['name'], 'ph': 'X', 'pid': pid, 'tid': threads[record['thread']],
+                           'ts': (offset + record['start']) * 1e6, 'dur': record['seconds'] * 1e6, 'args': args})
+    return events
+
+
+def write_report(path, trace_path=None):
+    '''
+    Write the report to path, and the Chrome trace to trace_path if given,
+    then stop recording. Either path may be None or empty to skip it.
+    '''
+    if _state['started_at'] is None:
+        return
+    job_report = report()
+    _state['started_at'] = None
+    for file_path, content in ((path, job_report), (trace_path, {'traceEvents': trace_events(job_report)})):
+        if not file_path:
+            continue
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        with open(file_path, 'w') as f:
+            json.dump(content, f, indent=1)
+    if path:
+        print("Stage timing report written to", path)
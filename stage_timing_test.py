@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import stage_timing
+
+
+class StageTimingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+
+    def tearDown(self):
+        stage_timing.write_report(None)
+        self.tmpdir.cleanup()
+
+    def test_nothing_recorded_before_start(self):
+        with stage_timing.span('ignored'):
+            pass
+        stage_timing.start()
+        names = [record['name'] for record in stage_timing.report()['spans']]
+        self.assertEqual(['startup'], names)
+
+    def test_spans_nest_and_come_from_threads(self):
+        stage_timing.start()
+        with stage_timing.span('outer', level=1):
+            with stage_timing.span('inner'):
+                sum(range(100000))
+            thread = threading.Thread(target=self.writer_span, name='writer thread')
+            thread.start()
+            thread.join()
+        spans = {record['name']: record for record in stage_timing.report()['spans']}
+        self.assertEqual(0, spans['outer']['depth'])
+        self.assertEqual(1, spans['outer']['level'])
+        self.assertEqual(1, spans['inner']['depth'])
+        self.assertEqual(0, spans['writer']['depth'])
+        self.assertEqual('writer thread', spans['writer']['thread'])
+        self.assertGreaterEqual(spans['outer']['seconds'], spans['inner']['seconds'])
+        self.assertGreater(spans['inner']['peak_rss_mb'], 0)
+
+    def writer_span(self):
+        with stage_timing.span('writer'):
+            pass
+
+    def test_report_and_trace_include_children(self):
+        child_path = os.path.join(self.folder, 'child.json')
+        stage_timing.start()
+        with stage_timing.span('crop'):
+            pass
+        stage_timing.write_report(child_path)
+
+        stage_timing.start()
+        with stage_timing.span('crop_image.py'):
+            stage_timing.add_child(stage_timing.read_report(child_path))
+        path, trace_path = os.path.join(self.folder, 'job.json'), os.path.join(self.folder, 'trace.json')
+        stage_timing.write_report(path, trace_path)
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(['crop'], [record['name'] for record in report['children'][0]['spans']][1:])
+        with open(trace_path) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual({1, 2}, {event['pid'] for event in events})
+        self.assertIn('crop', [event['name'] for event in events if event['ph'] == 'X'])
+
+
+if __name__ == '__main__':
+    unittest.main()
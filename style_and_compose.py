@@ -2,6 +2,9 @@ import os
 from PIL import Image
 import argparse
 
+import stage_timing
+import worker_client
+
 '''
 Run this program.
 
@@ -15,6 +18,11 @@ With the above usage, the source image will be re-written with a cropped version
 
 Recommended minumum usage: python style_and_compose.py --CONTENT_IMAGE content_image_filename --STYLE_IMAGE style_image_filename --text "Text for Logo" --CROPPED_IMAGE filename_to_save_cropped_image --saveto save_to_file_name
 The above will keep the original source image and will saved a new, cropped version, and will customize the name of the resulting logo
+
+Add --worker to send the style transfer to a running style_worker.py instead of starting StyleTransfer.py
+
+Add --timing timing.json to write the time and memory of each stage, those of
+the scripts it runs included; see stage_timing.py.
 '''
 
 parser = argparse.ArgumentParser(description='A Neural Algorithm of Artistic Style')
@@ -24,7 +32,9 @@ parser.add_argument('--w2', '-w2',type=float, default='1',help='w2')
 parser.add_argument('--w3', '-w3',type=float, default='1',help='w3')
 parser.add_argument('--w4', '-w4',type=float, default='1',help='w4')
 parser.add_argument('--w5', '-w5',type=float, default='1',help='w5')
-parser.add_argument("--IMAGE_WIDTH", "-width",type=int, default = 400, help = "width & height of image")
+parser.add_argument("--IMAGE_WIDTH", "-width",type=int, default = 400, help = "width of image")
+parser.add_argument("--IMAGE_HEIGHT", "-height",type=int, default = 0, help = "height of image, 0 for the width, or see --keep_aspect")
+parser.add_argument("--keep_aspect", help="keep the shape of the cropped content image instead of padding it to a square", action="store_true")
 parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, help = "Path to content image")
 parser.add_argument("--STYLE_IMAGE", "-STYLE_IMAGE", type=str, help = "Path to style image")
 parser.add_argument("--CROPPED_IMAGE", "-CROPPED_IMAGE", type=str, help = "Path to content image", default="empty")
@@ -33,6 +43,13 @@ parser.add_argument("--alpha",  "-alpha",type=float,  default="0.001",   help="a
 parser.add_argument("--beta",   "-beta", type=float,  default="0.8",     help="beta")
 parser.add_argument("--gamma",  "-gamma",type=float,  default="0.001",    help="gamma")
 parser.add_argument("--epoch",  "-epoch",type=int, default=5000, help="number of epochs to run" )
+parser.add_argument("--style_layers", type=str, default='conv1_2,conv2_2,conv3_2,conv4_2,conv5_2', help="comma separated VGG layers for the style loss")
+parser.add_argument("--content_layers", type=str, default='conv4_2', help="comma separated VGG layers for the content loss")
+parser.add_argument("--pyramid", type=int, default=1, help="optimize at this many sizes, each half the next; 1 turns it off")
+parser.add_argument("--pyramid_epoch", type=int, default=500, help="number of iterations at each pyramid size before the last")
+parser.add_argument("--preview", help="Stylize in one pass for a quick preview instead of optimizing, see adain.py", action="store_true")
+parser.add_argument("--worker", help="Run the style transfer on a running style_worker.py", action="store_true")
+parser.add_argument("--worker_port", type=int, default=worker_client.DEFAULT_PORT, help="Port of the style_worker.py to use")
 
 #Args for image + type
 parser.add_argument('--text', type=str, help='Text for the logo')
@@ -51,7 +68,31 @@ parser.add_argument('--ital', help='Select italic serif typeface', action='store
 parser.add_argument('--alignleft', help='Align image to the left of the text', action='store_true')
 parser.add_argument('--alignright', help='Align image to the right of the text', action='store_true')
 parser.add_argument('--aligncenter', help='Center image and text', action='store_true')
+parser.add_argument('--timing', type=str, default=None, help='Write the time and memory of each stage, those of the scripts it runs included, to this JSON file')
+parser.add_argument('--trace', type=str, default=None, help='Also write the stages as a Chrome trace to this file')
 args = parser.parse_args()
+stage_timing.start()
+
+
+def run_stage(name, command):
+    '''
+    Run one of the scripts of the job as a stage, and with --timing add the
+    timing report it writes.
+    '''
+    timing_path = None
+    if args.timing:
+        timing_path = os.path.splitext(args.timing)[0] + '_' + os.path.splitext(name)[0] + '.json'
+        command += ' --timing ' + timing_path
+    with stage_timing.span(name):
+        os.system(command)
+    if timing_path is None:
+        return
+    stage_timing.add_child(stage_timing.read_report(timing_path))
+    try:
+        os.remove(timing_path)
+    except OSError:
+        pass
+
 
 # try:
 #     source_image = Image.open(args.CONTENT_IMAGE)
@@ -63,8 +104,10 @@ args = parser.parse_args()
 # source_image_width, source_image_height = source_image.size
 # EDIT: Made it 500 x 500 to make it a bit bigger
 crop_image = f'python crop_image.py --CONTENT_IMAGE {args.CONTENT_IMAGE} --CROPPED_IMAGE {args.CROPPED_IMAGE}'
+if args.keep_aspect:
+    crop_image += ' --no_pad'
 
-os.system(crop_image)
+run_stage('crop_image.py', crop_image)
 
 
 if args.CROPPED_IMAGE != 'empty':
@@ -75,14 +118,6 @@ args.IMAGE_WIDTH = 300
 
 
 
-style_transfer_commands = f'python StyleTransfer.py -w1 {args.w1} -w2 {args.w2} -w3 {args.w3} -w4 {args.w4} -w5 {args.w5} --IMAGE_WIDTH {args.IMAGE_WIDTH} -CONTENT_IMAGE {args.CONTENT_IMAGE} -STYLE_IMAGE {args.STYLE_IMAGE} -alpha {args.alpha} -beta {args.beta} -gamma {args.gamma} -epoch {args.epoch}'
-
-if args.GPU:
-    style_transfer_commands += ' -GPU'
-
-os.system(style_transfer_commands)
-
-
 CONTENT_IMAGE = args.CONTENT_IMAGE
 STYLE_IMAGE = args.STYLE_IMAGE
 
@@ -115,6 +150,39 @@ style_path = STYLE_IMAGE[:1-slash]
 style_name = STYLE_IMAGE[-slash:-dot]
 
 OUTPUT_DIR = ("output/" + content_name + "_vs_" + style_name)
+
+if args.worker and worker_client.worker_available(port=args.worker_port):
+    job = {
+        'CONTENT_IMAGE': os.path.abspath('input/' + CONTENT_IMAGE),
+        'STYLE_IMAGE': os.path.abspath('input/' + STYLE_IMAGE),
+        'IMAGE_WIDTH': args.IMAGE_WIDTH, 'IMAGE_HEIGHT': args.IMAGE_HEIGHT, 'keep_aspect': args.keep_aspect,
+        'w1': args.w1, 'w2': args.w2, 'w3': args.w3, 'w4': args.w4, 'w5': args.w5,
+        'alpha': args.alpha, 'beta': args.beta, 'gamma': args.gamma,
+        'epoch': args.epoch,
+        'style_layers': args.style_layers, 'content_layers': args.content_layers,
+        'pyramid': args.pyramid, 'pyramid_epoch': args.pyramid_epoch,
+        'preview': args.preview,
+        'output_dir': os.path.abspath(OUTPUT_DIR),
+    }
+    with stage_timing.span('style transfer worker'):
+        event = worker_client.submit_job(job, port=args.worker_port)
+    if event['event'] == 'error':
+        print('Style transfer worker error:', event['message'])
+        exit()
+else:
+    if args.worker:
+        print('No style transfer worker running on port', args.worker_port, '- running StyleTransfer.py')
+    style_transfer_commands = f'python StyleTransfer.py -w1 {args.w1} -w2 {args.w2} -w3 {args.w3} -w4 {args.w4} -w5 {args.w5} --IMAGE_WIDTH {args.IMAGE_WIDTH} --IMAGE_HEIGHT {args.IMAGE_HEIGHT} -CONTENT_IMAGE {args.CONTENT_IMAGE} -STYLE_IMAGE {args.STYLE_IMAGE} -alpha {args.alpha} -beta {args.beta} -gamma {args.gamma} -epoch {args.epoch} --style_layers {args.style_layers} --content_layers {args.content_layers} --pyramid {args.pyramid} --pyramid_epoch {args.pyramid_epoch}'
+
+    if args.keep_aspect:
+        style_transfer_commands += ' --keep_aspect'
+    if args.GPU:
+        style_transfer_commands += ' -GPU'
+    if args.preview:
+        style_transfer_commands += ' --preview'
+
+    run_stage('StyleTransfer.py', style_transfer_commands)
+
 f = []
 for (dirpath, dirnames, filenames) in os.walk(OUTPUT_DIR):
     f.extend(filenames)
@@ -123,7 +191,7 @@ numbers = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
 for item in f:
     if item[0] not in numbers:
         f.remove(item)
-f.sort(key = lambda w: int(w[0:-4]))
+f.sort(key = lambda w: int(os.path.splitext(w)[0]))
 image_path = os.path.join(OUTPUT_DIR, f[-1])
 try:
     source_image = Image.open('input/' + CONTENT_IMAGE)
@@ -155,7 +223,9 @@ if args.aligncenter:
     compose_commands += ' --aligncenter'
 
 
-os.system(compose_commands)
+run_stage('image_and_type.py', compose_commands)
+if args.timing or args.trace:
+    stage_timing.write_report(args.timing, args.trace)
 
 
 
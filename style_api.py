@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+import style_worker
+
+'''
+Style transfer as a function call, for Python code that would otherwise run
+StyleTransfer.py in a subprocess and pay for starting Python, importing
+TensorFlow, reading the VGG weights and building the graph on every job.
+
+    import style_api
+    image, history = style_api.stylize('input/a.png', 'input/styles/zebra_1.jpg', IMAGE_WIDTH=300, epoch=500)
+
+The content and style images are paths, or uint8 BGR arrays like cv2.imread
+returns. Any other StyleTransfer.py argument of a job is a keyword, with its
+defaults otherwise, so the caches, warm start, the pyramid, style networks,
+--preview and --tile all work as they do there; the engine and threads are
+those of the worker. The image returned is a uint8 BGR array, and the
+history the losses of each iteration:
+    [{"iteration": 0, "total_loss": 3.1e6, "content_loss": 2.0e6,
+      "style_loss": 1.0e6, "shape_loss": 1.0e5}, ...]
+each term times its weight, as in progress.py, every progress_every
+iterations, 1 by default. Jobs that don't optimize have an empty history.
+
+The job runs in this process, but its images pass through files: arrays
+given as the content or style are written to a temporary folder as PNG, as
+the caches, checkpoints and warm starts are keyed by files, and the image
+returned is read back from the final snapshot the job wrote, so it has the
+precision of snapshot_format, lossless PNG unless it says otherwise.
+
+Calls share a style_worker.StyleTransferWorker, made by the first call, so
+the weights are read once and the graph and session of each image size are
+built once per process; a call may pass its own worker instead, e.g. one
+with the tf2 engine. StyleTransfer.py runs its job the same way.
+'''
+
+# The worker shared by calls that don't pass one, made on first use.
+_default_worker = {}
+
+
+def default_worker(vgg_path=None):
+    '''
+    Return the StyleTransferWorker shared by the stylize calls of this process
+    using the VGG weights at vgg_path, or the default weights if None.
+    '''
+    if vgg_path not in _default_worker:
+        _default_worker[vgg_path] = style_worker.StyleTransferWorker(vgg_path)
+    return _default_worker[vgg_path]
+
+
+def is_path(image):
+    return isinstance(image, (str, os.PathLike))
+
+
+def image_path(image, folder, name):
+    '''
+    Return the path of an image given as a path, or as an array, which is
+    written to folder as a PNG, losslessly, so the caches see the same file
+    for the same array.
+    '''
+    if is_path(image):
+        return os.fspath(image)
+    image = np.asarray(image)
+    if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] != 3:
+        raise ValueError("expected a path or an HxWx3 uint8 BGR image, not %s %s" % (image.dtype, image.shape))
+    path = os.path.join(folder, name + '.png')
+    cv2.imwrite(path, image)
+    return path
+
+
+def stylize(content, style, output_dir=None, on_event=None, worker=None, vgg_path=None, **options):
+    '''
+    Run a style transfer job in this process and return the final image,
+    read back from its file, and the loss history, see the module
+    documentation.
+
+    The snapshots are written to output_dir, or a temporary folder removed
+    afterwards if None; they are PNG unless snapshot_format says otherwise.
+    on_event, if given, gets the events of the job, see worker_client.py.
+    '''
+    if worker is None:
+        worker = default_worker(vgg_path)
+    options.setdefault('snapshot_format', 'png')
+    options.setdefault('progress_every', 1)
+    history = []
+
+    def on_job_event(event):
+        if event['event'] == 'progress':
+            history.append(dict(event['losses'], iteration=event['iteration']))
+        if on_event is not None:
+            on_event(event)
+
+    with tempfile.TemporaryDirectory() as folder:
+        content_path = image_path(content, folder, 'content')
+        style_path = image_path(style, folder, 'style')
+        # The names are part of the checkpoint hash, so arrays get the same
+        # name every call rather than the temporary path.
+        options.setdefault('CONTENT_IMAGE', content_path if is_path(content) else 'content.png')
+        options.setdefault('STYLE_IMAGE', style_path if is_path(style) else 'style.png')
+        args = style_worker.job_args(options)
+        done = worker.run_args(args, content_path, style_path, output_dir or os.path.join(folder, 'output'),
+                               on_job_event)
+        image = cv2.imread(done['image'])
+    if on_event is not None:
+        on_event(done)
+    return image, history
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from StyleTransfer import tf
+import fast_style
+import style_api
+import style_worker
+import test_fixtures
+
+SIZE = 32
+# Nothing written to the caches in the working folder.
+OPTIONS = dict(IMAGE_WIDTH=SIZE, epoch=4, no_style_cache=True, no_content_cache=True, no_result_cache=True,
+               no_warm_start=True, no_fast_style=True)
+
+
+class StyleApiTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.worker = style_worker.StyleTransferWorker(test_fixtures.write_random_weights(cls.tmpdir.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.worker.close()
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.content = test_fixtures.glyph_image(SIZE, SIZE)
+        self.style = test_fixtures.noise_image(SIZE * 2, SIZE * 2)
+
+    def test_stylize_arrays_reuses_the_session(self):
+        events = []
+        image, history = style_api.stylize(self.content, self.style, on_event=events.append, worker=self.worker,
+                                           **OPTIONS)
+        self.assertEqual((SIZE, SIZE, 3), image.shape)
+        self.assertEqual(np.uint8, image.dtype)
+        self.assertEqual(list(range(5)), [record['iteration'] for record in history])
+        self.assertEqual({'iteration', 'total_loss', 'content_loss', 'style_loss', 'shape_loss'}, set(history[0]))
+        self.assertEqual('done', events[-1]['event'])
+
+        image, history = style_api.stylize(self.content, self.style, worker=self.worker, **dict(OPTIONS, epoch=2))
+        self.assertEqual(3, len(history))
+        self.assertEqual(1, len(self.worker.sessions))
+
+    def test_preview_with_a_style_network_needs_no_decoder(self):
+        style_path = os.path.join(self.tmpdir.name, 'zebra.png')
+        cv2.imwrite(style_path, self.style)
+        network_dir = os.path.join(self.tmpdir.name, 'fast_style')
+        with tf.Graph().as_default():
+            with tf.variable_scope('transform'):
+                fast_style.transform_network(tf.zeros((1, SIZE, SIZE, 3)), fast_style.new_weight)
+            variables = tf.trainable_variables('transform')
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                weights = {variable.op.name[len('transform/'):]: value
+                           for variable, value in zip(variables, sess.run(variables))}
+        options = dict(OPTIONS, no_fast_style=False, fast_style_dir=network_dir, preview=True,
+                       adain_decoder=os.path.join(self.tmpdir.name, 'missing.npz'))
+        fast_style.save_network(fast_style.network_name(style_path, network_dir), weights, style_path,
+                                style_worker.job_args(options))
+        image, history = style_api.stylize(self.content, style_path, worker=self.worker, **options)
+        self.assertEqual((SIZE, SIZE, 3), image.shape)
+        self.assertEqual([], history)
+
+    def test_stylize_rejects_other_arrays(self):
+        with self.assertRaises(ValueError):
+            style_api.stylize(self.content.astype(np.float32), self.style, worker=self.worker, **OPTIONS)
+
+
+if __name__ == '__main__':
+    unittest.main()
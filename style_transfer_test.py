@@ -0,0 +1,339 @@
+import argparse
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import checkpoint
+import model
+from model_test import random_conv_weights
+import target_cache
+import test_fixtures
+import utility
+
+SIZE = 32
+
+
+def random_job(rng, graph, alpha):
+    """Random targets for a graph, and the arguments of a job using them."""
+    content_targets = {layer_name: rng.rand(*graph['content_targets'][layer_name].shape.as_list()[1:])[np.newaxis]
+                       for layer_name in graph['content_layers']}
+    content_targets['dist_template'] = rng.rand(SIZE, SIZE)
+    content_targets['shape_target'] = rng.rand(SIZE, SIZE)
+    style_grams = {layer_name: rng.rand(*graph['style_grams'][layer_name].shape.as_list()[1:])
+                   for layer_name in graph['style_layers']}
+    args = argparse.Namespace(alpha=alpha, beta=0.8, gamma=0.001, w1=1, w2=2, w3=3, w4=4, w5=5)
+    return content_targets, style_grams, args
+
+
+class BatchGraphTestCase(unittest.TestCase):
+
+    def test_batch_losses_match_single_jobs(self):
+        rng = np.random.RandomState(0)
+        vgg_weights = random_conv_weights()
+        with tf.Graph().as_default():
+            single = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE)
+            batch = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE, batch_size=2)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                jobs = [random_job(rng, single, 0.001), random_job(rng, single, 0.01)]
+                images = rng.rand(2, SIZE, SIZE, 3).astype(np.float32)
+
+                StyleTransfer.set_batch_targets(sess, batch, *zip(*jobs))
+                batch['model']['input'].load(images, sess)
+                batch_losses, total_loss = sess.run([batch['sample_losses'], batch['total_loss']])
+
+                for n, job in enumerate(jobs):
+                    StyleTransfer.set_job_targets(sess, single, *job)
+                    single['model']['input'].load(images[n:n+1], sess)
+                    losses = sess.run({name: single[name] for name in StyleTransfer.LOSS_NAMES})
+                    for name in StyleTransfer.LOSS_NAMES:
+                        self.assertAlmostEqual(1.0, batch_losses[name][n] / losses[name], places=4)
+                self.assertAlmostEqual(1.0, total_loss / batch_losses['total_loss'].sum(), places=5)
+
+
+    def test_inactive_images_are_frozen(self):
+        rng = np.random.RandomState(0)
+        vgg_weights = model.random_vgg_weights()
+        with tf.Graph().as_default():
+            single = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE)
+            batch = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE, batch_size=2)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                jobs = [random_job(rng, single, 0.001), random_job(rng, single, 0.01)]
+                images = rng.rand(2, SIZE, SIZE, 3).astype(np.float32) * 255 - 128
+                StyleTransfer.set_batch_targets(sess, batch, *zip(*jobs))
+                batch['model']['input'].load(images, sess)
+                sess.run(batch['train_step'])
+                stopped = sess.run(batch['model']['input'])
+
+                batch['active'].load([1, 0], sess)
+                for _ in range(3):
+                    sess.run(batch['train_step'])
+                result = sess.run(batch['model']['input'])
+        self.assertGreater(np.abs(result[0] - stopped[0]).max(), 0)
+        np.testing.assert_array_equal(stopped[1], result[1])
+
+
+class PrecisionTestCase(unittest.TestCase):
+
+    def test_bfloat16_losses_close_to_float32(self):
+        rng = np.random.RandomState(0)
+        vgg_weights = random_conv_weights()
+        image = rng.rand(1, SIZE, SIZE, 3).astype(np.float32) * 255
+        losses = {}
+        for precision in ['float32', 'bfloat16']:
+            with tf.Graph().as_default():
+                graph = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE, precision=precision)
+                self.assertEqual(tf.float32, graph['grams'][graph['style_layers'][0]].dtype)
+                self.assertEqual(tf.float32, graph['total_loss'].dtype)
+                with tf.Session() as sess:
+                    sess.run(tf.global_variables_initializer())
+                    StyleTransfer.set_job_targets(sess, graph, *random_job(np.random.RandomState(1), graph, 0.001))
+                    graph['model']['input'].load(image, sess)
+                    losses[precision] = sess.run({name: graph[name] for name in StyleTransfer.LOSS_NAMES})
+        for name in StyleTransfer.LOSS_NAMES:
+            self.assertAlmostEqual(1.0, losses['bfloat16'][name] / losses['float32'][name], places=1)
+
+
+class ResumeTestCase(unittest.TestCase):
+
+    def test_resumed_run_matches_uninterrupted_run(self):
+        rng = np.random.RandomState(0)
+        # VGG scaled weights, so the losses stay finite while optimizing.
+        vgg_weights = model.random_vgg_weights()
+        args = StyleTransfer.parser.parse_args(['--epoch', '20', '--checkpoint_every', '10', '--stop_plateau', '0'])
+        with tf.Graph().as_default():
+            graph = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE)
+            content_targets, style_grams, _ = random_job(rng, graph, args.alpha)
+            content_targets['content_image'] = rng.rand(1, SIZE, SIZE, 3).astype(np.float32) * 255 - 128
+            with tf.Session() as sess, tempfile.TemporaryDirectory() as output_dir:
+                sess.run(tf.global_variables_initializer())
+                checkpoints = []
+                StyleTransfer.run_style_transfer(sess, graph, content_targets, style_grams, args, output_dir,
+                                                 on_checkpoint=lambda *state: checkpoints.append(state))
+                uninterrupted = sess.run(graph['model']['input'])
+                self.assertEqual([10], [it for it, image, slots in checkpoints])
+
+                it, image, slots = checkpoints[0]
+                StyleTransfer.run_style_transfer(sess, graph, content_targets, style_grams, args, output_dir,
+                                                 resume={'iteration': it, 'image': image, 'slots': slots})
+                self.assertTrue(np.isfinite(uninterrupted).all())
+                np.testing.assert_allclose(uninterrupted, sess.run(graph['model']['input']), rtol=1e-5, atol=1e-3)
+
+
+class LbfgsTestCase(unittest.TestCase):
+
+    def test_loss_decreases_and_snapshots_written(self):
+        rng = np.random.RandomState(0)
+        args = StyleTransfer.parser.parse_args(['--optimizer', 'lbfgs', '--epoch', '5', '--snapshot_every', '1',
+                                                '--snapshot_format', 'png'])
+        with tf.Graph().as_default():
+            graph = StyleTransfer.build_style_transfer_graph(model.random_vgg_weights(), SIZE, SIZE)
+            with tf.Session() as sess, tempfile.TemporaryDirectory() as output_dir:
+                sess.run(tf.global_variables_initializer())
+                content_image = rng.rand(1, SIZE, SIZE, 3).astype(np.float32) * 255 - 128
+                style_image = rng.rand(1, SIZE, SIZE, 3).astype(np.float32) * 255 - 128
+                content_targets = StyleTransfer.compute_content_targets(sess, graph, content_image)
+                style_grams = StyleTransfer.compute_style_grams(sess, graph, style_image)
+                snapshots = []
+                filename = StyleTransfer.run_style_transfer(
+                    sess, graph, content_targets, style_grams, args, output_dir,
+                    on_snapshot=lambda it, filename, loss: snapshots.append((it, filename, loss)))
+
+                iterations = [it for it, _, _ in snapshots]
+                self.assertEqual(list(range(len(snapshots))), iterations)
+                self.assertGreater(len(snapshots), 2)
+                self.assertLessEqual(iterations[-1], args.epoch)
+                losses = [loss for _, _, loss in snapshots]
+                self.assertLess(losses[-1], 0.9 * losses[0])
+                self.assertTrue(all(later <= earlier for earlier, later in zip(losses, losses[1:])))
+                for _, name, _ in snapshots:
+                    self.assertTrue(os.path.exists(os.path.join(output_dir, name)))
+                self.assertEqual(snapshots[-1][1], filename)
+
+
+class ContentCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.content_path, _ = test_fixtures.write_test_images(self.folder, (SIZE, SIZE))
+        args = StyleTransfer.parser.parse_args(['--content_cache', os.path.join(self.folder, 'cache')])
+        self.cache = StyleTransfer.open_content_cache(args)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def load(self, sess, graph):
+        """load_content_targets, and whether it computed the targets rather than reading them."""
+        with mock.patch.object(StyleTransfer, 'compute_content_targets',
+                               wraps=StyleTransfer.compute_content_targets) as compute:
+            targets = StyleTransfer.load_content_targets(sess, graph, self.content_path, self.cache)
+        return targets, compute.called
+
+    def test_hit_and_key_changes(self):
+        vgg_weights = model.random_vgg_weights()
+        with tf.Graph().as_default():
+            graph = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE)
+            wide = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, 2 * SIZE)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                targets, computed = self.load(sess, graph)
+                self.assertTrue(computed)
+                cached, computed = self.load(sess, graph)
+                self.assertFalse(computed)
+                self.assertEqual(set(targets), set(cached))
+                for name in targets:
+                    np.testing.assert_array_equal(targets[name], cached[name])
+                # The distance template is cached with the features.
+                content_image = utility.load_image(self.content_path, SIZE, SIZE,
+                                                   invert=StyleTransfer.content_invert)
+                np.testing.assert_array_equal(StyleTransfer.content_dist_template(content_image),
+                                              cached['dist_template'])
+
+                # Another size is another entry.
+                targets, computed = self.load(sess, wide)
+                self.assertTrue(computed)
+                self.assertEqual((SIZE, 2 * SIZE), targets['dist_template'].shape)
+                self.assertEqual(2, len(self.cache.entries()))
+
+                # So is the same file name with other contents.
+                image = cv2.imread(self.content_path)
+                cv2.imwrite(self.content_path, 255 - image)
+                targets, computed = self.load(sess, graph)
+                self.assertTrue(computed)
+                self.assertFalse(np.array_equal(cached['dist_template'], targets['dist_template']))
+                self.assertEqual(3, len(self.cache.entries()))
+
+    def test_entry_evicted_before_the_touch(self):
+        utime = os.utime
+
+        def evict_then_touch(path, *args):
+            # Another process evicts the entry between the read and the touch.
+            os.remove(path)
+            utime(path, *args)
+
+        with tf.Graph().as_default():
+            graph = StyleTransfer.build_style_transfer_graph(model.random_vgg_weights(), SIZE, SIZE)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                targets, _ = self.load(sess, graph)
+                with mock.patch.object(target_cache.os, 'utime', side_effect=evict_then_touch):
+                    cached, computed = self.load(sess, graph)
+                self.assertFalse(computed)
+                np.testing.assert_array_equal(targets['shape_target'], cached['shape_target'])
+                self.assertEqual([], self.cache.entries())
+
+
+class PyramidTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.content_path, self.style_path = test_fixtures.write_test_images(self.folder, (2 * SIZE, 2 * SIZE),
+                                                                             (2 * SIZE, 2 * SIZE))
+        self.output_dir = os.path.join(self.folder, 'output')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_pyramid(self, sess, levels, *flags):
+        """run_pyramid with two levels, and the (graph, initial image, kwargs) and final image of each level run."""
+        args = StyleTransfer.parser.parse_args(['--pyramid', '2', '--pyramid_epoch', '3', '--epoch', '4',
+                                                '--snapshot_every', '1', '--snapshot_format', 'png',
+                                                '--no_style_cache', '--no_content_cache', '--no_result_cache',
+                                                '--no_warm_start'] + list(flags))
+        runs = []
+        run_style_transfer = StyleTransfer.run_style_transfer
+
+        def run_level(sess, graph, *args, **kwargs):
+            filename = run_style_transfer(sess, graph, *args, **kwargs)
+            runs.append((graph, kwargs, StyleTransfer.optimizer_steps(sess, graph).image()))
+            return filename
+
+        with mock.patch.object(StyleTransfer, 'run_style_transfer', side_effect=run_level):
+            filename = StyleTransfer.run_pyramid(levels, self.content_path, self.style_path, args, self.output_dir)
+        return filename, runs
+
+    def test_second_level_starts_from_the_first(self):
+        vgg_weights = model.random_vgg_weights()
+        with tf.Graph().as_default():
+            levels = [StyleTransfer.build_style_transfer_graph(vgg_weights, height, width)
+                      for height, width in StyleTransfer.pyramid_sizes(2 * SIZE, 2 * SIZE, 2)]
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                filename, runs = self.run_pyramid(sess, [(sess, graph) for graph in levels],
+                                                  '--checkpoint_every', '0')
+                content_targets = StyleTransfer.compute_content_targets(
+                    sess, levels[1], utility.load_image(self.content_path, 2 * SIZE, 2 * SIZE,
+                                                        invert=StyleTransfer.content_invert))
+
+        self.assertEqual(levels, [graph for graph, _, _ in runs])
+        self.assertIsNone(runs[0][1]['initial_image'])
+        self.assertEqual([0, 4], [kwargs['first_iteration'] for _, kwargs, _ in runs])
+        # The first level's result, resized, where the shape loss lets pixels move.
+        content_image = content_targets['content_image']
+        freedom = StyleTransfer.shape_freedom(content_targets['dist_template'], 0.001)[np.newaxis, :, :, np.newaxis]
+        upsampled = StyleTransfer.upsample_image(runs[0][2], 2 * SIZE, 2 * SIZE)
+        self.assertEqual((1, 2 * SIZE, 2 * SIZE, 3), upsampled.shape)
+        initial_image = runs[1][1]['initial_image']
+        np.testing.assert_allclose(content_image + freedom * (upsampled - content_image), initial_image,
+                                   rtol=1e-5, atol=1e-3)
+        self.assertGreater(np.abs(initial_image - content_image).max(), 1)
+        self.assertEqual('8.png', os.path.basename(filename))
+
+    def test_resume_skips_finished_levels(self):
+        vgg_weights = model.random_vgg_weights()
+        with tf.Graph().as_default():
+            levels = [StyleTransfer.build_style_transfer_graph(vgg_weights, height, width)
+                      for height, width in StyleTransfer.pyramid_sizes(2 * SIZE, 2 * SIZE, 2)]
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                levels = [(sess, graph) for graph in levels]
+                # Keep the last checkpoint, as if the job had been stopped after it.
+                with mock.patch.object(checkpoint.Checkpoint, 'remove'):
+                    self.run_pyramid(sess, levels, '--checkpoint_every', '2')
+                filename, runs = self.run_pyramid(sess, levels, '--checkpoint_every', '2', '--resume')
+
+        self.assertEqual([levels[1][1]], [graph for graph, _, _ in runs])
+        resume = runs[0][1]['resume']
+        self.assertEqual((1, 2), (resume['level'], resume['iteration']))
+        self.assertEqual(4, runs[0][1]['first_iteration'])
+        self.assertEqual('8.png', os.path.basename(filename))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, checkpoint.CHECKPOINT_NAME)))
+
+
+class PyramidSizesTestCase(unittest.TestCase):
+
+    def test_halves_both_sides(self):
+        self.assertEqual([(25, 75), (50, 150), (100, 300)], StyleTransfer.pyramid_sizes(100, 300, 3))
+
+    def test_smallest_size_checked(self):
+        self.assertIsNone(StyleTransfer.check_pyramid(64, 192, 2))
+        self.assertIsNotNone(StyleTransfer.check_pyramid(32, 96, 2))
+        self.assertIsNotNone(StyleTransfer.check_pyramid(300, 300, 0))
+
+
+class InputPathTestCase(unittest.TestCase):
+
+    def test_under_input_unless_absolute_or_outside(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as folder:
+            os.chdir(folder)
+            try:
+                os.makedirs('input')
+                open('input/a.png', 'wb').close()
+                open('b.png', 'wb').close()
+                self.assertEqual('input/a.png', StyleTransfer.input_path('a.png'))
+                self.assertEqual('b.png', StyleTransfer.input_path('b.png'))
+                self.assertEqual('input/missing.png', StyleTransfer.input_path('missing.png'))
+                absolute = os.path.join(folder, 'b.png')
+                self.assertEqual(absolute, StyleTransfer.input_path(absolute))
+            finally:
+                os.chdir(cwd)
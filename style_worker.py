@@ -0,0 +1,348 @@
+import argparse
+import collections
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+import StyleTransfer
+from StyleTransfer import tf
+import adain
+import fast_style
+import model
+import result_cache
+import stage_timing
+import tiled
+import thread_tuning
+import worker_client
+
+'''
+Long running style transfer worker.
+
+Running StyleTransfer.py once per logo pays for starting Python, importing
+TensorFlow, reading the VGG weights and building the graph before the first
+iteration. The worker does that work once: it keeps the VGG weights in memory,
+and one graph and session per image size, and then runs jobs sent by
+style_and_compose.py --worker or the UI over a local socket.
+
+Usage: python style_worker.py [--port 6510] [--GPU] [--max_sessions 4]
+
+See worker_client.py for the job format. Jobs run one at a time, in the order
+they arrive. Before each job, the least recently used graphs and sessions
+beyond --max_sessions are closed, so a worker serving many sizes doesn't grow
+without bound.
+'''
+
+# Graphs and sessions a worker keeps between jobs.
+MAX_SESSIONS = 4
+
+
+class StyleTransferWorker:
+    """Keeps the VGG weights and a style transfer graph per image size loaded between jobs."""
+
+    def __init__(self, vgg_path=None, gpu=False, config=None, engine='v1', jit_compile=True, layers=None,
+                 max_sessions=MAX_SESSIONS):
+        if vgg_path is None:
+            vgg_path = StyleTransfer.vgg_weights_path()
+        self.vgg_path = vgg_path
+        # The VGG layers jobs may use, all of them if None; the weights are read by the first job that needs them.
+        self.layers = layers
+        self._vgg_weights = None
+        self.device = "/gpu:0" if gpu else "/cpu:0"
+        # tf.ConfigProto for the sessions, or None for the defaults.
+        self.config = config
+        # 'v1' for graphs and sessions, 'tf2' for tf2_engine functions, which
+        # take no session; tf2_engine.enable() must have been called.
+        self.engine = engine
+        self.jit_compile = jit_compile
+        # (height, width, style layers, content layers, precision) -> (graph dict, session),
+        # least recently used first; a job may use more than max_sessions, see trim_sessions.
+        self.sessions = collections.OrderedDict()
+        self.max_sessions = max_sessions
+        # Path of a fast_style.py network or adain.py decoder -> (its modification time, the network)
+        self.networks = {}
+
+    @property
+    def vgg_weights(self):
+        """The VGG weights, read the first time they are needed."""
+        if self._vgg_weights is None:
+            with stage_timing.span('load VGG weights'):
+                self._vgg_weights = model.load_vgg_weights(self.vgg_path, self.layers)
+        return self._vgg_weights
+
+    def session_for_size(self, height, width, style_layers=StyleTransfer.STYLE_LAYERS,
+                         content_layers=StyleTransfer.CONTENT_LAYERS, precision='float32'):
+        """Return the graph and session for an image size, layer set and precision, building them the first time."""
+        key = (height, width, tuple(style_layers), tuple(content_layers), precision)
+        if key not in self.sessions and self.engine == 'tf2':
+            import tf2_engine
+            vgg_weights = self.vgg_weights
+            with stage_timing.span('build graphs', height=height, width=width), tf.device(self.device):
+                graph = tf2_engine.build_style_transfer_function(vgg_weights, height, width, list(style_layers),
+                                                                 list(content_layers), precision, self.jit_compile)
+            self.sessions[key] = (graph, None)
+        elif key not in self.sessions:
+            vgg_weights = self.vgg_weights
+            tf_graph = tf.Graph()
+            with stage_timing.span('build graphs', height=height, width=width):
+                with tf_graph.as_default(), tf.device(self.device):
+                    graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width,
+                                                                     list(style_layers), list(content_layers),
+                                                                     precision=precision)
+                    init = tf.global_variables_initializer()
+                tf_graph.finalize()
+            sess = tf.Session(graph=tf_graph, config=self.config)
+            with stage_timing.span('initialize variables'):
+                sess.run(init)
+            self.sessions[key] = (graph, sess)
+        self.sessions.move_to_end(key)
+        return self.sessions[key]
+
+    def trim_sessions(self):
+        """Close the least recently used graphs and sessions beyond max_sessions; called between jobs."""
+        while len(self.sessions) > self.max_sessions:
+            _, (graph, sess) = self.sessions.popitem(last=False)
+            if sess is not None:
+                sess.close()
+
+    def close(self):
+        """Close every session and network of the worker."""
+        for graph, sess in self.sessions.values():
+            if sess is not None:
+                sess.close()
+        self.sessions.clear()
+        for _, network in self.networks.values():
+            network.close()
+        self.networks.clear()
+
+    def trained_network(self, path, load):
+        """Return the network load(path) gives, loading it again if it was trained further."""
+        mtime = os.path.getmtime(path)
+        if path not in self.networks or self.networks[path][0] != mtime:
+            if path in self.networks:
+                self.networks[path][1].close()
+            self.networks[path] = (mtime, load(path))
+        return self.networks[path][1]
+
+    def run_job(self, job, on_event=None):
+        """Run one job dict and return the "done" event."""
+        args = job_args(job)
+        return self.run_args(args, args.CONTENT_IMAGE, args.STYLE_IMAGE, job_output_dir(job, args), on_event)
+
+    def run_args(self, args, content_path, style_path, output_dir, on_event=None):
+        """
+        Run a job given as StyleTransfer.py arguments on the images at
+        content_path and style_path, writing its snapshots to output_dir, and
+        return the "done" event. Events are sent to on_event, if given.
+        """
+        start_time = time.time()
+        self.trim_sessions()
+        height, width = StyleTransfer.image_size(args, content_path)
+        if StyleTransfer.check_pyramid(height, width, args.pyramid):
+            raise ValueError(StyleTransfer.check_pyramid(height, width, args.pyramid))
+        if args.tile and (args.pyramid > 1 or args.tile_overlap >= args.tile):
+            raise ValueError("tile needs a tile_overlap below it, and doesn't do pyramid")
+        if args.tile and args.resume:
+            raise ValueError("tiled jobs have no checkpoints, so they can't resume")
+        network_path = None if args.no_fast_style else fast_style.network_path(style_path, args.fast_style_dir)
+        if network_path is not None:
+            differences = fast_style.loss_differences(network_path, args)
+            if differences and not args.preview:
+                print("The style network %s was trained with other %s than the job, optimizing instead"
+                      % (network_path, ', '.join(differences)))
+                network_path = None
+            elif differences:
+                print("Warning: previewing with the style network %s, trained with other %s than the job"
+                      % (network_path, ', '.join(differences)))
+        if args.preview and network_path is None and not os.path.exists(args.adain_decoder):
+            raise ValueError("preview needs the AdaIN decoder %s, train it with adain.py" % args.adain_decoder)
+
+        # A job that ran before with the same images and arguments gives the same image.
+        results = StyleTransfer.open_result_cache(args)
+        filename = None
+        if results is not None:
+            key = result_cache.result_key(args, content_path, style_path, self.vgg_path,
+                                          network_path or (args.adain_decoder if args.preview else None))
+            with stage_timing.span('result cache'):
+                filename = results.restore(key, output_dir)
+        if filename is not None:
+            print("The same job ran before, %s is from the result cache" % filename)
+        else:
+            filename = self.make_image(args, content_path, style_path, network_path, height, width, output_dir,
+                                       on_event)
+            if results is not None:
+                with stage_timing.span('result cache'):
+                    results.store(key, filename)
+        return {'event': 'done', 'image': filename, 'output_dir': output_dir, 'seconds': time.time() - start_time}
+
+    def make_image(self, args, content_path, style_path, network_path, height, width, output_dir, on_event=None):
+        """Run a job with a style network, the AdaIN decoder or the optimizer, returning the final image file."""
+        if network_path is not None:
+            # One forward pass of the network trained for the style, instead of optimizing.
+            print("Stylizing with the style network %s" % network_path)
+            with stage_timing.span('load style network'):
+                network = self.trained_network(network_path,
+                                               lambda path: fast_style.FastStyleNetwork(path, self.config))
+            with stage_timing.span('stylize'):
+                return fast_style.stylize_job(network, content_path, height, width, args, output_dir)
+        if args.preview:
+            # Any style in one pass of the AdaIN encoder and decoder.
+            print("Previewing with the AdaIN decoder %s" % args.adain_decoder)
+            vgg_weights = self.vgg_weights
+            with stage_timing.span('load AdaIN decoder'):
+                network = self.trained_network(args.adain_decoder,
+                                               lambda path: adain.AdaINNetwork(path, vgg_weights, self.config))
+            with stage_timing.span('stylize'):
+                return adain.preview_job(network, content_path, style_path, height, width, args, output_dir)
+        if args.tile:
+            # In a pool of processes with graphs of the tile size, not the graphs of this worker.
+            with stage_timing.span('tiles'):
+                return tiled.run_tiled(self.vgg_path, content_path, style_path, height, width, args, output_dir)
+
+        levels = []
+        for level_height, level_width in StyleTransfer.pyramid_sizes(height, width, args.pyramid):
+            graph, sess = self.session_for_size(level_height, level_width, args.style_layers, args.content_layers,
+                                                args.precision)
+            levels.append((sess, graph))
+
+        def on_snapshot(iteration, filename, total_loss):
+            if on_event is not None:
+                on_event({'event': 'snapshot', 'iteration': iteration, 'image': filename, 'total_loss': total_loss})
+
+        return StyleTransfer.run_pyramid(levels, content_path, style_path, args, output_dir, on_snapshot, on_event)
+
+
+# A worker gets these when it starts, so jobs can't change them.
+WORKER_ARGS = StyleTransfer.PROCESS_ARGS
+
+# How the types of job values are named in errors.
+TYPE_NAMES = {bool: 'true or false', int: 'an integer', float: 'a number', str: 'a string'}
+
+
+def job_value(action, value):
+    """Check a job value against the StyleTransfer.py argument it sets, returning it as that argument would be."""
+    name = action.dest
+    if action.type is StyleTransfer.layer_list:
+        if isinstance(value, (list, tuple)) and all(isinstance(layer, str) for layer in value):
+            value = ','.join(value)
+        if not isinstance(value, str):
+            raise ValueError("job argument %r must be a comma separated string or a list of VGG layers" % name)
+        try:
+            return StyleTransfer.layer_list(value)
+        except argparse.ArgumentTypeError as e:
+            raise ValueError("job argument %r: %s" % (name, e))
+    if action.nargs == 0:
+        # A flag, like --keep_aspect.
+        expected = (bool,)
+    elif action.type is float:
+        expected = (int, float)
+    else:
+        expected = (action.type or str,)
+    if isinstance(value, bool) and bool not in expected or not isinstance(value, expected):
+        if value is None and action.default is None:
+            return value
+        raise ValueError("job argument %r must be %s, not %r" % (name, TYPE_NAMES[expected[-1]], value))
+    if action.choices is not None and value not in action.choices:
+        raise ValueError("job argument %r must be one of %s, not %r" % (name, ', '.join(map(str, action.choices)), value))
+    return float(value) if action.type is float else value
+
+
+def job_args(job):
+    """
+    Turn a job dict into arguments like StyleTransfer.py would parse, using
+    its defaults. Raises ValueError for unknown arguments, those in
+    WORKER_ARGS and values of the wrong type.
+    """
+    args = StyleTransfer.parser.parse_args([])
+    actions = {action.dest: action for action in StyleTransfer.parser._actions}
+    for name, value in job.items():
+        if name != 'output_dir':
+            if not hasattr(args, name):
+                raise ValueError("unknown job argument %r" % name)
+            if name in WORKER_ARGS:
+                raise ValueError("%r is set when the worker starts, not per job" % name)
+            setattr(args, name, job_value(actions[name], value))
+    if len(args.style_layers) > len(StyleTransfer.style_layer_weights(args)):
+        raise ValueError("at most %d style layers can be weighted by w1..w5" % len(StyleTransfer.style_layer_weights(args)))
+    return args
+
+
+def job_output_dir(job, args):
+    """The output folder of a job, output/<content>_vs_<style> unless the job gives one."""
+    if job.get('output_dir'):
+        return job['output_dir']
+    content_name = os.path.splitext(os.path.basename(args.CONTENT_IMAGE))[0]
+    style_name = os.path.splitext(os.path.basename(args.STYLE_IMAGE))[0]
+    return "output/" + content_name + "_vs_" + style_name
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Reads one job per line from the connection and streams events back."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = worker_client.decode_line(line)
+                print("Job:", job)
+                event = self.server.worker.run_job(job, self.send_event)
+            except Exception as e:
+                traceback.print_exc()
+                event = {'event': 'error', 'message': str(e)}
+            self.send_event(event)
+
+    def setup(self):
+        super().setup()
+        # Snapshot events come from the snapshot writer thread.
+        self.send_lock = threading.Lock()
+
+    def send_event(self, event):
+        with self.send_lock:
+            self.wfile.write(worker_client.encode_line(event))
+            self.wfile.flush()
+
+
+class WorkerServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address, worker):
+        super().__init__(address, JobHandler)
+        self.worker = worker
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve style transfer jobs from a warm worker')
+    parser.add_argument('--host', type=str, default=worker_client.DEFAULT_HOST, help='Host to listen on')
+    parser.add_argument('--port', type=int, default=worker_client.DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument('--max_sessions', type=int, default=MAX_SESSIONS,
+                        help='graphs and sessions of other image sizes and layers kept between jobs')
+    parser.add_argument("--GPU", "-GPU", help="Use GPU", action="store_true")
+    parser.add_argument("--intra_op_threads", type=int, default=0, help="threads used inside one op, 0 for the TensorFlow default")
+    parser.add_argument("--inter_op_threads", type=int, default=0, help="ops run at once, 0 for the TensorFlow default")
+    parser.add_argument("--cpus", type=thread_tuning.cpu_list, default=None, help="run only on these CPUs, e.g. 0-7")
+    parser.add_argument("--log_level", type=str, default="info", choices=["debug", "info", "warning", "error"],
+                        help="level of the messages logged while loading and saving images")
+    parser.add_argument("--engine", type=str, default="v1", choices=["v1", "tf2"],
+                        help="v1 graphs and sessions, or tf2 XLA compiled functions; jobs using lbfgs need v1")
+    parser.add_argument("--no_xla", help="with --engine tf2, run the functions without XLA", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, level=args.log_level.upper(), format='%(message)s')
+
+    if args.cpus:
+        thread_tuning.set_cpu_affinity(args.cpus)
+    config = thread_tuning.session_config(args.intra_op_threads, args.inter_op_threads)
+    if args.engine == 'tf2':
+        import tf2_engine
+        tf2_engine.enable(config)
+    worker = StyleTransferWorker(args.VGG_MODEL, args.GPU, config, args.engine, not args.no_xla,
+                                 max_sessions=args.max_sessions)
+    # Read the weights now rather than in the first job.
+    worker.vgg_weights
+    with WorkerServer((args.host, args.port), worker) as server:
+        print("Style transfer worker listening on %s:%d" % (args.host, args.port))
+        server.serve_forever()
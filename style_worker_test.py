@@ -0,0 +1,112 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import StyleTransfer
+import style_worker
+import test_fixtures
+import worker_client
+
+SIZE = 32
+# Nothing written to the caches in the working folder.
+JOB = {'IMAGE_WIDTH': SIZE, 'epoch': 3, 'snapshot_every': 1, 'no_style_cache': True, 'no_content_cache': True,
+       'no_result_cache': True, 'no_warm_start': True, 'no_fast_style': True, 'checkpoint_every': 0}
+
+
+class StyleWorkerTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.folder = cls.tmpdir.name
+        cls.worker = style_worker.StyleTransferWorker(test_fixtures.write_random_weights(cls.folder))
+        cls.content_path, cls.style_path = test_fixtures.write_test_images(cls.folder, (SIZE, SIZE), (SIZE, SIZE))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.worker.close()
+        cls.tmpdir.cleanup()
+
+    def job(self, **values):
+        return dict(JOB, CONTENT_IMAGE=self.content_path, STYLE_IMAGE=self.style_path,
+                    output_dir=os.path.join(self.folder, 'output'), **values)
+
+    def test_job_args(self):
+        args = style_worker.job_args({'epoch': 10, 'style_layers': 'conv1_2, conv2_2', 'output_dir': 'out'})
+        self.assertEqual(10, args.epoch)
+        self.assertEqual(['conv1_2', 'conv2_2'], args.style_layers)
+        self.assertEqual(StyleTransfer.parser.parse_args([]).alpha, args.alpha)
+        with self.assertRaises(ValueError):
+            style_worker.job_args({'bogus': 1})
+        with self.assertRaises(ValueError):
+            # Six style layers, but only the five weights w1..w5.
+            style_worker.job_args({'style_layers': 'conv1_1,conv1_2,conv2_1,conv2_2,conv3_1,conv3_2'})
+
+    def test_job_args_checks_values(self):
+        args = style_worker.job_args({'alpha': 1, 'keep_aspect': True, 'content_layers': ['conv4_2'],
+                                      'optimizer': 'lbfgs'})
+        self.assertEqual((1.0, True, ['conv4_2'], 'lbfgs'),
+                         (args.alpha, args.keep_aspect, args.content_layers, args.optimizer))
+        for job in [{'epoch': '100'}, {'epoch': True}, {'alpha': 'x'}, {'keep_aspect': 1}, {'optimizer': 'sgd'},
+                    {'style_layers': ['conv9_9']}, {'CONTENT_IMAGE': None}]:
+            with self.assertRaises(ValueError, msg=job):
+                style_worker.job_args(job)
+
+    def test_job_args_rejects_worker_args(self):
+        for name in style_worker.WORKER_ARGS:
+            with self.assertRaisesRegex(ValueError, 'when the worker starts', msg=name):
+                style_worker.job_args({name: StyleTransfer.parser.get_default(name)})
+
+    def test_job_output_dir(self):
+        job = {'CONTENT_IMAGE': 'input/a.png', 'STYLE_IMAGE': 'input/styles/zebra_1.jpg'}
+        self.assertEqual('output/a_vs_zebra_1', style_worker.job_output_dir(job, style_worker.job_args(job)))
+        job['output_dir'] = 'elsewhere'
+        self.assertEqual('elsewhere', style_worker.job_output_dir(job, style_worker.job_args(job)))
+
+    def test_sessions_reused_per_size(self):
+        graph, sess = self.worker.session_for_size(SIZE, SIZE)
+        self.assertIs(graph, self.worker.session_for_size(SIZE, SIZE)[0])
+        self.assertIsNot(graph, self.worker.session_for_size(SIZE, 2 * SIZE)[0])
+        self.assertIsNot(graph, self.worker.session_for_size(SIZE, SIZE, precision='bfloat16')[0])
+
+    def test_least_recently_used_sessions_closed(self):
+        worker = style_worker.StyleTransferWorker(self.worker.vgg_path, max_sessions=1)
+        try:
+            first = worker.session_for_size(SIZE, SIZE)[1]
+            second = worker.session_for_size(SIZE, 2 * SIZE)[1]
+            worker.session_for_size(SIZE, SIZE)
+            worker.trim_sessions()
+            self.assertEqual([(SIZE, SIZE)], [key[:2] for key in worker.sessions])
+            self.assertTrue(second._closed)
+            self.assertFalse(first._closed)
+        finally:
+            worker.close()
+        self.assertTrue(first._closed)
+        self.assertEqual({}, dict(worker.sessions))
+
+    def test_tiled_jobs_dont_resume(self):
+        args = style_worker.job_args(self.job(tile=16, tile_overlap=4, resume=True))
+        with self.assertRaisesRegex(ValueError, 'resume'):
+            self.worker.run_args(args, self.content_path, self.style_path, os.path.join(self.folder, 'tiled'))
+
+    def test_events_over_the_socket(self):
+        with style_worker.WorkerServer(('localhost', 0), self.worker) as server:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                port = server.server_address[1]
+                self.assertTrue(worker_client.worker_available(port=port))
+                events = []
+                done = worker_client.submit_job(self.job(), port=port, on_event=events.append)
+                error = worker_client.submit_job({'bogus': 1}, port=port)
+            finally:
+                server.shutdown()
+        self.assertEqual('done', done['event'])
+        self.assertTrue(os.path.exists(done['image']))
+        self.assertEqual([0, 1, 2, 3], [event['iteration'] for event in events if event['event'] == 'snapshot'])
+        self.assertEqual({'event': 'error', 'message': "unknown job argument 'bogus'"}, error)
+
+
+if __name__ == '__main__':
+    unittest.main()
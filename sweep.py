@@ -0,0 +1,269 @@
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import time
+
+import numpy as np
+
+import StyleTransfer
+import style_worker
+import thread_tuning
+
+'''
+Search the style transfer loss weights for one content and style image.
+
+Usage: python sweep.py --CONTENT_IMAGE a.png --STYLE_IMAGE styles/zebra_1.jpg
+                       --param alpha=0.001,0.01,0.1 --param beta=0.5,0.8
+                       [--param gamma=0.0001:0.01 --samples 16] [--processes 4]
+
+Each --param is a comma separated list of values, or a low:high range. With
+only lists, every combination is tried; with a range, --samples candidates
+are drawn at random, log-uniformly from the ranges. alpha, beta, gamma and
+w1..w5 can be searched; the other StyleTransfer.py options of a job can be
+given as --set name=value and apply to every candidate, except tile and
+preview: a candidate is scored in the graph of the full image, which its
+optimization must have left there.
+
+The search uses successive halving: every candidate runs --min_epoch
+iterations, the better half by --score is kept, and the survivors run again
+from the start with twice the iterations, until one is left or --max_epoch
+is reached. Candidates run in a pool of processes, each pinned to its own
+cores with a matching number of TensorFlow threads. They don't warm start
+or use the result cache, so each starts from the content image rather than
+from the result of another candidate, and don't use a style network of
+fast_style.py, which would ignore the weights.
+
+The weighted loss of a candidate depends on its own weights, so candidates
+are scored at their final image with fixed weights instead: 'loss' uses the
+StyleTransfer.py defaults (or --set values) for every candidate, and 'shape'
+uses only the shape loss, the distance from the glyph.
+
+Results go to --saveto (output/<content>_vs_<style>_sweep by default):
+report.json with every round, and best_1.jpg.. for the top --keep candidates,
+in the --set snapshot_format.
+'''
+
+SEARCH_PARAMS = ['alpha', 'beta', 'gamma', 'w1', 'w2', 'w3', 'w4', 'w5']
+
+# Options of every candidate job unless --set says otherwise.
+CANDIDATE_DEFAULTS = {'no_warm_start': True, 'no_result_cache': True, 'no_fast_style': True}
+
+# Options that don't leave the image in the graph of the full size, see the module documentation.
+UNSUPPORTED_SETTINGS = ['tile', 'preview']
+
+
+def parse_param(text):
+    '''
+    Parse NAME=V1,V2,... into (name, list of values), or NAME=LOW:HIGH into (name, (low, high)).
+    '''
+    name, _, values = text.partition('=')
+    if name not in SEARCH_PARAMS or not values:
+        raise argparse.ArgumentTypeError("expected NAME=V1,V2 or NAME=LOW:HIGH with NAME one of %s"
+                                         % ', '.join(SEARCH_PARAMS))
+    try:
+        if ':' in values:
+            low, high = values.split(':')
+            return name, (float(low), float(high))
+        return name, [float(value) for value in values.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("bad values for %s: %r" % (name, values))
+
+
+def parse_setting(text):
+    '''
+    Parse NAME=VALUE into (name, value), reading numbers as numbers.
+    '''
+    name, _, value = text.partition('=')
+    if not value:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE")
+    if name in UNSUPPORTED_SETTINGS:
+        raise argparse.ArgumentTypeError("sweeps don't support %s" % name)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return name, value
+
+
+def candidate_params(params, samples, seed=0):
+    '''
+    The parameter dicts to try: the whole grid if params only has lists,
+    otherwise samples random draws.
+    '''
+    names = [name for name, _ in params]
+    if all(isinstance(values, list) for _, values in params):
+        return [dict(zip(names, combination)) for combination in itertools.product(*[values for _, values in params])]
+
+    rng = np.random.RandomState(seed)
+    candidates = []
+    for _ in range(samples):
+        candidate = {}
+        for name, values in params:
+            if isinstance(values, list):
+                candidate[name] = values[rng.randint(len(values))]
+            elif values[0] > 0 and values[1] > 0:
+                candidate[name] = float(np.exp(rng.uniform(np.log(values[0]), np.log(values[1]))))
+            else:
+                candidate[name] = float(rng.uniform(values[0], values[1]))
+        candidates.append(candidate)
+    return candidates
+
+
+def core_sets(processes, threads, pin=True):
+    '''
+    Split the cores this process may use into one set per pool process.
+    Returns a list of core lists, empty when pinning is off or unsupported.
+    '''
+    if not pin or not hasattr(os, 'sched_getaffinity'):
+        return [[] for _ in range(processes)]
+    cores = sorted(os.sched_getaffinity(0))
+    return [cores[(p * threads) % len(cores):(p * threads) % len(cores) + threads] for p in range(processes)]
+
+
+# Per process state of the pool workers, set by init_worker.
+_worker = {}
+
+
+def init_worker(core_queue, threads, vgg_path, gpu):
+    cores = core_queue.get()
+    if cores:
+        thread_tuning.set_cpu_affinity(cores)
+    config = thread_tuning.session_config(threads, 1)
+    _worker['worker'] = style_worker.StyleTransferWorker(vgg_path, gpu, config)
+
+
+def candidate_job(base_job, params, epoch, output_dir):
+    '''
+    The job of a candidate: base_job, over CANDIDATE_DEFAULTS, with the
+    candidate's params, run for epoch iterations into output_dir.
+    '''
+    job = dict(CANDIDATE_DEFAULTS)
+    job.update(base_job)
+    job.update(params)
+    job['epoch'] = epoch
+    job['output_dir'] = output_dir
+    return job
+
+
+def run_candidate(task):
+    '''
+    Run one candidate job the way the worker runs any job and score it.
+    task is (job, score job, score name). Returns the last image and the score.
+    '''
+    job, score_job, score = task
+    worker = _worker['worker']
+    args = style_worker.job_args(job)
+    filename = worker.run_args(args, args.CONTENT_IMAGE, args.STYLE_IMAGE, job['output_dir'])['image']
+
+    # Score the final image, left in the graph of the full size by the last
+    # level of the job, with the same weights for every candidate.
+    height, width = StyleTransfer.image_size(args, args.CONTENT_IMAGE)
+    graph, sess = worker.session_for_size(height, width, args.style_layers, args.content_layers, args.precision)
+    score_args = style_worker.job_args(score_job)
+    content_targets = StyleTransfer.load_content_targets(sess, graph, args.CONTENT_IMAGE, StyleTransfer.open_content_cache(args))
+    style_grams = StyleTransfer.load_style_grams(sess, graph, args.STYLE_IMAGE, StyleTransfer.open_style_cache(args))
+    StyleTransfer.set_job_targets(sess, graph, content_targets, style_grams, score_args)
+    losses = sess.run({name: graph[name] for name in StyleTransfer.LOSS_NAMES})
+    losses = {name: float(value) for name, value in losses.items()}
+    return filename, losses['shape_loss'] if score == 'shape' else losses['total_loss'], losses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Successive halving search of the style transfer weights')
+    parser.add_argument("--CONTENT_IMAGE", "-CONTENT_IMAGE", type=str, required=True, help="Path to content image, in input/")
+    parser.add_argument("--STYLE_IMAGE", "-STYLE_IMAGE", type=str, required=True, help="Path to style image, in input/")
+    parser.add_argument("--IMAGE_WIDTH", "-width", type=int, default=300, help="width of image")
+    parser.add_argument("--IMAGE_HEIGHT", "-height", type=int, default=0, help="height of image, 0 for the width, or see --keep_aspect")
+    parser.add_argument("--keep_aspect", help="without --IMAGE_HEIGHT, keep the aspect ratio of the content image", action="store_true")
+    parser.add_argument('--param', type=parse_param, action='append', default=[], help='NAME=V1,V2,.. or NAME=LOW:HIGH to search')
+    parser.add_argument('--set', type=parse_setting, action='append', default=[], help='NAME=VALUE for every candidate')
+    parser.add_argument('--samples', type=int, default=16, help='Number of random candidates when a --param is a range')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random candidates')
+    parser.add_argument('--min_epoch', type=int, default=100, help='Iterations of the first round')
+    parser.add_argument('--max_epoch', type=int, default=1600, help='Most iterations of a round')
+    parser.add_argument('--score', choices=['loss', 'shape'], default='loss', help='How candidates are ranked, lower is better')
+    parser.add_argument('--processes', type=int, default=0, help='Number of candidates to run at once, 0 for one per 4 cores')
+    parser.add_argument('--threads', type=int, default=0, help='TensorFlow threads per process, 0 to split the cores evenly')
+    parser.add_argument('--no_pin', help='Do not pin the processes to cores', action='store_true')
+    parser.add_argument('--keep', type=int, default=3, help='Number of best images to copy to the output folder')
+    parser.add_argument('--saveto', type=str, default=None, help='Output folder of the sweep')
+    parser.add_argument('--VGG_MODEL', type=str, default=None, help='Path to the VGG-19 .mat file or converted conv weights folder')
+    parser.add_argument("--GPU", "-GPU", help="Use GPU", action="store_true")
+    args = parser.parse_args()
+    if not args.param:
+        parser.error("give at least one --param to search")
+
+    content_path = 'input/' + args.CONTENT_IMAGE
+    style_path = 'input/' + args.STYLE_IMAGE
+    content_name = os.path.splitext(os.path.basename(content_path))[0]
+    style_name = os.path.splitext(os.path.basename(style_path))[0]
+    sweep_dir = args.saveto or "output/" + content_name + "_vs_" + style_name + "_sweep"
+
+    base_job = dict(args.set)
+    base_job.update({'CONTENT_IMAGE': content_path, 'STYLE_IMAGE': style_path, 'IMAGE_WIDTH': args.IMAGE_WIDTH,
+                     'IMAGE_HEIGHT': args.IMAGE_HEIGHT, 'keep_aspect': args.keep_aspect})
+    try:
+        style_worker.job_args(base_job)
+    except ValueError as e:
+        parser.error(str(e))
+    candidates = [{'index': index, 'params': params, 'rounds': []}
+                  for index, params in enumerate(candidate_params(args.param, args.samples, args.seed))]
+
+    cpu_count = thread_tuning.available_cpus()
+    processes = args.processes or max(1, cpu_count // 4)
+    processes = min(processes, len(candidates))
+    threads = args.threads or max(1, cpu_count // processes)
+    print("%d candidates, %d processes with %d threads each" % (len(candidates), processes, threads))
+
+    # Spawn, so the pool processes start without the TensorFlow state of this one.
+    context = multiprocessing.get_context('spawn')
+    core_queue = context.Queue()
+    for cores in core_sets(processes, threads, not args.no_pin):
+        core_queue.put(cores)
+
+    start_time = time.time()
+    alive = candidates
+    epoch = args.min_epoch
+    rounds = []
+    with context.Pool(processes, init_worker, (core_queue, threads, args.VGG_MODEL, args.GPU)) as pool:
+        for round_number in itertools.count():
+            tasks = []
+            for candidate in alive:
+                job = candidate_job(base_job, candidate['params'], epoch,
+                                    os.path.join(sweep_dir, 'round_%d' % round_number, 'candidate_%03d' % candidate['index']))
+                tasks.append((job, base_job, args.score))
+            results = pool.map(run_candidate, tasks)
+
+            for candidate, (image, score, losses) in zip(alive, results):
+                candidate['rounds'].append({'epoch': epoch, 'image': image, 'score': score, 'losses': losses})
+                candidate['score'] = score
+                candidate['image'] = image
+            alive = sorted(alive, key=lambda candidate: candidate['score'])
+            rounds.append({'epoch': epoch, 'candidates': [candidate['index'] for candidate in alive]})
+
+            print("Round %d, %d iterations:" % (round_number, epoch))
+            for candidate in alive:
+                print("  %10.4g  %s" % (candidate['score'], candidate['params']))
+            if len(alive) == 1 or epoch >= args.max_epoch:
+                break
+            alive = alive[:math.ceil(len(alive) / 2)]
+            epoch = min(epoch * 2, args.max_epoch)
+
+    # Rank by the last round each candidate reached, then by its score there.
+    ranking = sorted(candidates, key=lambda candidate: (-len(candidate['rounds']), candidate['score']))
+    for rank, candidate in enumerate(ranking[:args.keep]):
+        extension = os.path.splitext(candidate['image'])[1]
+        shutil.copy(candidate['image'], os.path.join(sweep_dir, 'best_%d%s' % (rank + 1, extension)))
+
+    report = {'content': content_path, 'style': style_path, 'score': args.score, 'settings': base_job,
+              'seconds': time.time() - start_time, 'rounds': rounds, 'ranking': ranking}
+    with open(os.path.join(sweep_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("Best:", ranking[0]['params'], "score", ranking[0]['score'])
+    print("Report and best images in", sweep_dir)
+    print("Time taken = ", report['seconds'])
@@ -0,0 +1,101 @@
+import argparse
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import StyleTransfer
+import style_worker
+import sweep
+import test_fixtures
+
+
+class CandidateParamsTestCase(unittest.TestCase):
+
+    def test_grid(self):
+        params = [sweep.parse_param('alpha=0.001,0.01'), sweep.parse_param('beta=0.5,0.8,1')]
+        candidates = sweep.candidate_params(params, samples=2)
+        self.assertEqual(6, len(candidates))
+        self.assertIn({'alpha': 0.01, 'beta': 0.8}, candidates)
+
+    def test_random_ranges(self):
+        params = [sweep.parse_param('alpha=0.001,0.01'), sweep.parse_param('gamma=0.0001:0.01')]
+        candidates = sweep.candidate_params(params, samples=5)
+        self.assertEqual(5, len(candidates))
+        for candidate in candidates:
+            self.assertIn(candidate['alpha'], [0.001, 0.01])
+            self.assertTrue(0.0001 <= candidate['gamma'] <= 0.01)
+        self.assertEqual(candidates, sweep.candidate_params(params, samples=5))
+
+    def test_unknown_param(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            sweep.parse_param('epoch=10,20')
+
+    def test_settings(self):
+        self.assertEqual(('pyramid', 2), sweep.parse_setting('pyramid=2'))
+        self.assertEqual(('snapshot_format', 'png'), sweep.parse_setting('snapshot_format=png'))
+        for text in ['tile=512', 'preview=true', 'epoch']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                sweep.parse_setting(text)
+
+
+class CoreSetsTestCase(unittest.TestCase):
+
+    def test_no_pinning(self):
+        self.assertEqual([[], []], sweep.core_sets(2, 4, pin=False))
+
+
+class CandidateJobTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.folder = cls.tmpdir.name
+        sweep._worker['worker'] = style_worker.StyleTransferWorker(test_fixtures.write_random_weights(cls.folder))
+        cls.content_path, cls.style_path = test_fixtures.write_test_images(cls.folder)
+
+    @classmethod
+    def tearDownClass(cls):
+        sweep._worker.pop('worker').close()
+        cls.tmpdir.cleanup()
+
+    def test_set_overrides_the_defaults(self):
+        job = sweep.candidate_job({'no_warm_start': False, 'epoch': 5, 'beta': 0.5}, {'alpha': 0.01}, 100, 'out')
+        self.assertEqual({'no_warm_start': False, 'no_result_cache': True, 'no_fast_style': True, 'epoch': 100,
+                          'beta': 0.5, 'alpha': 0.01, 'output_dir': 'out'}, job)
+
+    def test_candidates_start_from_the_content_image(self):
+        results = os.path.join(self.folder, 'results')
+        base_job = {'CONTENT_IMAGE': self.content_path, 'STYLE_IMAGE': self.style_path, 'IMAGE_WIDTH': 32,
+                    'no_style_cache': True, 'no_content_cache': True, 'snapshot_format': 'png',
+                    'result_cache': results}
+        runs = []
+        with mock.patch.object(StyleTransfer, 'run_style_transfer', wraps=StyleTransfer.run_style_transfer) as run:
+            for index, alpha in enumerate([0.001, 0.01]):
+                job = sweep.candidate_job(base_job, {'alpha': alpha}, 3,
+                                          os.path.join(self.folder, 'round_0', 'candidate_%03d' % index))
+                image, score, losses = sweep.run_candidate((job, base_job, 'loss'))
+                self.assertTrue(os.path.exists(image))
+                runs.append(run.call_args[1])
+        for kwargs in runs:
+            self.assertIsNone(kwargs['initial_image'])
+            self.assertIsNone(kwargs['resume'])
+        self.assertFalse(os.path.exists(results) and os.listdir(results))
+
+    def test_pyramid_candidate(self):
+        # The smallest level of a pyramid is at least 32 px.
+        base_job = {'CONTENT_IMAGE': self.content_path, 'STYLE_IMAGE': self.style_path, 'IMAGE_WIDTH': 64,
+                    'no_style_cache': True, 'no_content_cache': True, 'snapshot_format': 'png',
+                    'pyramid': 2, 'pyramid_epoch': 2}
+        job = sweep.candidate_job(base_job, {'alpha': 0.01}, 3, os.path.join(self.folder, 'pyramid'))
+        with mock.patch.object(StyleTransfer, 'run_style_transfer', wraps=StyleTransfer.run_style_transfer) as run:
+            image, score, losses = sweep.run_candidate((job, base_job, 'loss'))
+        self.assertEqual(2, run.call_count)
+        self.assertTrue(os.path.exists(image))
+        self.assertTrue(np.isfinite(score))
+
+
+if __name__ == '__main__':
+    unittest.main()
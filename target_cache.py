@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+'''
+Size bounded on-disk cache of numpy arrays, used to keep the style and content
+targets of StyleTransfer.py between runs.
+
+Each entry is a dict of arrays stored as one .npz file named by the hash of its
+key. When the cache grows past max_bytes, the least recently used entries are
+removed. Reading an entry marks it as used by updating its modification time.
+'''
+
+# Files are read and hashed in chunks of this size.
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(path):
+    '''
+    Return the sha256 hex digest of the contents of a file.
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(**fields):
+    '''
+    Turn the fields that identify an entry into a cache key.
+    Fields must be JSON serializable, lists and tuples are treated the same.
+    '''
+    text = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+
+def save_npz(path, **arrays):
+    '''
+    Write arrays to the .npz file path under a unique temporary name in its
+    folder first, so a process killed while saving leaves the previous file
+    in place and a reader never sees half a file, even with several processes
+    writing the same path at once.
+    '''
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class TargetCache:
+    """On-disk cache from a key to a dict of numpy arrays, with least recently used eviction."""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key + '.npz')
+
+    def get(self, key):
+        """Return the dict of arrays stored for key, or None if there isn't one."""
+        path = self.path_for(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        try:
+            # Mark it recently used; another process may have evicted it since the read.
+            os.utime(path)
+        except OSError:
+            pass
+        return arrays
+
+    def put(self, key, arrays):
+        """Store a dict of arrays for key, then evict entries until the cache fits in max_bytes."""
+        save_npz(self.path_for(key), **arrays)
+        self.evict()
+
+    def entries(self):
+        """Return (modification time, size, path) of every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.npz') or name.endswith('.tmp.npz'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
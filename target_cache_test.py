@@ -0,0 +1,77 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from target_cache import TargetCache
+import target_cache
+
+
+class TargetCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_and_get(self):
+        cache = TargetCache(self.folder, 2**20)
+        arrays = {'conv1_2': np.arange(16, dtype=np.float32).reshape(4, 4)}
+        cache.put('key', arrays)
+        loaded = cache.get('key')
+        np.testing.assert_array_equal(arrays['conv1_2'], loaded['conv1_2'])
+        self.assertIsNone(cache.get('missing'))
+
+    def test_put_from_several_threads(self):
+        cache = TargetCache(self.folder, 2**20)
+        arrays = {'a': np.zeros(100000, dtype=np.float32)}
+        errors = []
+
+        def put():
+            try:
+                cache.put('key', arrays)
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=put) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual([os.path.basename(cache.path_for('key'))], os.listdir(self.folder))
+        np.testing.assert_array_equal(arrays['a'], cache.get('key')['a'])
+
+    def test_evicts_least_recently_used(self):
+        entry = {'a': np.zeros(1000, dtype=np.float32)}
+        cache = TargetCache(self.folder, 2**20)
+        cache.put('first', entry)
+        cache.put('second', entry)
+        # Make 'first' the most recently used entry.
+        os.utime(cache.path_for('second'), (time.time() - 10, time.time() - 10))
+        cache.get('first')
+
+        cache.max_bytes = os.path.getsize(cache.path_for('first')) * 2
+        cache.put('third', entry)
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+
+    def test_make_key(self):
+        self.assertEqual(target_cache.make_key(a=1, layers=['conv1_2']), target_cache.make_key(layers=('conv1_2',), a=1))
+        self.assertNotEqual(target_cache.make_key(a=1), target_cache.make_key(a=2))
+
+    def test_file_hash(self):
+        path = os.path.join(self.folder, 'style.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'not really a jpeg')
+        self.assertEqual(64, len(target_cache.file_hash(path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+
+import cv2
+import numpy as np
+
+import model
+
+'''
+Files shared by the tests: a content image like a glyph, a random style image
+and random VGG weights of the real shapes, written to a temporary folder, so
+the tests run without the real weights or input images.
+'''
+
+# Height and width of the images, unless a test asks for others.
+SIZE = 32
+
+
+def glyph_image(height=SIZE, width=SIZE):
+    '''
+    A white uint8 BGR image with a black bar in the middle, like a letter.
+    '''
+    image = np.full((height, width, 3), 255, np.uint8)
+    image[height // 4:height * 3 // 4, width * 3 // 8:width * 5 // 8] = 0
+    return image
+
+
+def noise_image(height=SIZE, width=SIZE, seed=0):
+    '''
+    A uint8 BGR image of random pixels, seeded so it is the same every run.
+    '''
+    return np.random.RandomState(seed).randint(0, 256, (height, width, 3)).astype(np.uint8)
+
+
+def write_test_images(folder, content_size=(SIZE, SIZE), style_size=(SIZE, SIZE)):
+    '''
+    Write a glyph_image as a.png and a noise_image as zebra.png to folder, of
+    the (height, width) content_size and style_size. Returns their paths.
+    '''
+    content_path = os.path.join(folder, 'a.png')
+    cv2.imwrite(content_path, glyph_image(*content_size))
+    style_path = os.path.join(folder, 'zebra.png')
+    cv2.imwrite(style_path, noise_image(*style_size))
+    return content_path, style_path
+
+
+def write_random_weights(folder):
+    '''
+    Write seeded random VGG weights, converted like convert_vgg_weights.py
+    does, to folder/vgg. Returns the path.
+    '''
+    path = os.path.join(folder, 'vgg')
+    model.save_conv_weights(model.random_vgg_weights(), path)
+    return path
@@ -0,0 +1,183 @@
+import numpy as np
+import tensorflow as tf
+
+import StyleTransfer
+import model
+
+'''
+TF2 engine for StyleTransfer.py --engine tf2.
+
+The default engine builds a TF1 graph and runs the VGG forward and backward
+passes, the losses and the Adam update as separate ops from a session. This
+engine puts the whole iteration in one tf.function, compiled by XLA
+(jit_compile=True) unless --no_xla is given, so the convolutions, gram
+matrices and loss math are fused into a few kernels.
+
+It computes the same losses, with the functions of StyleTransfer.py, and the
+same Adam update as tf.train.AdamOptimizer, with the same slot variables, so
+the two engines follow the same path and share checkpoints and target caches.
+L-BFGS and batches of jobs run on the default engine only.
+
+StyleTransfer.py turns the TF2 behavior off when it is imported, so enable()
+must be called before anything is built; after that the process can't build
+TF1 graphs.
+'''
+
+# Parameters of tf.train.AdamOptimizer(1.0), as used by build_style_transfer_graph.
+LEARNING_RATE = 1.0
+BETA1 = 0.9
+BETA2 = 0.999
+EPSILON = 1e-8
+
+
+def enable(config=None):
+    '''
+    Switch this process back to TF2 behavior. Call before building anything.
+    The thread counts of a session ConfigProto, if given, are applied too.
+    '''
+    tf.compat.v1.enable_v2_behavior()
+    if config is not None:
+        tf.config.threading.set_intra_op_parallelism_threads(config.intra_op_parallelism_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(config.inter_op_parallelism_threads)
+
+
+def build_style_transfer_function(vgg_weights, height, width, style_layers=StyleTransfer.STYLE_LAYERS,
+                                  content_layers=StyleTransfer.CONTENT_LAYERS, precision='float32', jit_compile=True):
+    '''
+    The counterpart of StyleTransfer.build_style_transfer_graph for this
+    engine. Returns a dict with the size and layers used by the target caches,
+    and in 'function' the StyleTransferFunction; it is used with no session.
+    '''
+    if isinstance(vgg_weights, str):
+        vgg_weights = model.load_vgg_weights(vgg_weights, style_layers + content_layers)
+    return {'height': height, 'width': width, 'batch_size': 1, 'precision': precision,
+            'style_layers': style_layers, 'content_layers': content_layers,
+            'weights_id': model.weights_fingerprint(vgg_weights),
+            'function': StyleTransferFunction(vgg_weights, height, width, style_layers, content_layers, precision,
+                                              jit_compile)}
+
+
+class StyleTransferFunction:
+    """
+    The losses and Adam step of one image size as tf.functions, with the
+    methods of StyleTransfer.SessionSteps.
+    """
+
+    def __init__(self, vgg_weights, height, width, style_layers, content_layers, precision='float32',
+                 jit_compile=True):
+        self.vgg_weights = vgg_weights
+        self.style_layers = style_layers
+        self.content_layers = content_layers
+        self.dtype = StyleTransfer.PRECISIONS[precision]
+        layers = style_layers + content_layers
+        shape = (1, height, width, StyleTransfer.COLOR_CHANNELS)
+
+        def variable(shape):
+            return tf.Variable(tf.zeros(shape), trainable=False)
+
+        # The layer shapes, from a forward pass traced without running it.
+        layer_shapes = {}
+
+        def trace_shapes(image):
+            for name, layer in model.vgg_layers(image, vgg_weights, layers, self.dtype).items():
+                layer_shapes[name] = layer.shape.as_list()
+            return image
+        tf.function(trace_shapes).get_concrete_function(tf.TensorSpec(shape, tf.float32))
+
+        self.input = tf.Variable(tf.zeros(shape))
+        self.alpha = variable((1,))
+        self.beta = variable((1,))
+        self.gamma = variable((1,))
+        self.layer_weights = variable((1, len(style_layers)))
+        self.content_targets = {name: variable(layer_shapes[name]) for name in content_layers}
+        self.style_grams = {name: variable((1, layer_shapes[name][3], layer_shapes[name][3])) for name in style_layers}
+        self.dist_template = variable((1, height, width))
+        self.shape_target = variable((1, height, width))
+        # In the order of tf.train.AdamOptimizer.variables(), so checkpoints work with either engine.
+        self.m = variable(shape)
+        self.v = variable(shape)
+        self.beta1_power = tf.Variable(BETA1, trainable=False)
+        self.beta2_power = tf.Variable(BETA2, trainable=False)
+
+        self.compiled_train_step = tf.function(self.train_step, jit_compile=jit_compile)
+        self.compiled_features = tf.function(self.features, jit_compile=jit_compile)
+
+    def losses(self, image):
+        '''The losses of an image tensor, as StyleTransfer.LOSS_NAMES -> scalar tensor.'''
+        net = model.vgg_layers(image, self.vgg_weights, self.style_layers + self.content_layers, self.dtype)
+        net['input'] = image
+        losses = {'content_loss': StyleTransfer.content_loss_func(net, self.content_targets, self.content_layers),
+                  'style_loss': StyleTransfer.style_loss_func(net, self.style_grams, self.layer_weights,
+                                                              self.style_layers),
+                  'shape_loss': StyleTransfer.shape_loss_func(net, self.dist_template, self.shape_target)}
+        losses['total_loss'] = (self.alpha * losses['content_loss'] + self.beta * losses['style_loss']
+                                + self.gamma * losses['shape_loss'])
+        return {name: tf.reduce_sum(loss) for name, loss in losses.items()}
+
+    def train_step(self):
+        '''One Adam step; returns the losses of the image before it.'''
+        with tf.GradientTape() as tape:
+            tape.watch(self.input)
+            losses = self.losses(self.input)
+        gradient = tape.gradient(losses['total_loss'], self.input)
+
+        learning_rate = LEARNING_RATE * tf.sqrt(1 - self.beta2_power) / (1 - self.beta1_power)
+        self.m.assign(BETA1 * self.m + (1 - BETA1) * gradient)
+        self.v.assign(BETA2 * self.v + (1 - BETA2) * tf.square(gradient))
+        self.input.assign_sub(learning_rate * self.m / (tf.sqrt(self.v) + EPSILON))
+        self.beta1_power.assign(self.beta1_power * BETA1)
+        self.beta2_power.assign(self.beta2_power * BETA2)
+        return losses
+
+    def features(self, image):
+        '''The content layer features, the gram matrix of each style layer and the grayscale of an image.'''
+        net = model.vgg_layers(image, self.vgg_weights, self.style_layers + self.content_layers, self.dtype)
+        content_features = {name: tf.cast(net[name], tf.float32) for name in self.content_layers}
+        grams = {}
+        for name in self.style_layers:
+            N = int(net[name].shape[3])
+            M = int(net[name].shape[1] * net[name].shape[2])
+            grams[name] = StyleTransfer.gram_matrix(net[name], N, M)
+        gray = tf.image.rgb_to_grayscale(image)[:, :, :, 0]
+        return content_features, grams, gray
+
+    def content_features(self, content_image):
+        '''The content features and grayscale of a content image, for StyleTransfer.compute_content_targets.'''
+        content_features, _, gray = self.compiled_features(tf.constant(content_image, tf.float32))
+        return {name: value.numpy() for name, value in content_features.items()}, gray.numpy()
+
+    def compute_style_grams(self, style_image):
+        '''The gram matrix of each style layer for a style image, as StyleTransfer.compute_style_grams.'''
+        _, grams, _ = self.compiled_features(tf.constant(style_image, tf.float32))
+        return {name: gram.numpy()[0] for name, gram in grams.items()}
+
+    # The methods of StyleTransfer.SessionSteps.
+
+    def set_targets(self, content_targets, style_grams, args):
+        for name in self.content_layers:
+            self.content_targets[name].assign(content_targets[name])
+        self.dist_template.assign(content_targets['dist_template'][np.newaxis])
+        self.shape_target.assign(content_targets['shape_target'][np.newaxis])
+        for name in self.style_layers:
+            self.style_grams[name].assign(style_grams[name][np.newaxis])
+        self.alpha.assign([args.alpha])
+        self.beta.assign([args.beta])
+        self.gamma.assign([args.gamma])
+        self.layer_weights.assign([StyleTransfer.style_layer_weights(args)[:len(self.style_layers)]])
+
+    def reset(self, image):
+        self.input.assign(image)
+        self.load_slots([np.zeros(self.m.shape), np.zeros(self.v.shape), BETA1, BETA2])
+
+    def step(self):
+        return {name: loss.numpy() for name, loss in self.compiled_train_step().items()}
+
+    def image(self):
+        return self.input.numpy()
+
+    def slots(self):
+        return [self.m.numpy(), self.v.numpy(), self.beta1_power.numpy(), self.beta2_power.numpy()]
+
+    def load_slots(self, slots):
+        for variable, value in zip([self.m, self.v, self.beta1_power, self.beta2_power], slots):
+            variable.assign(value)
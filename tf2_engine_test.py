@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+SIZE = 32
+
+
+def compare_engines(jit_compile, steps=10):
+    """
+    Run the same job on both engines, in this process, which must not have
+    built anything yet. Returns the largest differences of their targets and
+    of the losses of each step and the image and slots after them.
+    """
+    import tf2_engine
+    tf2_engine.enable()
+    import StyleTransfer
+    from StyleTransfer import tf
+    import model
+
+    rng = np.random.RandomState(0)
+    vgg_weights = model.random_vgg_weights()
+    args = StyleTransfer.parser.parse_args([])
+    content_image = rng.rand(1, SIZE, SIZE, 3).astype(np.float32) * 255 - 128
+    style_image = rng.rand(1, SIZE, SIZE, 3).astype(np.float32) * 255 - 128
+
+    def run(steps_of_engine, content_targets, style_grams):
+        """The total loss of each step on one engine, and the image and slots after them."""
+        steps_of_engine.set_targets(content_targets, style_grams, args)
+        steps_of_engine.reset(content_image)
+        losses = [steps_of_engine.step()['total_loss'] for _ in range(steps)]
+        return steps_of_engine.image(), np.array(losses), steps_of_engine.slots()
+
+    # The TF1 graph still runs in a session of its own graph.
+    with tf.Graph().as_default():
+        graph = StyleTransfer.build_style_transfer_graph(vgg_weights, SIZE, SIZE)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            content_targets = StyleTransfer.compute_content_targets(sess, graph, content_image)
+            style_grams = StyleTransfer.compute_style_grams(sess, graph, style_image)
+            image, losses, slots = run(StyleTransfer.optimizer_steps(sess, graph), content_targets, style_grams)
+
+    function_graph = tf2_engine.build_style_transfer_function(vgg_weights, SIZE, SIZE, jit_compile=jit_compile)
+    function_targets = StyleTransfer.compute_content_targets(None, function_graph, content_image)
+    function_grams = StyleTransfer.compute_style_grams(None, function_graph, style_image)
+    function_image, function_losses, function_slots = run(StyleTransfer.optimizer_steps(None, function_graph),
+                                                          content_targets, style_grams)
+
+    def relative(a, b):
+        return float(np.abs(a - b).max() / np.abs(b).max())
+    differences = {'content_targets': max(relative(function_targets[name], content_targets[name])
+                                          for name in graph['content_layers']),
+                   'style_grams': max(relative(function_grams[name], style_grams[name])
+                                      for name in graph['style_layers']),
+                   'loss': float(np.max(np.abs(function_losses - losses) / np.abs(losses))),
+                   'image': float(np.abs(function_image - image).max()),
+                   'slots': [relative(np.asarray(a), np.asarray(b)) for a, b in zip(function_slots, slots)]}
+    return differences
+
+
+# Seconds the engines may take to compare.
+COMPARE_TIMEOUT = 600
+
+
+def run_compare_engines(jit_compile):
+    """
+    compare_engines in a new process, as pytest has the TF2 behavior turned
+    off. A process stuck for COMPARE_TIMEOUT seconds fails the test.
+    """
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), 'xla' if jit_compile else 'no_xla'],
+                            check=True, capture_output=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            timeout=COMPARE_TIMEOUT).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+class EngineParityTestCase(unittest.TestCase):
+
+    def test_function_follows_session_graph(self):
+        differences = run_compare_engines(jit_compile=False)
+        self.assertLess(differences['content_targets'], 1e-5)
+        self.assertLess(differences['style_grams'], 1e-5)
+        self.assertLess(differences['loss'], 1e-4)
+        self.assertLess(differences['image'], 1e-2)
+        self.assertLess(max(differences['slots']), 1e-3)
+
+    def test_xla_function_close_to_session_graph(self):
+        differences = run_compare_engines(jit_compile=True)
+        self.assertLess(differences['loss'], 1e-3)
+        self.assertLess(differences['image'], 1e-1)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] in (['xla'], ['no_xla']):
+        print(json.dumps(compare_engines(sys.argv[1] == 'xla')))
+    else:
+        unittest.main()
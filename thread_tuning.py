@@ -0,0 +1,145 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import tensorflow.compat.v1 as tf
+
+'''
+CPU thread and affinity settings for the style transfer sessions.
+
+TensorFlow sizes its CPU thread pools once per process, from the first
+session, so several jobs on one host each use every core by default and
+slow each other down. session_config gives the sessions fixed pool sizes
+and set_cpu_affinity keeps a process on its own cores.
+
+tuned_session_config picks the pool sizes for an image size by timing a few
+optimizer steps with each of thread_splits. Because the pools can't be
+resized, each split is timed in its own process, with random VGG shaped
+weights. The fastest split is remembered in THREADS_CACHE, by the number of
+CPUs, the image size and the layers, so it is only timed once.
+'''
+
+THREADS_CACHE = 'cache/thread_splits.json'
+
+
+def cpu_list(value):
+    '''
+    Parse a list of CPU numbers like 0-3,8, for the --cpus arguments.
+    '''
+    cpus = set()
+    try:
+        for part in value.split(','):
+            if '-' in part:
+                first, last = part.split('-')
+                cpus.update(range(int(first), int(last) + 1))
+            elif part.strip():
+                cpus.add(int(part))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected CPU numbers like 0-3,8, not %r" % value)
+    if not cpus:
+        raise argparse.ArgumentTypeError("no CPUs given")
+    return sorted(cpus)
+
+
+def set_cpu_affinity(cpus):
+    '''
+    Keep this process, and the processes it starts, on the given CPUs where the OS allows it.
+    '''
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    else:
+        print("CPU affinity is not supported here, ignoring the CPU list")
+
+
+def available_cpus():
+    '''
+    Return the number of CPUs this process may run on.
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def session_config(intra_op_threads=0, inter_op_threads=0):
+    '''
+    Return a tf.ConfigProto with the given thread pool sizes; 0 leaves TensorFlow's default.
+    '''
+    return tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                          inter_op_parallelism_threads=inter_op_threads)
+
+
+def thread_splits(cpus):
+    '''
+    Return the (intra op, inter op) thread counts to try for a number of CPUs.
+    '''
+    splits = []
+    for intra in sorted({cpus, max(1, cpus // 2), max(1, cpus // 4)}, reverse=True):
+        for inter in sorted({1, 2, max(1, cpus // intra)}):
+            if (intra, inter) not in splits:
+                splits.append((intra, inter))
+    return splits
+
+
+def time_split(intra, inter, height, width, style_layers, content_layers, iterations):
+    '''
+    Time optimizer steps with one thread split and return the seconds per
+    step. Runs in its own process, see tuned_session_config.
+    '''
+    # Imported here, as StyleTransfer uses this module.
+    import StyleTransfer
+    import model
+
+    vgg_weights = model.random_vgg_weights(style_layers + content_layers)
+    graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, style_layers, content_layers)
+    with tf.Session(config=session_config(intra, inter)) as sess:
+        sess.run(tf.global_variables_initializer())
+        # The first steps pay for allocating memory and picking kernels.
+        for _ in range(2):
+            sess.run(graph['train_step'])
+        start_time = time.time()
+        for _ in range(iterations):
+            sess.run(graph['train_step'])
+        return (time.time() - start_time) / iterations
+
+
+def tune_threads(height, width, style_layers, content_layers, iterations=5):
+    '''
+    Time each of the thread_splits for the available CPUs and return the
+    fastest as (intra op threads, inter op threads).
+    '''
+    context = multiprocessing.get_context('spawn')
+    best = None
+    for intra, inter in thread_splits(available_cpus()):
+        # A new process for each split, so each gets its own thread pools.
+        with context.Pool(1) as pool:
+            seconds = pool.apply(time_split, (intra, inter, height, width, list(style_layers), list(content_layers),
+                                              iterations))
+        print("Threads %d intra op, %d inter op: %.3f seconds per iteration" % (intra, inter, seconds))
+        if best is None or seconds < best[0]:
+            best = (seconds, intra, inter)
+    return best[1], best[2]
+
+
+def tuned_session_config(height, width, style_layers, content_layers, cache_path=THREADS_CACHE):
+    '''
+    Return the session_config with the fastest thread split for an image
+    size and layer set, from cache_path, or by tuning and storing it there.
+    '''
+    key = "cpus=%d size=%dx%d style=%s content=%s" % (available_cpus(), height, width,
+                                                       ','.join(style_layers), ','.join(content_layers))
+    try:
+        with open(cache_path) as f:
+            splits = json.load(f)
+    except (OSError, ValueError):
+        splits = {}
+
+    if key not in splits:
+        splits[key] = tune_threads(height, width, style_layers, content_layers)
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(splits, f, indent=2)
+    intra, inter = splits[key]
+    print("Using %d intra op and %d inter op threads" % (intra, inter))
+    return session_config(intra, inter)
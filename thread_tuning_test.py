@@ -0,0 +1,30 @@
+import argparse
+import unittest
+
+import thread_tuning
+
+
+class CpuListTestCase(unittest.TestCase):
+
+    def test_ranges_and_numbers(self):
+        self.assertEqual([0, 1, 2, 3, 8], thread_tuning.cpu_list('0-3,8'))
+
+    def test_bad_list(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            thread_tuning.cpu_list('a-b')
+        with self.assertRaises(argparse.ArgumentTypeError):
+            thread_tuning.cpu_list(',')
+
+
+class ThreadSplitsTestCase(unittest.TestCase):
+
+    def test_splits_use_at_most_the_cpus(self):
+        splits = thread_tuning.thread_splits(8)
+        self.assertEqual((8, 1), splits[0])
+        self.assertIn((2, 4), splits)
+        self.assertEqual(len(splits), len(set(splits)))
+        for intra, inter in splits:
+            self.assertLessEqual(intra, 8)
+
+    def test_one_cpu(self):
+        self.assertEqual([(1, 1), (1, 2)], thread_tuning.thread_splits(1))
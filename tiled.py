@@ -0,0 +1,213 @@
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import StyleTransfer
+from StyleTransfer import tf
+import target_cache
+import thread_tuning
+import utility
+
+'''
+Tiled style transfer, for print sized logos of 1500 to 3000 px, where the
+VGG layers of the whole image don't fit in memory: StyleTransfer.py --tile 512.
+
+The canvas is split into tiles of --tile px, overlapping by at least
+--tile_overlap px, and each tile is optimized on its own by a graph of the
+tile size, so memory is bounded by the tile size rather than the image. A
+pool of --tile_processes processes optimizes the tiles, each building its
+graph once and splitting the CPUs with the others.
+
+ * Style: the gram matrices are summed over the pixels of a layer, so the
+   tiles share one target: the style image is resized to the image size,
+   rounded to whole tiles, cut into tiles, and their gram matrices are
+   averaged. That is the style at the scale StyleTransfer.py uses without
+   tiles, computed once per job and kept in the style cache.
+ * Content and shape: the distance template of the shape loss is computed
+   once on the whole content image, so distances reach across tiles, and
+   each tile gets its slice of it. The content features of a tile are those
+   of its content, which differ from a slice of the whole image's features
+   only near the border of the tile, inside the overlap.
+ * Blending: the weight of a tile ramps up from its borders over the
+   overlap, except on the borders of the image, and the image is the
+   weighted mean of the tiles, so seams are feathered away.
+
+Tiled jobs run from the content image with the Adam or L-BFGS settings of
+the job, but without checkpoints, snapshots of the tiles or warm starts, so
+they can't be resumed.
+'''
+
+# The graph of the tile size, and its session, of a pool process.
+_process = {}
+
+
+def tile_starts(length, tile, overlap):
+    '''
+    Return the offsets of the tiles covering length, spread evenly with at
+    least overlap between neighbours.
+    '''
+    if length <= tile:
+        return [0]
+    count = -(-(length - overlap) // (tile - overlap))
+    return [round(n * (length - tile) / (count - 1)) for n in range(count)]
+
+
+def tile_boxes(height, width, tile, overlap):
+    '''
+    Return the (top, left, height, width) of the tiles of an image, row by row.
+    Tiles are square unless the image is smaller than a tile.
+    '''
+    tile_height, tile_width = min(tile, height), min(tile, width)
+    return [(top, left, tile_height, tile_width) for top in tile_starts(height, tile_height, overlap)
+            for left in tile_starts(width, tile_width, overlap)]
+
+
+def feather_weights(size, start, length, overlap):
+    '''
+    Return the blending weights along one side of a tile of size at start,
+    in an image of length: ramping over overlap px from each border that
+    isn't the border of the image.
+    '''
+    position = np.arange(size) + 0.5
+    weights = np.ones(size)
+    if start > 0:
+        weights = np.minimum(weights, position / overlap)
+    if start + size < length:
+        weights = np.minimum(weights, (size - position) / overlap)
+    return weights
+
+
+def blend_tiles(boxes, images, height, width, overlap):
+    '''
+    Return the weighted mean of the [1, h, w, 3] tile images placed at their
+    boxes, see the module documentation.
+    '''
+    total = np.zeros((1, height, width, 3))
+    weight_sum = np.zeros((1, height, width, 1))
+    for (top, left, tile_height, tile_width), image in zip(boxes, images):
+        weights = np.outer(feather_weights(tile_height, top, height, overlap),
+                           feather_weights(tile_width, left, width, overlap))[np.newaxis, :, :, np.newaxis]
+        total[:, top:top + tile_height, left:left + tile_width] += weights * image
+        weight_sum[:, top:top + tile_height, left:left + tile_width] += weights
+    return (total / weight_sum).astype(np.float32)
+
+
+def init_process(vgg_weights, height, width, args, threads):
+    '''
+    Pool initializer: builds the graph of the tile size for the tasks of this process.
+    '''
+    config = thread_tuning.session_config(threads, args.inter_op_threads)
+    if args.engine == 'tf2':
+        import tf2_engine
+        tf2_engine.enable(config)
+        _process['sess'] = None
+        _process['graph'] = tf2_engine.build_style_transfer_function(vgg_weights, height, width, args.style_layers,
+                                                                     args.content_layers, args.precision,
+                                                                     jit_compile=not args.no_xla)
+        return
+    graph = StyleTransfer.build_style_transfer_graph(vgg_weights, height, width, args.style_layers,
+                                                     args.content_layers, precision=args.precision)
+    _process['sess'] = tf.Session(config=config)
+    _process['sess'].run(tf.global_variables_initializer())
+    _process['graph'] = graph
+
+
+def weights_id():
+    return _process['graph']['weights_id']
+
+
+def tile_grams(style_tile):
+    '''
+    Return the gram matrices of one tile of the style image.
+    '''
+    return StyleTransfer.compute_style_grams(_process['sess'], _process['graph'], style_tile)
+
+
+class TileSnapshots:
+    """
+    The snapshot writer of a tile, which has none: only the blended image
+    is saved.
+    """
+
+    def due(self, it):
+        return False
+
+    def put(self, number, image, final=False, on_written=None):
+        return None
+
+
+def optimize_tile(content_image, dist_template, style_grams, args):
+    '''
+    Optimize one tile, from its content image and slice of the distance
+    template, and return the image it reaches.
+    '''
+    sess, graph = _process['sess'], _process['graph']
+    content_targets = StyleTransfer.compute_content_targets(sess, graph, content_image, dist_template)
+    StyleTransfer.run_style_transfer(sess, graph, content_targets, style_grams, args, TileSnapshots())
+    return StyleTransfer.optimizer_steps(sess, graph).image()
+
+
+def load_style_grams(pool, style_path, height, width, tile_height, tile_width, args):
+    '''
+    Return the style targets of every tile, the gram matrices of the tiles
+    of the style image averaged, from the style cache when it has them.
+    '''
+    rows, columns = max(1, round(height / tile_height)), max(1, round(width / tile_width))
+    cache = StyleTransfer.open_style_cache(args)
+    if cache is not None:
+        key = target_cache.make_key(kind='tiled_style_grams', style=target_cache.file_hash(style_path),
+                                    height=rows * tile_height, width=columns * tile_width,
+                                    tile=[tile_height, tile_width], layers=args.style_layers,
+                                    invert=StyleTransfer.style_invert, weights=pool.apply(weights_id),
+                                    precision=args.precision)
+        style_grams = cache.get(key)
+        if style_grams is not None:
+            return style_grams
+
+    style_image = utility.load_image(style_path, rows * tile_height, columns * tile_width,
+                                     invert=StyleTransfer.style_invert)
+    tiles = [style_image[:, row * tile_height:(row + 1) * tile_height, column * tile_width:(column + 1) * tile_width]
+             for row in range(rows) for column in range(columns)]
+    grams = pool.map(tile_grams, tiles)
+    style_grams = {layer_name: np.mean([gram[layer_name] for gram in grams], axis=0) for layer_name in grams[0]}
+    if cache is not None:
+        cache.put(key, style_grams)
+    return style_grams
+
+
+def run_tiled(vgg_weights, content_path, style_path, height, width, args, output_dir):
+    '''
+    Run a style transfer job in tiles, see the module documentation.
+    vgg_weights is the path of the weights, or the weights themselves.
+    Returns the file name of the final image, numbered args.epoch.
+    '''
+    boxes = tile_boxes(height, width, args.tile, args.tile_overlap)
+    tile_height, tile_width = boxes[0][2:]
+    cpu_count = thread_tuning.available_cpus()
+    processes = min(args.tile_processes or cpu_count, len(boxes))
+    threads = args.intra_op_threads or max(1, cpu_count // processes)
+    print("%d tiles of %dx%d, %d processes with %d threads each"
+          % (len(boxes), tile_width, tile_height, processes, threads))
+
+    content_image = utility.load_image(content_path, height, width, invert=StyleTransfer.content_invert)
+    dist_template = StyleTransfer.content_dist_template(content_image)
+    # Tiles have no checkpoints of their own.
+    tile_args = argparse.Namespace(**vars(args))
+    tile_args.checkpoint_every = 0
+
+    # Spawn, so the pool processes start without the TensorFlow state of this one.
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes, init_process, (vgg_weights, tile_height, tile_width, args, threads)) as pool:
+        style_grams = load_style_grams(pool, style_path, height, width, tile_height, tile_width, args)
+        results = [pool.apply_async(optimize_tile, (content_image[:, top:top + box_height, left:left + box_width],
+                                                    dist_template[top:top + box_height, left:left + box_width],
+                                                    style_grams, tile_args))
+                   for top, left, box_height, box_width in boxes]
+        images = []
+        for result in results:
+            images.append(result.get())
+            print("Tile %d of %d done" % (len(images), len(boxes)))
+
+    image = blend_tiles(boxes, images, height, width, args.tile_overlap)
+    return StyleTransfer.save_final_image(image, args, output_dir)
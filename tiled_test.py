@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+import tiled
+
+
+class TiledTestCase(unittest.TestCase):
+
+    def test_tiles_cover_the_image_with_overlap(self):
+        for length in (100, 512, 513, 1500, 3001):
+            starts = tiled.tile_starts(length, 512, 64)
+            self.assertEqual(0, starts[0])
+            self.assertEqual(max(0, length - 512), starts[-1])
+            for previous, start in zip(starts, starts[1:]):
+                self.assertGreaterEqual(previous + 512 - start, 64)
+        boxes = tiled.tile_boxes(300, 1000, 512, 64)
+        self.assertEqual([(0, 0, 300, 512), (0, 244, 300, 512), (0, 488, 300, 512)], boxes)
+
+    def test_blending_keeps_agreeing_tiles(self):
+        height, width = 70, 150
+        image = np.random.RandomState(0).rand(1, height, width, 3).astype(np.float32)
+        boxes = tiled.tile_boxes(height, width, 64, 16)
+        tiles = [image[:, top:top + h, left:left + w] for top, left, h, w in boxes]
+        np.testing.assert_allclose(image, tiled.blend_tiles(boxes, tiles, height, width, 16), rtol=1e-5)
+
+    def test_blending_feathers_seams(self):
+        boxes = tiled.tile_boxes(8, 100, 60, 20)
+        tiles = [np.zeros((1, 8, 60, 3)), np.ones((1, 8, 60, 3))]
+        row = tiled.blend_tiles(boxes, tiles, 8, 100, 20)[0, 0, :, 0]
+        self.assertEqual(0, row[0])
+        self.assertEqual(1, row[-1])
+        # Rises through the overlap in small steps rather than one jump.
+        self.assertTrue(np.all(np.diff(row) >= 0))
+        self.assertLess(np.max(np.diff(row)), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
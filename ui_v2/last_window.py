@@ -6,13 +6,23 @@
 #
 # WARNING: Any manual changes made to this file will be lost when pyuic5 is
 # run again.  Do not edit this file unless you know what you are doing.
-import glob
 import os
+import sys
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets, QtNetwork
 from PyQt5.QtCore import QProcess
 from PyQt5.QtGui import QIntValidator
 
+# The repository the UI is in, for its worker_client.py and StyleTransfer.py. Appended, as
+# its model.py and StyleTransfer.py would hide the ones of the UI.
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(REPOSITORY)
+
+import worker_client
+
+# Run when no style worker is.
+STYLE_TRANSFER_SCRIPT = os.path.join(REPOSITORY, 'StyleTransfer.py')
+
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow, content_image, style_image):
@@ -73,6 +83,9 @@ class Ui_MainWindow(object):
         self.generated_logo.setScaledContents(True)
         # self.generated_logo.setPixmap(QtGui.QPixmap(os.path.join(self.content_image)))
         self.p = None
+        # The latest image of the style transfer, from its events.
+        self.latest_image = None
+        self.worker_jobs = []
         self.content_filename = (self.content_image.split("/")[-1])[:-4]
         self.style_filename = (self.style_image.split("/")[-1])[:-4]
 
@@ -108,14 +121,12 @@ class Ui_MainWindow(object):
 
     def process_crop_finished(self):
         self.message("Process finished.")
-        list_of_files = glob.glob('output/cropped_images/*')  # * means all if need specific format then *.csv
-        try:
-            self.content_image = max(list_of_files, key=os.path.getmtime)
+        cropped_image = 'output/cropped_images/' + self.content_filename + ".png"
+        if os.path.exists(cropped_image):
+            self.content_image = cropped_image
             print(self.content_image)
             self.generated_logo.setScaledContents(True)
-            self.generated_logo.setPixmap(QtGui.QPixmap(os.path.join(self.content_image)))
-        except Exception as e:
-            print(e)
+            self.generated_logo.setPixmap(QtGui.QPixmap(self.content_image))
         self.p = None
         self.start_process()
 
@@ -123,17 +134,22 @@ class Ui_MainWindow(object):
         self.plainTextEdit.appendPlainText(s)
 
     def start_process(self, combine=False):
-        if self.p is None and not combine:
+        if self.p is None and not combine and worker_client.worker_available():
+            self.start_worker_job()
+        elif self.p is None and not combine:
             self.message("Style transferring")
             self.p = QProcess()
-            self.p.readyReadStandardOutput.connect(self.handle_stdout)
+            # The events come on stdout, one JSON object per line, and the printed output on stderr.
+            self.p.readyReadStandardOutput.connect(self.handle_process_events)
             self.p.readyReadStandardError.connect(self.handle_stderr)
             self.p.stateChanged.connect(self.handle_state)
             self.p.finished.connect(self.process_finished)
             self.p.setProgram("python")
             print(self.style_image)
+            # Absolute, as StyleTransfer.py would look for relative paths under input/.
             self.p.setArguments(
-                ["StyleTransfer.py", '--CONTENT_IMAGE', self.content_image, '--STYLE_IMAGE', self.style_image])
+                [STYLE_TRANSFER_SCRIPT, '--CONTENT_IMAGE', os.path.abspath(self.content_image),
+                 '--STYLE_IMAGE', os.path.abspath(self.style_image), '--progress', '-'])
             self.p.start()
         elif combine:
             self.message("Combining logo and text")
@@ -142,14 +158,80 @@ class Ui_MainWindow(object):
             self.p.readyReadStandardError.connect(self.handle_stderr)
             self.p.stateChanged.connect(self.handle_state)
             self.p.finished.connect(lambda: self.process_finished(combine=True))
-            list_of_files = glob.glob(
-                'output/' + self.content_filename + "_vs_" + self.style_filename + "/*")
-            latest_file = max(list_of_files, key=os.path.getmtime)
             self.p.setProgram("python")
             self.p.setArguments(
-                ["image_and_type.py", '--image', os.path.join(latest_file), '--text', self.lineEdit.text()])
+                ["image_and_type.py", '--image', self.latest_image, '--text', self.lineEdit.text(),
+                 '--saveto', self.logo_filename()])
             self.p.start()
 
+    def start_worker_job(self):
+        # A style_worker.py is running, so send it the job instead of starting StyleTransfer.py
+        self.message("Style transferring on the style worker")
+        job = {
+            'CONTENT_IMAGE': os.path.abspath(self.content_image),
+            'STYLE_IMAGE': os.path.abspath(self.style_image),
+            'output_dir': os.path.abspath('output/' + self.content_filename + "_vs_" + self.style_filename),
+        }
+        # A one pass preview with the AdaIN decoder first, if the worker has one, then the full optimization.
+        self.worker_jobs = [dict(job, preview=True), job]
+        self.p = QtNetwork.QTcpSocket()
+        self.p.connected.connect(self.send_worker_jobs)
+        self.p.readyRead.connect(self.handle_worker_events)
+        self.p.connectToHost(worker_client.DEFAULT_HOST, worker_client.DEFAULT_PORT)
+
+    def send_worker_jobs(self):
+        for job in self.worker_jobs:
+            self.p.write(worker_client.encode_line(job))
+
+    def logo_filename(self):
+        # image_and_type.py saves it under logos/.
+        return self.content_filename + "_vs_" + self.style_filename + ".jpg"
+
+    def handle_worker_events(self):
+        while self.p is not None and self.p.canReadLine():
+            event = worker_client.decode_line(bytes(self.p.readLine()))
+            if self.handle_event(event):
+                self.worker_job_finished()
+
+    def handle_process_events(self):
+        # The process finishes on its own after its done event.
+        while self.p is not None and self.p.canReadLine():
+            self.handle_event(worker_client.decode_line(bytes(self.p.readLine())))
+
+    def handle_event(self, event):
+        # Shows an event of the style worker or of StyleTransfer.py --progress, returns whether it ends the job.
+        if event['event'] == 'progress':
+            if event['iterations_per_second'] is not None:
+                self.statusbar.showMessage("Iteration %d of %d, %.1f iterations per second, %d seconds left" % (
+                    event['iteration'], event['total_iterations'], event['iterations_per_second'],
+                    event['eta_seconds']))
+        elif event['event'] == 'snapshot':
+            self.message("Iteration %d, total loss %g" % (event['iteration'], event['total_loss']))
+            self.show_image(event['image'])
+        elif event['event'] == 'done':
+            # Style networks and previews send no snapshots, only the image when they are done.
+            if event['image'] is not None:
+                self.show_image(event['image'])
+            return True
+        elif event['event'] == 'error':
+            if self.worker_jobs and self.worker_jobs[0].get('preview'):
+                self.message("No preview: " + event['message'])
+            else:
+                self.message("Style worker error: " + event['message'])
+            return True
+        return False
+
+    def show_image(self, filename):
+        self.latest_image = filename
+        self.generated_logo.setScaledContents(True)
+        self.generated_logo.setPixmap(QtGui.QPixmap(filename))
+
+    def worker_job_finished(self):
+        self.worker_jobs.pop(0)
+        if not self.worker_jobs:
+            self.p.disconnectFromHost()
+            self.process_finished()
+
     def handle_stderr(self):
         data = self.p.readAllStandardError()
         stderr = bytes(data).decode("utf8")
@@ -159,18 +241,6 @@ class Ui_MainWindow(object):
     def handle_stdout(self):
         data = self.p.readAllStandardOutput()
         stdout = bytes(data).decode("utf8")
-        if "Saved image file shape" in stdout:
-            list_of_files = glob.glob(
-                'output/' + self.content_filename + "_vs_" + self.style_filename + "/*")  # * means all if need specific format then *.csv
-            try:
-                latest_file = max(list_of_files, key=os.path.getmtime)
-                print(latest_file)
-                self.generated_logo.setScaledContents(True)
-                self.generated_logo.setPixmap(QtGui.QPixmap(os.path.join(latest_file)))
-                print("yes")
-            except Exception as e:
-                print(e)
-
         self.message(stdout)
 
     def handle_state(self, state):
@@ -187,13 +257,10 @@ class Ui_MainWindow(object):
         self.combine_button.setEnabled(True)
         # self.lineEdit.setReadOnly(False)
         if combine:
-            list_of_files = glob.glob('logos/*')  # * means all if need specific format then *.csv
-            try:
-                self.logo = max(list_of_files, key=os.path.getmtime)
+            self.logo = os.path.join('logos', self.logo_filename())
+            if os.path.exists(self.logo):
                 self.generated_logo.setScaledContents(True)
-                self.generated_logo.setPixmap(QtGui.QPixmap(os.path.join(self.logo)))
-            except Exception as e:
-                print(e)
+                self.generated_logo.setPixmap(QtGui.QPixmap(self.logo))
         self.p = None
 
     def combine_logo_text(self):
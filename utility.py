@@ -1,9 +1,16 @@
 # This code is from https://github.com/gttugsuu/Constrained-Neural-Style-Transfer-for-Decorated-Logo-Generation/
 # See cnst_LICENSE.txt and cnst_README.txt
 
+import logging
+
 import numpy as np
 import cv2
 
+logger = logging.getLogger(__name__)
+
+# Mean subtracted from the images for VGG-Net, and added back to save them.
+VGG_MEAN = np.array([123.68, 116.779, 103.939]).reshape((1,1,1,3))
+
 
 # Returns numpy array of input image (with channels last)
 def load_image(path_to_img, height, width, invert):
@@ -15,31 +22,39 @@ def load_image(path_to_img, height, width, invert):
     if invert == 1:
         image = 255.0-image
     
-    # Resize image
-    image = cv2.resize(image, (height,width))
-    print("image resized to ", image.shape) 
+    # Resize image, cv2 takes the size as (width, height)
+    image = cv2.resize(image, (width,height))
+    logger.info("image resized to  %s", image.shape)
     
     # Add new axis
     image = image[np.newaxis,:,:,:]
-    print("Image file shape is: ", image.shape)
+    logger.info("Image file shape is:  %s", image.shape)
 
     image = np.array(image, dtype = "float32")
 
     # Subtract optimization for VGG-Net
-    image -= np.array([123.68, 116.779, 103.939]).reshape((1,1,1,3))
+    image -= VGG_MEAN
     # Return numpy array
     return image
 
+# Returns the height that keeps the aspect ratio of the image at path when it is resized to width
+def aspect_height(path_to_img, width):
+    image = cv2.imread(path_to_img, 1)
+    if image is None:
+        raise ValueError("cannot read image %r" % path_to_img)
+    return max(1, int(round(width * image.shape[0] / image.shape[1])))
+
+# Returns the uint8 pixels of an image held in the model input, with shape = (1, height, width, depth)
+def to_pixels(image, invert):
+    # Output should add back the mean, and get rid of the first useless dimension.
+    pixels = np.clip(image[0] + VGG_MEAN[0], 0, 255).astype('uint8')
+    if invert == 1:
+        pixels = 255-pixels
+    return pixels
+
 # Saves JPEG image, inputs numpy array with shape = (1, height, width, depth)
 def save_image(path,image, invert):
-    # Output should add back the mean.
-    image += np.array([123.68, 116.779, 103.939]).reshape((1,1,1,3))
-    # Get rid of the first useless dimension, what remains is the image.
-    image = image[0]
-    image = np.clip(image, 0, 255).astype('uint8')
-    print("Saved image file shape is: ", image.shape)
-    # Convert from numpy to image
-    if invert == 1:
-        image = 255-image
+    image = to_pixels(image, invert)
+    logger.info("Saved image file shape is:  %s", image.shape)
     # Save image
     cv2.imwrite(path,image)
\ No newline at end of file
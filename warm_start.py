@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+
+import checkpoint
+import target_cache
+
+'''
+Warm starts of StyleTransfer.py jobs from earlier runs with the same content
+and style images, so raising --epoch or nudging a loss weight continues from
+what was already computed instead of starting over from the content image.
+
+When a job finishes, its optimizer state (the final image, the Adam slots and
+the iteration it stopped at) is kept in the result cache of result_cache.py,
+next to the final images. Checkpoints hold the same state, and both are saved
+with a description of their job: a hash of the content and style files and
+the VGG weights, the job arguments but checkpoint.run_args(), and the
+number of pyramid levels. A new job looks through both for states of the same
+images and weights taken at the last pyramid level, and starts from the
+closest:
+
+ * A state of the same optimization, with the same checkpoint.job_hash, that
+   stopped before the new epoch is continued like a resumed checkpoint, with
+   its Adam slots, from the iteration after it.
+ * Otherwise the final image of the job with the fewest other arguments, the
+   longest run among those, is the initial image of the last pyramid level,
+   resized if the size changed, and the levels before it are skipped. The
+   Adam slots are left behind, as they were fitted to other losses; early
+   stopping ends the job once the new losses stop improving.
+'''
+
+
+def pair_key(content_path, style_path, weights_id):
+    '''
+    Return the hash of the content and style files and the VGG weights that
+    the states a job can start from share.
+    '''
+    return target_cache.make_key(kind='warm_start', content=target_cache.file_hash(content_path),
+                                 style=target_cache.file_hash(style_path), weights=weights_id)
+
+
+def job_fields(args):
+    '''
+    Return the arguments of a job that change its optimization, as they
+    read back from JSON.
+    '''
+    excluded = checkpoint.run_args()
+    fields = {name: value for name, value in vars(args).items() if name not in excluded}
+    return json.loads(json.dumps(fields))
+
+
+def state_metadata(pair, args, levels):
+    '''
+    Return the arrays describing a job that are saved with its states.
+    '''
+    return {'pair': np.array(pair), 'args': np.array(json.dumps(job_fields(args), sort_keys=True)),
+            'levels': np.array(levels)}
+
+
+def save_state(cache, job_hash, metadata, iteration, image, slots):
+    '''
+    Keep the final state of a job, at the last of its pyramid levels, in
+    cache, a ResultCache.
+    '''
+    arrays = {'slot_%d' % n: slot for n, slot in enumerate(slots)}
+    arrays.update(metadata)
+    cache.put(target_cache.make_key(kind='warm_start', job=job_hash, iteration=iteration),
+              dict(arrays, job_hash=job_hash, level=int(metadata['levels']) - 1, iteration=iteration, image=image))
+
+
+def read_state(path, pair):
+    '''
+    Return the state saved in a cache entry or checkpoint file as a dict with
+    'job_hash', 'args', 'iteration', 'image', 'slots' and 'source', or None if
+    it isn't a state of the pair taken at the last level of its job.
+    '''
+    try:
+        with np.load(path) as data:
+            if 'pair' not in data.files or str(data['pair']) != pair:
+                return None
+            if int(data['level']) != int(data['levels']) - 1:
+                return None
+            slot_count = len([name for name in data.files if name.startswith('slot_')])
+            return {'job_hash': str(data['job_hash']), 'args': json.loads(str(data['args'])),
+                    'iteration': int(data['iteration']), 'image': data['image'],
+                    'slots': [data['slot_%d' % n] for n in range(slot_count)], 'source': path}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def find_warm_start(cache, checkpoint_path, pair, job_hash, args):
+    '''
+    Return the state a job should start from, see the module documentation,
+    or None if no earlier run helps. cache is a ResultCache or None, and
+    checkpoint_path the checkpoint file of the job's output folder. The state
+    gets 'differences', the names of the arguments that differ from the job's.
+    '''
+    paths = [path for _, _, path in cache.entries()] if cache is not None else []
+    paths.append(checkpoint_path)
+    fields = job_fields(args)
+    best = best_rank = None
+    for path in paths:
+        state = read_state(path, pair)
+        if state is None:
+            continue
+        same = state['job_hash'] == job_hash
+        if same and state['iteration'] >= args.epoch:
+            # It ran past this job, whose result would be one of its snapshots.
+            continue
+        state['differences'] = sorted(name for name in set(fields) | set(state['args'])
+                                      if fields.get(name) != state['args'].get(name))
+        rank = (same, -len(state['differences']), state['iteration'])
+        if best is None or rank > best_rank:
+            best, best_rank = state, rank
+    return best
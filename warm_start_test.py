@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import StyleTransfer
+from result_cache import ResultCache
+import warm_start
+
+
+class WarmStartTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.cache = ResultCache(os.path.join(self.folder, 'results'), 2**24)
+        self.checkpoint_path = os.path.join(self.folder, 'checkpoint.npz')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def save(self, argv, iteration, pair='pair', job_hash=None):
+        args = StyleTransfer.parser.parse_args(argv)
+        image = np.full((1, 4, 4, 3), iteration, np.float32)
+        warm_start.save_state(self.cache, job_hash or ' '.join(argv), warm_start.state_metadata(pair, args, 1),
+                              iteration, image, [image * 2])
+
+    def find(self, argv, job_hash):
+        return warm_start.find_warm_start(self.cache, self.checkpoint_path, 'pair',
+                                          job_hash, StyleTransfer.parser.parse_args(argv))
+
+    def test_continues_the_same_job(self):
+        self.save(['--epoch', '100'], 100, job_hash='job')
+        self.save(['--epoch', '300', '--beta', '2'], 300)
+        state = self.find(['--epoch', '300'], 'job')
+        self.assertEqual(100, state['iteration'])
+        self.assertEqual([], state['differences'])
+        np.testing.assert_array_equal(np.full((1, 4, 4, 3), 200, np.float32), state['slots'][0])
+        # A longer run of the same job isn't continued backwards.
+        self.assertEqual(['beta'], self.find(['--epoch', '50'], 'job')['differences'])
+
+    def test_takes_the_closest_other_job(self):
+        self.save(['--epoch', '300', '--beta', '2'], 300)
+        self.save(['--epoch', '500', '--beta', '2', '--alpha', '1'], 500)
+        self.save(['--epoch', '900', '--beta', '3'], 900, pair='other images')
+        state = self.find(['--epoch', '300', '--beta', '3'], 'job')
+        self.assertEqual(['beta'], state['differences'])
+        self.assertEqual(300, state['iteration'])
+        self.assertIsNone(warm_start.find_warm_start(None, self.checkpoint_path, 'pair', 'job',
+                                                     StyleTransfer.parser.parse_args([])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import socket
+
+'''
+Submit style transfer jobs to a running style_worker.py.
+
+A job is a dict using the same names as the StyleTransfer.py arguments, for example:
+    {"CONTENT_IMAGE": "/abs/path/content.png", "STYLE_IMAGE": "/abs/path/style.jpg",
+     "IMAGE_WIDTH": 300, "alpha": 0.001, "beta": 0.8, "gamma": 0.001,
+     "w1": 1, "w2": 1, "w3": 1, "w4": 1, "w5": 1, "epoch": 5000,
+     "output_dir": "/abs/path/output/content_vs_style"}
+
+Paths are opened by the worker, so they should be absolute or relative to the
+folder the worker was started in. Missing keys use the StyleTransfer.py defaults,
+so without IMAGE_HEIGHT the image is square, or with "keep_aspect": true it keeps
+the aspect ratio of the content image. Values must have the types of the
+arguments, and those that set up the worker, like engine or the threads, are
+refused; see style_worker.WORKER_ARGS.
+With "preview": true the worker sends back a one pass image instead of optimizing,
+see adain.py.
+
+The worker answers with one JSON object per line:
+    {"event": "warm_start", "source": "...", "differences": ["beta"], "iterations_saved": 1001}
+    {"event": "progress", "iteration": 120, "total_iterations": 5001, "losses": {...},
+     "iterations_per_second": 9.5, "eta_seconds": 513.8, "image": "..."}
+    {"event": "snapshot", "iteration": 100, "image": "...", "total_loss": 12.5}
+    {"event": "done", "image": "...", "output_dir": "...", "seconds": 42.0}
+    {"event": "error", "message": "..."}
+
+Progress events are described in progress.py; StyleTransfer.py --progress
+writes the same events to a file or stdout.
+'''
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 6510
+
+
+def encode_line(message):
+    '''
+    Encode a job or event dict as one line of JSON.
+    '''
+    return (json.dumps(message) + '\n').encode('utf8')
+
+
+def decode_line(line):
+    '''
+    Decode one line of JSON sent between the worker and a client.
+    '''
+    return json.loads(line.decode('utf8'))
+
+
+def worker_available(host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=0.5):
+    '''
+    Return True if a worker is listening on host:port.
+    '''
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def submit_job(job, host=DEFAULT_HOST, port=DEFAULT_PORT, on_event=None):
+    '''
+    Send a job to the worker and wait for it to finish.
+
+    Args:
+        job (dict): The job, see above
+        host (str), port (int): Where the worker is listening
+        on_event (function): If given, called with every event dict the worker sends
+
+    Returns:
+        The final "done" or "error" event dict
+    '''
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(encode_line(job))
+        with sock.makefile('rb') as stream:
+            for line in stream:
+                event = decode_line(line)
+                if on_event is not None:
+                    on_event(event)
+                if event['event'] in ('done', 'error'):
+                    return event
+    return {'event': 'error', 'message': 'worker closed the connection'}